@@ -3,7 +3,7 @@ import logging
 import yaml
 import json
 import os.path
-from . import amaxa, loader, state
+from . import amaxa, loader, state, describe_cache
 
 def main():
     a = argparse.ArgumentParser()
@@ -12,6 +12,37 @@ def main():
     a.add_argument('-c', '--credentials', required=True, dest='credentials', type=argparse.FileType('r'))
     a.add_argument('-l', '--load', action='store_true')
     a.add_argument('-s', '--use-state', dest='use_state', type=argparse.FileType('r'))
+    a.add_argument('--overwrite-state', dest='overwrite_state', action='store_true',
+                   help='When loading, start over even if the state journal of an unfinished load exists.')
+    a.add_argument('--explain', action='store_true',
+                   help='Estimate the records, API calls, and Bulk API batches each step of an extraction '
+                        'will use, without extracting anything.')
+    a.add_argument('--id-map-memory', dest='id_map_memory', type=int,
+                   help='Memory budget, in megabytes, for the map of loaded record Ids. '
+                        'Larger maps are moved to disk.')
+    a.add_argument('--id-map-file', dest='id_map_file',
+                   help='File in which to store the map of loaded record Ids once it exceeds '
+                        'its memory budget. Defaults to a temporary file.')
+    a.add_argument('--describe-cache', dest='describe_cache',
+                   help='Directory in which to cache describe results between runs.')
+    a.add_argument('--describe-cache-ttl', dest='describe_cache_ttl', type=float, default=24,
+                   help='Hours for which cached describe results are used without revalidation.')
+    a.add_argument('-p', '--parallelism', dest='parallelism', type=int,
+                   help='Number of concurrent queries and Bulk API result downloads.')
+    a.add_argument('--parallel-steps', dest='parallel_steps', type=int,
+                   help='When extracting, the number of sObjects with no lookups between them '
+                        'to extract at the same time.')
+    a.add_argument('--pipeline', action='store_true',
+                   help='When extracting, fetch, parse, and write records on separate threads, '
+                        'and log the throughput of each stage.')
+    a.add_argument('--bulk-id-threshold', dest='bulk_id_threshold', type=int,
+                   help='Number of Ids at which extraction queries records by Id using the Bulk API '
+                        'instead of the REST API.')
+    a.add_argument('--stream', action='store_true',
+                   help='When loading, post each batch of records as soon as it is read, '
+                        'rather than reading and validating each input file first.')
+    a.add_argument('--bulk-format', dest='bulk_format', choices=['JSON', 'CSV'], default='JSON',
+                   help='When loading, the format in which records are sent to the Bulk API.')
     verbosity_levels = {'quiet': logging.NOTSET, 'errors': logging.ERROR,
                         'normal': logging.INFO, 'verbose': logging.DEBUG}
 
@@ -22,6 +53,23 @@ def main():
 
     args = a.parse_args()
 
+    if args.explain and args.load:
+        print('--explain is supported only for extractions.')
+        return -1
+
+    journal_path = None
+    resume_journal = False
+    if args.load:
+        # Journal the operation's progress so that it can be resumed after a failure.
+        # A journal left by an unfinished load is only replaced if we're told to.
+        journal_path = os.path.splitext(args.config.name)[0] + '.state.journal'
+        resume_journal = args.use_state is not None and os.path.abspath(args.use_state.name) == os.path.abspath(journal_path)
+        if not resume_journal and not args.overwrite_state \
+                and os.path.exists(journal_path) and os.path.getsize(journal_path) > 0:
+            print('The state journal {} of an unfinished load exists. Use --use-state {} to resume that load, '
+                  'or --overwrite-state to start over.'.format(journal_path, journal_path))
+            return -1
+
     logging.getLogger('amaxa').setLevel(verbosity_levels[args.verbosity])
     logging.getLogger('amaxa').handlers[:] = [logging.StreamHandler()]
 
@@ -40,6 +88,30 @@ def main():
         print('The supplied credentials were not valid: {}'.format('\n'.join(errors)))
         return -1
 
+    if args.describe_cache is not None:
+        context.describe_cache = describe_cache.DescribeCache(args.describe_cache, args.describe_cache_ttl * 60 * 60)
+
+    if args.parallelism is not None:
+        context.query_parallelism = args.parallelism
+        if not args.load:
+            context.download_parallelism = args.parallelism
+
+    if args.bulk_id_threshold is not None and not args.load:
+        context.bulk_id_threshold = args.bulk_id_threshold
+
+    if args.pipeline and not args.load:
+        context.pipeline = True
+
+    if args.parallel_steps is not None and not args.load:
+        context.step_parallelism = args.parallel_steps
+
+    if args.load:
+        if args.id_map_memory is not None:
+            context.id_map_budget = args.id_map_memory * 1024 * 1024
+        context.id_map_path = args.id_map_file
+        context.streaming = args.stream
+        context.content_type = args.bulk_format
+
     if args.config.name.endswith('json'):
         config = json.load(args.config)
     else:
@@ -47,25 +119,81 @@ def main():
 
     if args.load:
         (ex, errors) = loader.load_load_operation(config, context, args.use_state is not None)
+    elif args.explain:
+        (ex, errors) = loader.load_extraction_operation(config, context, open_files=False)
     else:
         (ex, errors) = loader.load_extraction_operation(config, context)
 
     if args.use_state is not None:
         (ex, errors) = state.load_state(ex, args.use_state)
+        args.use_state.close()
+
+    if ex is not None and args.explain:
+        return explain(ex)
 
     if ex is not None:
+        if journal_path is not None:
+            ex.journal = state.open_journal(ex, journal_path, append=resume_journal)
+
         ret = ex.run()
 
-        if ret != 0 and len(ex.global_id_map) > 0:
-            # Save the operation state.
-            state_file = open(
-                os.path.splitext(args.config.name)[0] + '.state' + ('.json' if args.config.name.endswith('json') else '.yaml'),
-                'w'
-            )
-            state_file.write(state.save_state(ex, args.config.name.endswith('json')))
+        if journal_path is not None:
+            ex.journal.close()
+            if ret == 0:
+                os.remove(journal_path)
+            else:
+                print('The operation\'s state was saved to {}. Use --use-state {} to resume.'.format(journal_path, journal_path))
+
         return ret
     else:
         print('Unable to execute operation due to the following errors:\n {}'.format('\n'.join(errors)))
         return -1
 
-    return 0
\ No newline at end of file
+    return 0
+
+def explain(ex):
+    try:
+        plans = ex.explain()
+    except Exception as e:
+        print('Unable to explain operation: {}'.format(e))
+        return -1
+
+    def estimate(value):
+        return '{:,}'.format(value) if value is not None else '?'
+
+    row = '{:<30} {:<10} {:>12} {:>12} {:>12}  {}'
+    print(row.format('sObject', 'Scope', 'Records', 'REST calls', 'Bulk batches', 'Method'))
+    for plan in plans:
+        print(row.format(
+            plan['sobject'],
+            plan['scope'],
+            estimate(plan['records']),
+            estimate(plan['rest_calls']),
+            estimate(plan['bulk_batches']),
+            '; '.join(plan['methods'])
+        ))
+
+    totals = {}
+    for key in ['records', 'rest_calls', 'bulk_batches']:
+        values = [plan[key] for plan in plans]
+        totals[key] = sum(values) if None not in values else None
+    print(row.format('Total', '', estimate(totals['records']), estimate(totals['rest_calls']), estimate(totals['bulk_batches']), ''))
+    print('Dependencies and self-lookups are resolved as records are extracted, and may use additional calls.')
+
+    try:
+        limits = ex.get_api_limits()
+    except Exception:
+        limits = None
+
+    if limits is not None:
+        for (key, label) in [('rest_calls', 'API requests'), ('bulk_batches', 'Bulk API batches')]:
+            (maximum, remaining) = limits[key]
+            if maximum is not None and remaining is not None:
+                print('{}: {:,} of {:,} remaining today; this operation will use {}.'.format(
+                    label,
+                    remaining,
+                    maximum,
+                    'at least ' + estimate(totals[key]) if totals[key] is not None else 'an unknown number'
+                ))
+
+    return 0
@@ -1,15 +1,35 @@
+import bisect
+import codecs
+import concurrent.futures
+import collections.abc
 import functools
+import heapq
 import simple_salesforce
 import logging
 import json
+import math
+import operator
 import salesforce_bulk
+import requests
 import itertools
 import csv
+import io
+import os
+import queue
+import sqlite3
+import struct
+import tempfile
+import threading
 from . import constants
 from enum import Enum, unique
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
-from time import sleep
+from urllib.parse import urlparse, quote_plus
+from time import sleep, monotonic
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 @unique
@@ -47,35 +67,90 @@ class FileType(Enum):
     RESULT = 3
     STATE = 4
 
+# Salesforce's default chunk size for PK chunked Bulk API queries.
+DEFAULT_PK_CHUNK_SIZE = 100000
+# Number of Ids, several hundred REST API queries' worth, at which Id passes switch to the Bulk API.
+DEFAULT_BULK_ID_THRESHOLD = 50000
+# Salesforce's limits on the length of a SOQL WHERE clause and of a REST API request URL.
+MAX_WHERE_LENGTH = 4000
+MAX_URL_LENGTH = 16384
+# Salesforce's limits on the records in a Bulk API batch and on the size of its payload.
+# The payload limit is 10,000,000 characters; a payload within it in bytes is within it in characters.
+MAX_BATCH_RECORDS = 10000
+MAX_BATCH_BYTES = 10000000
+# Stands in for the Ids of records that aren't known when explaining an operation.
+EXPLAIN_PLACEHOLDER_ID = '000000000000000AAA'
+
 class AmaxaException(Exception):
     pass
 
+
+# The 15 -> 18 character checksum encodes, for each 5-character chunk of the Id,
+# which characters are upper case as a 5-bit number (least significant bit first).
+# We translate an Id into a bytestring of b'0' and b'1' (upper case) characters
+# and look up the whole 3-character suffix in a table of all 2^15 case patterns.
+_CASE_BITS = bytes(ord('1') if ord('A') <= c <= ord('Z') else ord('0') for c in range(256))
+_CHECKSUM_TABLE = {
+    format(n, '015b')[::-1].encode('ascii'): ''.join(
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'[(n >> shift) & 31] for shift in (0, 5, 10)
+    )
+    for n in range(1 << 15)
+}
+
+def _checksum(idstr):
+    try:
+        return _CHECKSUM_TABLE[idstr.encode('utf-8').translate(_CASE_BITS)]
+    except KeyError:
+        raise ValueError('Salesforce Ids must contain only ASCII characters.')
+
 class SalesforceId(object):
+    __slots__ = ('id',)
+
     def __init__(self, idstr):
         if isinstance(idstr, SalesforceId):
             self.id = idstr.id
         else:
+            self.id = SalesforceId._normalize(idstr)
+
+    @staticmethod
+    def _normalize(idstr):
+        if len(idstr) != 18 or not idstr.isalnum():
             idstr = idstr.strip()
-            if len(idstr) == 15:
-                suffix = ''
-                for i in range(0, 3):
-                    baseTwo = 0
-                    for j in range (0, 5):
-                        character = idstr[i*5+j]
-                        if character >= 'A' and character <= 'Z':
-                            baseTwo += 1 << j
-                    suffix += 'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'[baseTwo]
-                self.id = idstr + suffix
-            elif len(idstr) == 18:
-                self.id = idstr
-            else:
-                raise ValueError('Salesforce Ids must be 15 or 18 characters.')
+
+        if len(idstr) == 18:
+            return idstr
+        elif len(idstr) == 15:
+            return idstr + _checksum(idstr)
+
+        raise ValueError('Salesforce Ids must be 15 or 18 characters.')
+
+    @classmethod
+    def from_iterable(cls, values):
+        # Batch constructor for a whole column of Ids (strings or SalesforceIds),
+        # which skips the per-object __init__ dispatch.
+        normalize = cls._normalize
+        new = object.__new__
+        ids = []
+        append = ids.append
+
+        for value in values:
+            sf_id = new(cls)
+            sf_id.id = value.id if isinstance(value, SalesforceId) else normalize(value)
+            append(sf_id)
+
+        return ids
 
     def __eq__(self, other):
         if isinstance(other, SalesforceId):
             return self.id == other.id
         elif isinstance(other, str):
-            return self.id == SalesforceId(other).id
+            if len(other) == 18:
+                return self.id == other
+            elif len(other) == 15:
+                # The checksum is derived entirely from the first 15 characters.
+                return self.id.startswith(other)
+
+            return self.id == SalesforceId._normalize(other)
 
         return False
 
@@ -88,18 +163,1083 @@ class SalesforceId(object):
     def __repr__(self):
         return self.id
 
-def JSONIterator(records):
-    def enc(r):
-        return json.dumps(r).encode('utf-8')
 
-    yield b'['
+def _pack_id(value):
+    return (value.id if isinstance(value, SalesforceId) else SalesforceId._normalize(value)).encode('ascii')
+
+def _unpack_id(packed):
+    sf_id = object.__new__(SalesforceId)
+    sf_id.id = packed.decode('ascii')
+    return sf_id
+
+class _PackedIdArray(object):
+    # A sorted array of 18-character Ids, each stored as 18 bytes in a single bytearray.
+    # Every BLOCK_SIZE-th key is kept in a list of "fences" so that a lookup is a
+    # C-level bisection of the fences followed by a search of one small block.
+    WIDTH = 18
+    BLOCK_SIZE = 64
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.keys = bytearray()
+        self.fences = []
+        self.BLOCK_SIZE = block_size
+
+    def __len__(self):
+        return len(self.keys) // self.WIDTH
+
+    def key_at(self, i):
+        return bytes(self.keys[i * self.WIDTH:(i + 1) * self.WIDTH])
+
+    def find(self, key):
+        # Return the index of key, or -1.
+        block = bisect.bisect_right(self.fences, key) - 1
+        if block < 0:
+            return -1
+
+        start = block * self.BLOCK_SIZE * self.WIDTH
+        end = min(start + self.BLOCK_SIZE * self.WIDTH, len(self.keys))
+        pos = self.keys.find(key, start, end)
+
+        # Keys are fixed-width, so only accept aligned matches.
+        while pos >= 0 and pos % self.WIDTH != 0:
+            pos = self.keys.find(key, pos + 1, end)
+
+        return pos // self.WIDTH if pos >= 0 else -1
+
+    def insertion_point(self, key):
+        block = bisect.bisect_right(self.fences, key) - 1
+        if block < 0:
+            return 0
+
+        w = self.WIDTH
+        keys = self.keys
+        lo = block * self.BLOCK_SIZE
+        hi = min(lo + self.BLOCK_SIZE, len(keys) // w)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # Compare the slice directly, without copying it to bytes as key_at() does.
+            if keys[mid * w:mid * w + w] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def merge(self, new_keys, *parallel):
+        # Merge the sorted list `new_keys`, none of which are present in the array,
+        # into the array. `parallel` holds pairs of (bytearray, list of values)
+        # that are kept in the same order as the keys.
+        w = self.WIDTH
+        merged_keys = bytearray()
+        merged_parallel = [bytearray() for p in parallel]
+        prev = 0
+
+        for (i, key) in enumerate(new_keys):
+            pos = self.insertion_point(key)
+            merged_keys += self.keys[prev * w:pos * w]
+            merged_keys += key
+            for (target, (source, values)) in zip(merged_parallel, parallel):
+                target += source[prev * w:pos * w]
+                target += values[i]
+            prev = pos
+
+        merged_keys += self.keys[prev * w:]
+        for (target, (source, values)) in zip(merged_parallel, parallel):
+            target += source[prev * w:]
+
+        self.keys = merged_keys
+        self.rebuild_fences()
+
+        return merged_parallel
+
+    def rebuild_fences(self):
+        w = self.WIDTH
+        self.fences = [
+            bytes(self.keys[i:i + w]) for i in range(0, len(self.keys), self.BLOCK_SIZE * w)
+        ]
+
+    def __iter__(self):
+        return self.iter_keys(self.keys)
+
+    @classmethod
+    def iter_keys(cls, keys):
+        w = cls.WIDTH
+        for i in range(0, len(keys), w):
+            yield bytes(keys[i:i + w])
+
+    @property
+    def nbytes(self):
+        return len(self.keys) + len(self.fences) * (self.WIDTH + 41)
+
+
+class IdMap(collections.abc.Mapping):
+    # A memory-compact mapping from Salesforce Id to Salesforce Id.
+    # Entries live in sorted, fixed-width byte arrays; new entries are absorbed
+    # by a small dict that is merged into the arrays when it grows past
+    # 1/16th of the arrays' size (or `overflow_limit`, whichever is greater).
+    # This deliberately trades lookup speed for memory: an entry takes about
+    # an eighth of the memory it would in a dict, but each lookup is a binary
+    # search rather than a hash probe, roughly half the speed of a dict.
+    def __init__(self, items=None, overflow_limit=65536):
+        self._keys = _PackedIdArray()
+        self._values = bytearray()
+        self._overflow = {}
+        self.overflow_limit = overflow_limit
+
+        if items is not None:
+            self.update(items.items() if hasattr(items, 'items') else items)
+
+    @staticmethod
+    def pack_run(pairs):
+        # Pack (old Id, new Id) pairs of 18-byte ASCII Ids into a run: a pair of
+        # bytestrings holding the sorted keys and their values. Where a key
+        # repeats, the last pair wins.
+        mapping = dict(pairs)
+        keys = sorted(mapping)
+        run = (b''.join(keys), b''.join([mapping[k] for k in keys]))
+        for packed in run:
+            if len(packed) != len(keys) * _PackedIdArray.WIDTH or (packed and not packed.isalnum()):
+                raise ValueError('Salesforce Ids must be 18 alphanumeric characters.')
+
+        return run
+
+    @classmethod
+    def from_runs(cls, runs):
+        # Bulk-build a map from runs produced by pack_run(), merging them in a
+        # single pass rather than inserting entries one by one. Where runs share
+        # a key, the later run wins.
+        w = _PackedIdArray.WIDTH
+        field = struct.Struct('{}s'.format(w))
+        runs = list(runs)
+        id_map = cls()
+
+        if len(runs) == 1:
+            id_map._keys.keys = bytearray(runs[0][0])
+            id_map._values = bytearray(runs[0][1])
+        elif len(runs) > 1:
+            keys = id_map._keys.keys
+            values = id_map._values
+            duplicates = []
+            last = None
+            merged = heapq.merge(*[
+                zip(field.iter_unpack(run_keys), field.iter_unpack(run_values))
+                for (run_keys, run_values) in runs
+            ])
+            for ((key,), (value,)) in merged:
+                if key == last:
+                    duplicates.append(key)
+                    continue
+
+                keys += key
+                values += value
+                last = key
+
+            id_map._keys.rebuild_fences()
+
+            # Keys repeated across runs take their value from the last run that has them.
+            for key in duplicates:
+                for (run_keys, run_values) in reversed(runs):
+                    pos = run_keys.find(key)
+                    while pos >= 0 and pos % w != 0:
+                        pos = run_keys.find(key, pos + 1)
+                    if pos >= 0:
+                        id_map._set(key, run_values[pos:pos + w])
+                        break
+
+            return id_map
+
+        id_map._keys.rebuild_fences()
+        return id_map
+
+    def _find(self, key):
+        i = self._keys.find(key)
+        if i >= 0:
+            return self._values[i * _PackedIdArray.WIDTH:(i + 1) * _PackedIdArray.WIDTH]
+
+        return None
+
+    def _set(self, key, value):
+        if key not in self._overflow:
+            i = self._keys.find(key)
+            if i >= 0:
+                self._values[i * _PackedIdArray.WIDTH:(i + 1) * _PackedIdArray.WIDTH] = value
+                return
+
+        self._overflow[key] = value
+
+    def _check_overflow(self):
+        if len(self._overflow) >= max(self.overflow_limit, len(self._keys) // 16):
+            self.compact()
+
+    def compact(self):
+        if not self._overflow:
+            return
+
+        new_keys = sorted(self._overflow)
+        (self._values,) = self._keys.merge(
+            new_keys,
+            (self._values, [self._overflow[k] for k in new_keys])
+        )
+        self._overflow = {}
+
+    def __setitem__(self, old_id, new_id):
+        self._set(_pack_id(old_id), _pack_id(new_id))
+        self._check_overflow()
+
+    def __getitem__(self, old_id):
+        value = self.get(old_id)
+        if value is None:
+            raise KeyError(old_id)
+
+        return value
+
+    def get(self, old_id, default=None):
+        key = _pack_id(old_id)
+        value = self._overflow.get(key)
+        if value is None:
+            value = self._find(key)
+
+        return _unpack_id(value) if value is not None else default
+
+    def update(self, items):
+        for (old_id, new_id) in items:
+            self._set(_pack_id(old_id), _pack_id(new_id))
+            if len(self._overflow) >= self.overflow_limit:
+                self._check_overflow()
+
+    def get_many(self, old_ids):
+        overflow = self._overflow
+        results = []
+        for old_id in old_ids:
+            key = _pack_id(old_id)
+            value = overflow.get(key)
+            if value is None:
+                value = self._find(key)
+            results.append(_unpack_id(value) if value is not None else None)
+
+        return results
+
+    def __contains__(self, old_id):
+        key = _pack_id(old_id)
+        return key in self._overflow or self._keys.find(key) >= 0
+
+    def __len__(self):
+        return len(self._keys) + len(self._overflow)
+
+    def __iter__(self):
+        for key in self._keys:
+            yield _unpack_id(key)
+        for key in list(self._overflow):
+            yield _unpack_id(key)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        w = _PackedIdArray.WIDTH
+        for (i, key) in enumerate(self._keys):
+            yield (_unpack_id(key), _unpack_id(self._values[i * w:(i + 1) * w]))
+        for (key, value) in list(self._overflow.items()):
+            yield (_unpack_id(key), _unpack_id(value))
+
+    @property
+    def nbytes(self):
+        # Approximate memory footprint. Each overflow entry holds two bytes objects
+        # and a dict slot.
+        return self._keys.nbytes + len(self._values) + len(self._overflow) * 150
+
+    def prefetch(self, old_ids):
+        # Everything is resident; nothing to do.
+        pass
+
+    def close(self):
+        pass
+
+
+class IdSet(collections.abc.MutableSet):
+    # A memory-compact set of Salesforce Ids. Ids live in a sorted, fixed-width byte array,
+    # like IdMap's keys; Ids added or removed since the last compaction are held in two plain
+    # sets, which are checked first. ExtractOperation compacts each sObject's set when its step
+    # finishes, so a step adds and tests its Ids at the speed of a set; the pending sets are only
+    # folded in automatically when they grow past both `overflow_limit` and 1/8th of the array,
+    # to bound memory in very large steps. Unions, differences and copies of
+    # IdSets work directly on the arrays, without creating an object per Id.
+    # Membership tests dominate, so the array keeps more fences than IdMap's.
+    # Only writes change the set. Reads fold pending changes into a new array of their own,
+    # and a compacted array is published with a single assignment, so a set that's no longer
+    # being written can be read by any number of threads.
+    BLOCK_SIZE = 16
+
+    def __init__(self, ids=None, overflow_limit=1000000):
+        self._keys = _PackedIdArray(self.BLOCK_SIZE)
+        self._added = set()
+        self._removed = set()
+        self.overflow_limit = overflow_limit
+
+        if ids is not None:
+            self |= ids
+
+    @classmethod
+    def _from_iterable(cls, ids):
+        return cls(ids)
+
+    def _from_keys(self, keys):
+        # A new IdSet holding the sorted bytearray `keys`.
+        id_set = type(self)(overflow_limit=self.overflow_limit)
+        id_set._keys = id_set._new_array(keys)
+        return id_set
+
+    def _new_array(self, keys):
+        array = _PackedIdArray(self.BLOCK_SIZE)
+        array.keys = keys
+        array.rebuild_fences()
+        return array
+
+    def _contains_key(self, key):
+        if key in self._added:
+            return True
+
+        return key not in self._removed and self._keys.find(key) >= 0
+
+    def __contains__(self, sf_id):
+        # Like a set of Ids, an IdSet contains no None, empty or otherwise invalid values.
+        try:
+            key = sf_id.id.encode('ascii') if type(sf_id) is SalesforceId else _pack_id(sf_id)
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+        if key in self._added:
+            return True
+
+        return key not in self._removed and self._keys.find(key) >= 0
+
+    def __len__(self):
+        return len(self._keys) - len(self._removed) + len(self._added)
+
+    def __iter__(self):
+        added = list(self._added)
+        removed = self._removed
+        for key in self._keys:
+            if not removed or key not in removed:
+                yield _unpack_id(key)
+        for key in added:
+            yield _unpack_id(key)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+    def add(self, sf_id):
+        key = _pack_id(sf_id)
+        if key in self._added:
+            return
+        if key in self._removed:
+            self._removed.discard(key)
+        elif self._keys.find(key) < 0:
+            self._added.add(key)
+            self._check_overflow()
+
+    def discard(self, sf_id):
+        key = _pack_id(sf_id)
+        if key in self._added:
+            self._added.discard(key)
+        elif key not in self._removed and self._keys.find(key) >= 0:
+            self._removed.add(key)
+            self._check_overflow()
+
+    def _check_overflow(self):
+        pending = len(self._added) + len(self._removed)
+        if pending >= self.overflow_limit and pending >= len(self._keys) // 8:
+            self.compact()
+
+    def _compacted(self):
+        # Return an array holding the set's keys with pending changes folded in,
+        # without modifying the set. Arrays are never modified in place once built.
+        w = _PackedIdArray.WIDTH
+        array = self._keys
+        removed = list(self._removed)
+        added = sorted(self._added)
+
+        if removed:
+            keys = array.keys
+            remaining = bytearray()
+            prev = 0
+            for pos in sorted(array.find(k) for k in removed):
+                remaining += keys[prev * w:pos * w]
+                prev = pos + 1
+            remaining += keys[prev * w:]
+            array = self._new_array(remaining)
+
+        if added:
+            # None of the added keys is in the array, so they're merged in as runs between array slices.
+            if array is self._keys:
+                array = self._new_array(array.keys)
+            array.merge(added)
+
+        return array
+
+    def _sorted_keys(self):
+        return self._compacted().keys if self._added or self._removed else self._keys.keys
+
+    def compact(self):
+        # Fold pending changes into the array. The new array is published before the
+        # pending changes are cleared, so concurrent membership tests stay correct throughout.
+        if self._added or self._removed:
+            self._keys = self._compacted()
+            self._removed = set()
+            self._added = set()
+
+    @staticmethod
+    def _union_keys(a, b):
+        # The union of two sorted arrays of keys. Ids of different sObjects, or extracted
+        # at different times, usually don't interleave, and are simply concatenated.
+        w = _PackedIdArray.WIDTH
+        if not a or not b:
+            return bytearray(a or b)
+        if a[-w:] < b[:w]:
+            return a + b
+        if b[-w:] < a[:w]:
+            return b + a
+
+        # Otherwise, merge the keys of the smaller array that the larger lacks into it, as runs.
+        if len(a) < len(b):
+            (a, b) = (b, a)
+        merged = _PackedIdArray()
+        merged.keys = bytearray(a)
+        merged.rebuild_fences()
+        merged.merge([key for key in _PackedIdArray.iter_keys(b) if merged.find(key) < 0])
+
+        return merged.keys
+
+    def __ior__(self, other):
+        if isinstance(other, IdSet):
+            if len(self) == 0 or len(other) > len(self) // 16:
+                # Only read the other set: it may be shared with other threads.
+                other_keys = other._sorted_keys()
+                self.compact()
+                self._keys = self._new_array(IdSet._union_keys(self._keys.keys, other_keys))
+                return self
+
+        for sf_id in other:
+            self.add(sf_id)
+
+        return self
+
+    def __isub__(self, other):
+        if isinstance(other, IdSet) and len(other) > len(self):
+            # Scan our own (smaller) array rather than the other set.
+            self._keys = self.difference(other)._keys
+            self._removed = set()
+            self._added = set()
+            return self
+
+        for sf_id in other:
+            self.discard(sf_id)
+
+        return self
+
+    def update(self, *others):
+        for other in others:
+            self |= other
+
+    def copy(self):
+        return self._from_keys(bytearray(self._sorted_keys()))
+
+    def union(self, *others):
+        id_set = self.copy()
+        id_set.update(*others)
+        return id_set
+
+    def _filter(self, predicate):
+        w = _PackedIdArray.WIDTH
+        keys = self._sorted_keys()
+        kept = bytearray()
+        for i in range(0, len(keys), w):
+            if predicate(keys[i:i + w]):
+                kept += keys[i:i + w]
+
+        return self._from_keys(kept)
+
+    def difference(self, other):
+        if isinstance(other, IdSet):
+            return self._filter(lambda key: not other._contains_key(bytes(key)))
+
+        other = other if isinstance(other, collections.abc.Set) else set(other)
+        return self._filter(lambda key: _unpack_id(bytes(key)) not in other)
+
+    def intersection(self, other):
+        if isinstance(other, IdSet):
+            return self._filter(lambda key: other._contains_key(bytes(key)))
+
+        other = other if isinstance(other, collections.abc.Set) else set(other)
+        return self._filter(lambda key: _unpack_id(bytes(key)) in other)
+
+    @property
+    def nbytes(self):
+        # Approximate memory footprint. Each pending change holds a bytes object and a set slot.
+        return self._keys.nbytes + (len(self._added) + len(self._removed)) * 110
+
+
+class DiskIdMap(collections.abc.Mapping):
+    # An IdMap backed by a SQLite database, for Id maps larger than memory.
+    # Writes are buffered and flushed in batches. Reads are served from a
+    # bounded LRU cache, which callers should warm with prefetch() so that
+    # lookups for a whole batch of records cost a handful of queries.
+    QUERY_CHUNK_SIZE = 500  # Stays under SQLite's default limit of 999 parameters.
+
+    def __init__(self, path=None, items=None, cache_size=200000, write_batch_size=10000):
+        self.temporary = path is None
+        if self.temporary:
+            (fd, path) = tempfile.mkstemp(prefix='amaxa-id-map-', suffix='.db')
+            os.close(fd)
+
+        self.path = path
+        self.cache_size = cache_size
+        self.write_batch_size = write_batch_size
+        self._cache = collections.OrderedDict()
+        self._pending = {}
+        self._working = {}
+
+        # The map is a cache of data that's also written to results files and
+        # the state journal, so we trade durability for speed.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = OFF')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS id_map (old_id BLOB PRIMARY KEY, new_id BLOB NOT NULL) WITHOUT ROWID'
+        )
+        # A user-supplied file may hold mappings from an earlier load. Those must not
+        # leak into this one; a resumed load restores its Ids from the state journal.
+        with self._db:
+            self._db.execute('DELETE FROM id_map')
+
+        if items is not None:
+            self.update(items.items() if hasattr(items, 'items') else items)
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self._db:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO id_map (old_id, new_id) VALUES (?, ?)',
+                    self._pending.items()
+                )
+            self._pending = {}
+
+    def _cache_put(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _set(self, key, value):
+        self._pending[key] = value
+        if key in self._working:
+            self._working[key] = value
+        if key in self._cache:
+            self._cache_put(key, value)
+
+        if len(self._pending) >= self.write_batch_size:
+            self.flush()
+
+    def __setitem__(self, old_id, new_id):
+        self._set(_pack_id(old_id), _pack_id(new_id))
+
+    def update(self, items):
+        for (old_id, new_id) in items:
+            self._set(_pack_id(old_id), _pack_id(new_id))
+
+    def _lookup(self, key):
+        # Returns the packed value, or None for a known miss. Raises KeyError if
+        # the key is neither pending, prefetched nor cached.
+        if key in self._pending:
+            return self._pending[key]
+        if key in self._working:
+            return self._working[key]
+
+        value = self._cache[key]
+        self._cache.move_to_end(key)
+        return value
+
+    def _fetch(self, keys):
+        # Load the given keys from disk into the cache, recording misses as None.
+        # Returns the loaded values.
+        keys = list(keys)
+        values = {}
+        for i in range(0, len(keys), self.QUERY_CHUNK_SIZE):
+            chunk = keys[i:i + self.QUERY_CHUNK_SIZE]
+            found = dict(self._db.execute(
+                'SELECT old_id, new_id FROM id_map WHERE old_id IN ({})'.format(', '.join('?' * len(chunk))),
+                chunk
+            ))
+            for key in chunk:
+                values[key] = found.get(key)
+                self._cache_put(key, values[key])
+
+        return values
+
+    def prefetch(self, old_ids):
+        # The prefetched Ids form a working set that lasts until the next call,
+        # so a batch larger than the cache can't evict its own entries.
+        working = {}
+        keys = set()
+        for old_id in old_ids:
+            try:
+                key = _pack_id(old_id)
+            except ValueError:
+                continue
+            if key in self._pending or key in working:
+                continue
+            if key in self._cache:
+                working[key] = self._cache[key]
+            else:
+                keys.add(key)
+
+        working.update(self._fetch(keys))
+        self._working = working
+
+    def get(self, old_id, default=None):
+        key = _pack_id(old_id)
+        try:
+            value = self._lookup(key)
+        except KeyError:
+            self._fetch([key])
+            value = self._cache[key]
+
+        return _unpack_id(value) if value is not None else default
+
+    def __getitem__(self, old_id):
+        value = self.get(old_id)
+        if value is None:
+            raise KeyError(old_id)
+
+        return value
+
+    def get_many(self, old_ids):
+        old_ids = list(old_ids)
+        self.prefetch(old_ids)
+
+        return [self.get(old_id) for old_id in old_ids]
+
+    def __contains__(self, old_id):
+        return self.get(old_id) is not None
+
+    def __len__(self):
+        self.flush()
+        return self._db.execute('SELECT COUNT(*) FROM id_map').fetchone()[0]
 
-    i = iter(records)
-    yield enc(next(i))
-    for rec in i:
-        yield b',' + enc(rec)
+    def __iter__(self):
+        for (key, value) in self.items():
+            yield key
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        self.flush()
+        for (key, value) in self._db.execute('SELECT old_id, new_id FROM id_map ORDER BY old_id'):
+            yield (_unpack_id(key), _unpack_id(value))
+
+    @property
+    def nbytes(self):
+        return (len(self._cache) + len(self._pending) + len(self._working)) * 150
+
+    def close(self):
+        self._db.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+_json_encode = json.JSONEncoder().encode
+
+class _LineBuffer(object):
+    # A file for a csv.writer that keeps only the last line written.
+    def write(self, line):
+        self.line = line
+
+
+class BatchSerializer(object):
+    # Serializes records into Bulk API batch payloads: a JSON array or, if `content_type` is 'CSV',
+    # a CSV file whose header row holds the fields of the batch's first record. Null values are
+    # written as #N/A, which the Bulk API takes as null in CSV. A whole batch can be serialized at once,
+    # or record by record, tracking the payload's size, and then joined into a single buffer of its final size.
+    # JSON is encoded with orjson, if it's installed, and the standard library otherwise.
+    def __init__(self, content_type='JSON'):
+        if content_type not in ['JSON', 'CSV']:
+            raise AmaxaException('Unsupported Bulk API content type {}'.format(content_type))
+
+        self.content_type = content_type
+        self.fieldnames = None
+        self.header = b''
+        self.line_buffer = _LineBuffer()
+        self.csv_writer = csv.writer(self.line_buffer, lineterminator='\n')
+
+    def start(self, record):
+        # Begin a batch with `record`, returning the size of the empty payload.
+        if self.content_type == 'CSV':
+            self.fieldnames = list(record)
+            self.csv_writer.writerow(self.fieldnames)
+            self.header = self.line_buffer.line.encode('utf-8')
+            return len(self.header)
+
+        return 1 # [ and ], less the separator that the first record doesn't need.
+
+    def get_csv_row(self, record):
+        # Every record in a CSV batch must have exactly the fields in its header,
+        # or its values would be written under the wrong columns or lost.
+        if len(record) == len(self.fieldnames):
+            try:
+                return ['#N/A' if v is None else v for v in [record[f] for f in self.fieldnames]]
+            except KeyError:
+                pass
+
+        raise AmaxaException(
+            'Record has fields {} that don\'t match the fields of its CSV batch, {}'.format(
+                ', '.join(sorted(record)),
+                ', '.join(self.fieldnames)
+            )
+        )
+
+    def encode(self, record):
+        # Encode a record, returning its encoding and the number of bytes it adds to its batch's payload.
+        # The payload's size is the sum of the size returned by start() and of those of its records.
+        if self.content_type == 'CSV':
+            self.csv_writer.writerow(self.get_csv_row(record))
+            encoded = self.line_buffer.line.encode('utf-8')
+            return (encoded, len(encoded))
+
+        encoded = orjson.dumps(record) if orjson is not None else _json_encode(record).encode('utf-8')
+        return (encoded, len(encoded) + 1) # ,
+
+    def get_payload(self, encoded):
+        if self.content_type == 'CSV':
+            return b''.join([self.header] + encoded)
+
+        # Interleave the encoded records with separators, so that the payload is built by one join.
+        if not encoded:
+            return b'[]'
+        pieces = [b','] * (2 * len(encoded) + 1)
+        pieces[0] = b'['
+        pieces[1::2] = encoded
+        pieces[-1] = b']'
+
+        return b''.join(pieces)
+
+    def iter_batches(self, pairs, max_records=MAX_BATCH_RECORDS, max_bytes=MAX_BATCH_BYTES):
+        # Group (key, record) pairs into batches of (keys, payload) holding no more than `max_records`
+        # records and `max_bytes` bytes each, serializing each record as it's added.
+        # A record too large for any batch is placed alone in its own.
+        encode = self.encode
+        keys = []
+        encoded = []
+        size = 0
+
+        for (key, record) in pairs:
+            if not encoded:
+                size = self.start(record)
+            (e, n) = encode(record)
+
+            if size + n > max_bytes and encoded:
+                yield (keys, self.get_payload(encoded))
+                (keys, encoded) = ([], [])
+                # A CSV batch's header comes from its first record.
+                size = self.start(record)
+                (e, n) = encode(record)
+
+            keys.append(key)
+            encoded.append(e)
+            size += n
+
+            # Yield a full batch before reading the next record.
+            if len(encoded) >= max_records:
+                yield (keys, self.get_payload(encoded))
+                (keys, encoded) = ([], [])
+
+        if encoded:
+            yield (keys, self.get_payload(encoded))
+
+    def serialize(self, records):
+        # Serialize a whole batch of records at once.
+        if self.content_type == 'JSON':
+            return orjson.dumps(records) if orjson is not None else json.dumps(records).encode('utf-8')
+        if not records:
+            return b''
+
+        self.start(records[0])
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(self.get_csv_row(record) for record in records)
+
+        return self.header + buffer.getvalue().encode('utf-8')
+
+
+def JSONArrayReader(f, chunk_size=65536):
+    # Incrementally parse a JSON array from the binary stream `f`, yielding its
+    # elements one at a time. Only the element being parsed (plus up to one chunk
+    # of lookahead) is held in memory, however large the array is.
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        data = f.read(chunk_size)
+        eof = not data
+        buf = buf[pos:] + utf8.decode(data, final=eof)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('Expected a JSON array at position {}'.format(pos))
+    pos += 1
+
+    first = True
+    while True:
+        skip_whitespace()
+        if buf[pos:pos + 1] == ']':
+            return
+        if not first:
+            if buf[pos:pos + 1] != ',':
+                raise ValueError('Expected , or ] in JSON array')
+            pos += 1
+            skip_whitespace()
+        first = False
+
+        while True:
+            try:
+                (value, end) = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # The element may continue beyond our buffer.
+                if eof:
+                    raise
+                fill()
+                continue
+
+            # A number may also continue beyond the buffer.
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not eof:
+                rest = end
+                while rest < len(buf) and buf[rest] in '0123456789.eE+-':
+                    rest += 1
+                if rest == len(buf):
+                    fill()
+                    continue
+
+            pos = end
+            break
+
+        yield value
+
+class BulkResultConverter(object):
+    # The JSON Bulk API returns Date and DateTime values as milliseconds since the epoch,
+    # instead of the ISO 8601-format strings the REST API returns. The converter is built once
+    # for a set of fields, and converts each such column across a whole chunk of records.
+    # Dates repeat heavily in real data, so each day's string is computed only once;
+    # the other components of a DateTime are assembled from precomputed strings.
+    EPOCH = datetime(1970, 1, 1).date()
+    HOURS_MINUTES = ['T%02d:%02d:' % (h, m) for h in range(24) for m in range(60)]
+    SECONDS = ['%02d' % s for s in range(60)]
+    MILLISECONDS = ['.%03d+0000' % ms for ms in range(1000)]
+
+    def __init__(self, field_map, fields):
+        self.day_cache = {}
+        self.columns = [
+            (f, self.convert_datetime if field_map[f]['type'] == 'datetime' else self.convert_date)
+            for f in fields
+            if field_map[f]['type'] in ['datetime', 'date']
+        ]
+
+    def format_day(self, days):
+        formatted = self.day_cache.get(days)
+        if formatted is None:
+            formatted = (self.EPOCH + timedelta(days=days)).isoformat()
+            self.day_cache[days] = formatted
+
+        return formatted
+
+    def convert_date(self, value):
+        return self.format_day(int(value) // 86400000)
+
+    def convert_datetime(self, value):
+        (seconds, milliseconds) = divmod(int(value), 1000)
+        (days, seconds) = divmod(seconds, 86400)
+        (minutes, seconds) = divmod(seconds, 60)
+
+        # Salesforce's particular format, e.g. 2019-01-05T03:41:05.000+0000
+        return self.format_day(days) + self.HOURS_MINUTES[minutes] + self.SECONDS[seconds] + self.MILLISECONDS[milliseconds]
+
+    def convert(self, records):
+        for (f, convert_value) in self.columns:
+            for rec in records:
+                value = rec[f]
+                if value is not None:
+                    rec[f] = convert_value(value)
+
+        return records
+
+class PrefetchReader(object):
+    # Reads the binary stream `f` on its own thread, up to `depth` chunks ahead of the consumer,
+    # so that network reads overlap with parsing. read() returns the next chunk, whatever its size.
+    # `on_read`, if supplied, is called with the size of each chunk and the time taken to read it.
+    def __init__(self, f, on_read=None, chunk_size=65536, depth=16):
+        self.f = f
+        self.on_read = on_read
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=depth)
+        self.cancel = threading.Event()
+        self.eof = False
+        self.wait_time = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        while not self.cancel.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def run(self):
+        try:
+            while True:
+                start = monotonic()
+                data = self.f.read(self.chunk_size)
+                if self.on_read is not None:
+                    self.on_read(len(data), monotonic() - start)
+                if not self.put(data) or not data:
+                    return
+        except Exception as e:
+            self.put(e)
+
+    def read(self, n=-1):
+        if self.eof:
+            return b''
+
+        start = monotonic()
+        data = self.queue.get()
+        self.wait_time += monotonic() - start
+
+        if isinstance(data, Exception):
+            raise data
+        self.eof = not data
+
+        return data
+
+    def close(self):
+        self.cancel.set()
+        self.thread.join()
+
+
+class RecordWriter(csv.DictWriter):
+    # A csv.DictWriter that writes each record through a projection onto its fieldnames compiled up front,
+    # rather than building a row from the record's dict one field at a time. Fields outside the fieldnames
+    # are ignored. If `mapper` is supplied, the fieldnames are its column names, and records are mapped
+    # as they're written, without building a mapped copy of each record.
+    def __init__(self, f, fieldnames, mapper=None, **kwds):
+        super().__init__(f, fieldnames, extrasaction='ignore', **kwds)
+        self.mapper = mapper
+
+        if mapper is not None:
+            columns = { mapper.transform_key(field): field for field in mapper.field_name_mapping }
+            self.fields = [columns.get(column, column) for column in self.fieldnames]
+            self.transformed = [(index, field) for (index, field) in enumerate(self.fields) if mapper.field_transforms.get(field)]
+        else:
+            self.fields = list(self.fieldnames)
+            self.transformed = []
+
+        self.project = make_projection(self.fields)
+
+    def get_row(self, record):
+        try:
+            row = self.project(record)
+        except KeyError:
+            # Missing fields are written as the restval, like a DictWriter.
+            return [
+                self.mapper.transform_value(field, record[field]) if self.mapper is not None and field in record
+                else record.get(field, self.restval)
+                for field in self.fields
+            ]
+
+        if self.transformed:
+            row = list(row)
+            for (index, field) in self.transformed:
+                row[index] = self.mapper.transform_value(field, row[index])
+
+        return row
+
+    def writerow(self, rowdict):
+        return self.writer.writerow(self.get_row(rowdict))
+
+    def writerows(self, rowdicts):
+        return self.writer.writerows(map(self.get_row, rowdicts))
+
+
+class PipelineWriter(object):
+    # Writes rows to `writer`, a csv.DictWriter, on its own thread, applying `transform`, if supplied,
+    # to each. Rows are handed over in batches through a bounded queue. `on_write`, if supplied,
+    # is called with the size of each batch and the time taken to write it.
+    # Errors in writing are raised by a later writerow() or by close().
+    def __init__(self, writer, transform=None, on_write=None, batch_size=1000, depth=16):
+        self.writer = writer
+        self.transform = transform
+        self.on_write = on_write
+        self.batch_size = batch_size
+        self.batch = []
+        self.error = None
+        self.queue = queue.Queue(maxsize=depth)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def writerow(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue # Drain the queue, so that producers don't block.
+
+            try:
+                start = monotonic()
+                self.writer.writerows(map(self.transform, batch) if self.transform is not None else batch)
+                if self.on_write is not None:
+                    self.on_write(len(batch), monotonic() - start)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+
+        if self.error is not None:
+            raise self.error
 
-    yield b']'
 
 def BatchIterator(iterator, n=10000):
     while True:
@@ -109,6 +1249,151 @@ def BatchIterator(iterator, n=10000):
         
         yield batch
 
+def make_projection(keys):
+    # Return a function that takes the values at `keys` from a row or record as a tuple, in order.
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: (row[key],)
+    if len(keys) == 0:
+        return lambda row: ()
+
+    return operator.itemgetter(*keys)
+
+def read_rows(reader, keep):
+    # Project the records of `reader` onto the columns for which `keep(column)` is true as they're parsed.
+    # Returns the kept columns, in file order, and an iterator over rows: tuples of those columns' values.
+    # A csv.DictReader is read through its underlying csv.reader, so that no dict is built for a row,
+    # with the same treatment of blank and short lines. Other readers supply records as dicts.
+    if isinstance(reader, csv.DictReader):
+        fieldnames = reader.fieldnames or []
+        indices = [i for (i, column) in enumerate(fieldnames) if keep(column)]
+
+        return ([fieldnames[i] for i in indices], _read_csv_rows(reader, indices, len(fieldnames)))
+
+    records = iter(reader)
+    first = next(records, None)
+    if first is None:
+        return ([], iter(()))
+
+    columns = [column for column in first if keep(column)]
+    return (columns, (tuple(record.get(column) for column in columns) for record in itertools.chain([first], records)))
+
+def _read_csv_rows(reader, indices, width):
+    project = make_projection(indices)
+
+    for row in reader.reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [reader.restval] * (width - len(row))
+
+        yield project(row)
+
+def iter_id_queries(prefix, field_ids, max_where_length=MAX_WHERE_LENGTH, max_url_length=None):
+    # Pack `field_ids`, a sequence of (field, Ids) pairs, into as few queries of the form
+    #   <prefix> WHERE Field1 IN ('...', ...) OR Field2 IN ('...', ...)
+    # as possible. Each query's WHERE clause fits within `max_where_length` characters and,
+    # if `max_url_length` is given, the whole query fits within that many characters once
+    # URL-encoded as a query string parameter. Queries are yielded as they are filled.
+    def url_length(text):
+        return len(quote_plus(text))
+
+    def format_query(clauses):
+        return '{} WHERE {}'.format(
+            prefix,
+            ' OR '.join('{} IN ({})'.format(field, ', '.join(ids)) for (field, ids) in clauses)
+        )
+
+    clauses = []
+    empty_lengths = (len('WHERE '), url_length(prefix + ' WHERE '))
+    (where_length, query_url_length) = empty_lengths
+
+    for (field, ids) in field_ids:
+        clause = None
+        for id in ids:
+            quoted = '\'{}\''.format(id)
+
+            while True:
+                # Adding an Id to the open clause inserts it before the closing parenthesis.
+                if clause is not None:
+                    piece = ', ' + quoted
+                else:
+                    piece = '{}{} IN ({})'.format(' OR ' if clauses else '', field, quoted)
+
+                if clauses and (where_length + len(piece) > max_where_length
+                                or (max_url_length is not None and query_url_length + url_length(piece) > max_url_length)):
+                    yield format_query(clauses)
+                    clauses = []
+                    clause = None
+                    (where_length, query_url_length) = empty_lengths
+                else:
+                    break
+
+            if clause is None:
+                clause = []
+                clauses.append((field, clause))
+
+            clause.append(quoted)
+            where_length += len(piece)
+            query_url_length += url_length(piece)
+
+    if clauses:
+        yield format_query(clauses)
+
+def pack_id_queries(prefix, field_ids, max_where_length=MAX_WHERE_LENGTH, max_url_length=None):
+    return list(iter_id_queries(prefix, field_ids, max_where_length, max_url_length))
+
+def count_id_queries(prefix, field_counts, max_where_length=MAX_WHERE_LENGTH, max_url_length=None):
+    # Count the queries iter_id_queries() would yield for `field_counts`, a sequence of
+    # (field, number of Ids) pairs, without building them. Every 18-character Id is the
+    # same length quoted and URL-encoded, so each query is filled arithmetically.
+    def lengths(piece):
+        return (len(piece), len(quote_plus(piece)))
+
+    quoted = '\'{}\''.format(EXPLAIN_PLACEHOLDER_ID)
+    next_id = lengths(', ' + quoted)
+    empty_lengths = (len('WHERE '), len(quote_plus(prefix + ' WHERE ')))
+    (where_length, query_url_length) = empty_lengths
+    queries = 0
+    has_clauses = False
+
+    for (field, count) in field_counts:
+        open_clause = False
+        while count > 0:
+            if not open_clause:
+                first_id = lengths('{}{} IN ({})'.format(' OR ' if has_clauses else '', field, quoted))
+                fits = where_length + first_id[0] <= max_where_length \
+                    and (max_url_length is None or query_url_length + first_id[1] <= max_url_length)
+                if has_clauses and not fits:
+                    queries += 1
+                    has_clauses = False
+                    (where_length, query_url_length) = empty_lengths
+                    continue
+
+                where_length += first_id[0]
+                query_url_length += first_id[1]
+                count -= 1
+                has_clauses = True
+                open_clause = True
+            else:
+                # Fill the clause with as many more Ids as fit.
+                added = min(count, (max_where_length - where_length) // next_id[0])
+                if max_url_length is not None:
+                    added = min(added, (max_url_length - query_url_length) // next_id[1])
+                added = max(0, added)
+                if added == 0:
+                    queries += 1
+                    has_clauses = False
+                    open_clause = False
+                    (where_length, query_url_length) = empty_lengths
+                    continue
+
+                where_length += added * next_id[0]
+                query_url_length += added * next_id[1]
+                count -= added
+
+    return queries + 1 if has_clauses else queries
+
 class FileStore(object):
     def __init__(self):
         self.store = {}
@@ -131,11 +1416,177 @@ class FileStore(object):
             f.close()
 
 
+class BatchMonitor(object):
+    # Tracks every outstanding Bulk API batch, across jobs, until it completes.
+    # Each poll fetches the status of all of a job's batches in one request.
+    # The polling interval starts short and backs off while batches make no progress;
+    # when record counts show how quickly a batch of known size is being processed,
+    # the next poll is scheduled for its estimated completion instead.
+    MIN_INTERVAL = 0.5
+    MAX_INTERVAL = 30.0
+    BACKOFF = 1.5
+
+    def __init__(self, bulk):
+        self.bulk = bulk
+        self.outstanding = {}
+        self.interval = self.MIN_INTERVAL
+        self.lock = threading.RLock()
+
+    def add(self, job, batch, records=None, callback=None, chunked=False):
+        # `records` is the number of records in the batch, if known.
+        # `callback`, if supplied, is called with (job, batch) when the batch completes.
+        # A `chunked` batch is a query batch in a PK chunking job. Salesforce splits it into
+        # chunk batches and marks it Not Processed; we then track the chunks in its place,
+        # calling `callback` for each, and consider the original batch complete with the last.
+        with self.lock:
+            self.outstanding[batch] = {
+                'job': job,
+                'records': records,
+                'callback': callback,
+                'chunked': chunked,
+                'chunks': None,
+                'processed': 0,
+                'polled': monotonic(),
+                'completing': False
+            }
+            self.interval = self.MIN_INTERVAL
+
+    def poll(self, jobs=None):
+        # Check the status of all outstanding batches, or those of the given jobs,
+        # and return those that have completed.
+        # The lock isn't held across requests or completion callbacks, so that other threads
+        # can add and wait for batches meanwhile. A completed batch is marked as completing,
+        # so that no other poll calls its callback, and remains outstanding until the callback returns.
+        with self.lock:
+            polled_jobs = [
+                job for job in dict.fromkeys(b['job'] for b in self.outstanding.values())
+                if jobs is None or job in jobs
+            ]
+
+        batch_lists = [(job, self.bulk.get_batch_list(job)) for job in polled_jobs]
+
+        with self.lock:
+            completed = []
+            progressed = False
+            estimate = None
+            now = monotonic()
+
+            for (job, batch_list) in batch_lists:
+                for info in batch_list:
+                    tracked = self.outstanding.get(info['id'])
+                    if tracked is not None and tracked['chunked'] and tracked['chunks'] is None \
+                        and info['state'] == salesforce_bulk.bulk_states.NOT_PROCESSED:
+                        # This batch has been split into chunks. Track each of them.
+                        tracked['chunks'] = set()
+                        for chunk in batch_list:
+                            if chunk['id'] != info['id'] and chunk['id'] not in self.outstanding:
+                                tracked['chunks'].add(chunk['id'])
+                                self.add(job, chunk['id'], callback=tracked['callback'])
+                        progressed = True
+
+                for info in batch_list:
+                    batch = info['id']
+                    tracked = self.outstanding.get(batch)
+                    if tracked is None or tracked['chunks'] is not None or tracked['completing']:
+                        continue
+
+                    state = info['state']
+                    processed = int(info.get('numberRecordsProcessed') or 0)
+
+                    if state in salesforce_bulk.bulk_states.ERROR_STATES:
+                        del self.outstanding[batch]
+                        raise salesforce_bulk.salesforce_bulk.BulkBatchFailed(job, batch, info.get('stateMessage'), state)
+                    elif state == salesforce_bulk.bulk_states.COMPLETED:
+                        tracked['completing'] = True
+                        completed.append((batch, tracked))
+                        progressed = True
+                    elif processed > tracked['processed']:
+                        progressed = True
+                        if tracked['records'] is not None:
+                            rate = (processed - tracked['processed']) / max(now - tracked['polled'], 0.001)
+                            remaining = (tracked['records'] - processed) / rate
+                            estimate = remaining if estimate is None else min(estimate, remaining)
+
+                    tracked['processed'] = processed
+                    tracked['polled'] = now
+
+            if estimate is not None:
+                self.interval = min(max(estimate, self.MIN_INTERVAL), self.MAX_INTERVAL)
+            elif not progressed:
+                self.interval = min(self.interval * self.BACKOFF, self.MAX_INTERVAL)
+
+        called = 0
+        try:
+            for (batch, tracked) in completed:
+                called += 1
+                if tracked['callback'] is not None:
+                    tracked['callback'](tracked['job'], batch)
+        finally:
+            with self.lock:
+                # A batch whose callback raised is complete, as are those before it;
+                # any after it are left for the next poll.
+                for (batch, tracked) in completed[called:]:
+                    tracked['completing'] = False
+                completed = [batch for (batch, tracked) in completed[:called]]
+                for batch in completed:
+                    del self.outstanding[batch]
+
+                # Chunked batches are complete once all of their chunks are.
+                for (batch, tracked) in list(self.outstanding.items()):
+                    if tracked['chunks'] is not None and not any(c in self.outstanding for c in tracked['chunks']):
+                        del self.outstanding[batch]
+                        completed.append(batch)
+
+        return completed
+
+    def wait(self, batches=None, cancel=None):
+        # Poll until the given batches (or all outstanding batches) have completed,
+        # or until the `cancel` Event, if supplied, is set.
+        # Only the jobs of the awaited batches are polled, so that a failure is raised
+        # in the thread waiting for the failed batch.
+        with self.lock:
+            pending = set(batches if batches is not None else self.outstanding)
+            jobs = { self.outstanding[batch]['job'] for batch in pending if batch in self.outstanding }
+
+        while cancel is None or not cancel.is_set():
+            self.poll(jobs)
+            with self.lock:
+                pending = { batch for batch in pending if batch in self.outstanding }
+            if not pending:
+                return
+
+            sleep(self.interval)
+
+    def wait_any(self, batches):
+        # Poll until at least one of the given batches has completed, and return those that have.
+        with self.lock:
+            jobs = { self.outstanding[batch]['job'] for batch in batches if batch in self.outstanding }
+
+        while True:
+            self.poll(jobs)
+            with self.lock:
+                completed = [batch for batch in batches if batch not in self.outstanding]
+            if completed:
+                return completed
+
+            sleep(self.interval)
+
+
 class Operation(object):
     def __init__(self, connection):
         self.steps = []
         self.connection = connection
         self._bulk = None
+        self._batch_monitor = None
+        self.describe_cache = None
+        self.global_describe = None
+        self.global_describe_future = None
+        self.describe_futures = {}
+        self.describe_parallelism = 8
+        self.query_parallelism = 4
+        self.connection_pool_size = None
+        self.metrics = collections.Counter()
+        self.metrics_lock = threading.Lock()
         self.describe_info = {}
         self.field_maps = {}
         self.proxy_objects = {}
@@ -151,7 +1602,10 @@ class Operation(object):
             self.logger.error('Unexpected exception {} occurred.'.format(str(e)))
             return -1
         finally:
-            self.file_store.close()
+            self.close()
+
+    def close(self):
+        self.file_store.close()
 
     def initialize(self):
         for s in self.steps:
@@ -167,6 +1621,13 @@ class Operation(object):
         
         return self._bulk
 
+    @property
+    def batch_monitor(self):
+        if self._batch_monitor is None:
+            self._batch_monitor = BatchMonitor(self.bulk)
+
+        return self._batch_monitor
+
     def execute(self):
         pass
 
@@ -179,22 +1640,102 @@ class Operation(object):
 
     def get_sobject_name_for_id(self, id):
         if self.key_prefix_map is None:
-            global_describe = self.connection.describe()['sobjects']
+            global_describe = self.get_global_describe()['sobjects']
             self.key_prefix_map = {
                 sobject['keyPrefix']: sobject['name'] for sobject in global_describe
             }
         
         return self.key_prefix_map[id[:3]]
 
+    def increment_metric(self, name, value=1):
+        # Metrics may be updated from any thread.
+        with self.metrics_lock:
+            self.metrics[name] += value
+
+    def record_stage(self, stage, items, seconds):
+        # Record time spent by a pipeline stage.
+        with self.metrics_lock:
+            self.metrics[stage + '_items'] += items
+            self.metrics[stage + '_seconds'] += seconds
+
+    def get_stage_throughput(self, stage):
+        # Items processed per second of time spent in a pipeline stage.
+        seconds = self.metrics[stage + '_seconds']
+        return self.metrics[stage + '_items'] / seconds if seconds > 0 else None
+
     def get_proxy_object(self, sobjectname):
         if sobjectname not in self.proxy_objects:
             self.proxy_objects[sobjectname] = getattr(self.connection, sobjectname)
 
         return self.proxy_objects[sobjectname]
 
+    def configure_connection_pool(self, size):
+        # Ensure that the connection's HTTP session keeps enough pooled connections
+        # for `size` concurrent requests.
+        session = getattr(self.connection, 'session', None)
+        if session is not None and (self.connection_pool_size is None or self.connection_pool_size < size):
+            session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=size))
+            self.connection_pool_size = size
+
+    def query_all_concurrently(self, queries):
+        # Run each SOQL query through query_all() on up to query_parallelism threads,
+        # yielding results in the order they arrive. No more than twice that many
+        # results are in flight or awaiting the caller at any time.
+        queries = iter(queries)
+        window = 2 * self.query_parallelism
+
+        self.configure_connection_pool(self.query_parallelism)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.query_parallelism) as executor:
+            pending = { executor.submit(self.connection.query_all, q) for q in itertools.islice(queries, window) }
+
+            while pending:
+                (done, pending) = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+                for q in itertools.islice(queries, window - len(pending)):
+                    pending.add(executor.submit(self.connection.query_all, q))
+
+    def prefetch_describes(self, sobjectnames):
+        # Start the global describe and the describes of each named sObject concurrently.
+        # get_global_describe() and get_describe() wait for and consume the results;
+        # errors surface there, and only for describes that are actually used.
+        self.configure_connection_pool(self.describe_parallelism)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.describe_parallelism)
+
+        if self.global_describe is None and self.global_describe_future is None:
+            self.global_describe_future = executor.submit(self.fetch_global_describe)
+
+        for sobjectname in sobjectnames:
+            if sobjectname not in self.describe_info and sobjectname not in self.describe_futures:
+                self.describe_futures[sobjectname] = executor.submit(self.fetch_describe, sobjectname)
+
+        executor.shutdown(wait=False)
+
+    def fetch_global_describe(self):
+        if self.describe_cache is not None:
+            return self.describe_cache.get_global_describe(self.connection)
+
+        return self.connection.describe()
+
+    def fetch_describe(self, sobjectname):
+        if self.describe_cache is not None:
+            return self.describe_cache.get_sobject_describe(self.connection, sobjectname)
+
+        return self.get_proxy_object(sobjectname).describe()
+
+    def get_global_describe(self):
+        if self.global_describe is None:
+            future = self.global_describe_future
+            self.global_describe_future = None
+            self.global_describe = future.result() if future is not None else self.fetch_global_describe()
+
+        return self.global_describe
+
     def get_describe(self, sobjectname):
         if sobjectname not in self.describe_info:
-            self.describe_info[sobjectname] = self.get_proxy_object(sobjectname).describe()
+            future = self.describe_futures.pop(sobjectname, None)
+            self.describe_info[sobjectname] = future.result() if future is not None else self.fetch_describe(sobjectname)
             self.field_maps[sobjectname] = { f.get('name') : f for f in self.describe_info[sobjectname].get('fields') }
 
         return self.describe_info[sobjectname]
@@ -270,12 +1811,54 @@ class LoadOperation(Operation):
     def __init__(self, connection):
         super().__init__(connection)
         self.mappers = {}
-        self.global_id_map = {}
+        self.global_id_map = IdMap()
+        self.id_map_budget = None
+        self.id_map_path = None
+        self.journal = None
         self.success = True
         self.stage = LoadStage.INSERTS
+        # In streaming mode, each batch is posted as soon as it's read, rather than after
+        # the whole input file has been read and validated, and no more than `batches_in_flight`
+        # batches are held in memory at once.
+        self.streaming = False
+        self.batches_in_flight = 4
+        # The content type of Bulk API jobs for inserts and updates, 'JSON' or 'CSV'.
+        self.content_type = 'JSON'
+        # The most records, and bytes of payload, in each batch of those jobs.
+        self.batch_records = MAX_BATCH_RECORDS
+        self.batch_bytes = MAX_BATCH_BYTES
+
+    def close(self):
+        super().close()
+        self.global_id_map.close()
+
+    def set_stage(self, stage):
+        self.stage = stage
+        if self.journal is not None:
+            self.journal.record_stage(stage)
+            self.journal.sync()
+
+    def checkpoint(self):
+        # Make registered Ids durable in the state journal. Called after each batch.
+        if self.journal is not None:
+            self.journal.sync()
+
+    def check_id_map_budget(self):
+        # If the Id map has outgrown its memory budget, move it to disk.
+        if self.id_map_budget is not None and isinstance(self.global_id_map, IdMap) \
+            and self.global_id_map.nbytes > self.id_map_budget:
+            self.logger.info(
+                'Id map of %d entries exceeds memory budget of %d bytes; moving it to disk',
+                len(self.global_id_map),
+                self.id_map_budget
+            )
+            self.global_id_map = DiskIdMap(self.id_map_path, self.global_id_map)
 
     def register_new_id(self, sobjectname, old_id, new_id):
         self.global_id_map[old_id] = new_id
+        if self.journal is not None:
+            self.journal.record_new_id(old_id, new_id)
+        self.check_id_map_budget()
         self.file_store.get_csv(sobjectname, FileType.RESULT).writerow(
             {
                 constants.ORIGINAL_ID: str(old_id),
@@ -295,8 +1878,15 @@ class LoadOperation(Operation):
     def get_new_id(self, old_id):
         return self.global_id_map.get(old_id, None)
 
+    def get_new_ids(self, old_ids):
+        return self.global_id_map.get_many(old_ids)
+
+    def prefetch_new_ids(self, old_ids):
+        self.global_id_map.prefetch(old_ids)
+
     def execute(self):
         self.logger.info('Starting load with sObjects %s', ', '.join(self.get_sobject_list()))
+        self.check_id_map_budget()
         if self.stage is LoadStage.INSERTS:
             for s in self.steps:
                 self.logger.info('%s: starting load', s.sobjectname)
@@ -307,7 +1897,7 @@ class LoadOperation(Operation):
                     self.logger.error('%s: errors took place during load. See results file for details.', s.sobjectname)
                     return -1
             
-            self.stage = LoadStage.DEPENDENTS
+            self.set_stage(LoadStage.DEPENDENTS)
 
         if self.stage is LoadStage.DEPENDENTS:
             for s in self.steps:
@@ -357,118 +1947,231 @@ class LoadStep(Step):
         elif b is OutsideLookupBehavior.DROP_FIELD:
             return ''
 
-    def populate_lookups(self, record, lookups, id):
-        return { k: record[k] if k not in lookups
-                              else self.get_value_for_lookup(k, record[k], id)
-                 for k in record }
-
-    def primitivize(self, record):
+    @staticmethod
+    def get_value_converter(field_type):
         # We're using the Bulk API over JSON, so values can be specified as strings (not converted to JSON primitives)
         # We will apply a light transformation to ensure we format correctly and respect a few Boolean equivalents
-        def convert_value(value, field_type):
-            if field_type == 'xsd:boolean':
+        if field_type == 'xsd:boolean':
+            def convert_value(value):
                 if value is None or value.lower() in ['no', 'false', 'n', 'f', '0', '']:
                     return 'false'
                 elif value.lower() in ['yes', 'true', 'y', 't', '1']:
                     return 'true'
                 raise ValueError('Invalid Boolean value {}', value)
-            elif value is None or len(value) == 0:
+        elif field_type == 'tns:ID':
+            def convert_value(value):
+                return str(value) if value is not None and len(value) > 0 else None
+        elif field_type in ['xsd:string', 'xsd:date', 'xsd:dateTime', 'xsd:int', 'xsd:double']:
+            def convert_value(value):
+                return value if value is not None and len(value) > 0 else None
+        else:
+            def convert_value(value):
                 return None
-            elif field_type == 'tns:ID':
-                return str(value)
-            elif field_type in ['xsd:string', 'xsd:date', 'xsd:dateTime', 'xsd:int', 'xsd:double']:
-                return value
-            
-            return None
 
-        field_map = self.context.get_field_map(self.sobjectname)
-        return { k: convert_value(record[k], field_map[k]['soapType'] ) for k in record }
+        return convert_value
 
-    def transform_record(self, record):
-        if self.sobjectname in self.context.mappers:
-            record = self.context.mappers[self.sobjectname].transform_record(record)
+    def initialize(self):
+        super().initialize()
+        self.column_plan = self.compile_column_plan()
+
+    def compile_column_plan(self):
+        # Map each input column that we load to its field and a single function of (value, record Id)
+        # that applies the mapper's transforms, resolves descendent lookups, and converts the value
+        # for the Bulk API, so that records can be prepared in one pass. Columns whose mapped field
+        # is out of scope, or is a dependent or self lookup (loaded later as an update), are not loaded.
+        mapper = self.context.mappers.get(self.sobjectname)
+        columns = set(self.field_scope) | (set(mapper.field_name_mapping) if mapper is not None else set())
+        skipped = self.dependent_lookups | self.self_lookups
+        plan = {}
+
+        for column in columns:
+            field = mapper.transform_key(column) if mapper is not None else column
+            if field in self.field_scope and field not in skipped:
+                plan[column] = (field, self.compile_column(column, field, mapper))
+
+        return plan
+
+    def compile_column(self, column, field, mapper):
+        transforms = list(mapper.field_transforms.get(column, [])) if mapper is not None else []
+        is_lookup = field in self.descendent_lookups
+        convert = self.get_value_converter(self.context.get_field_map(self.sobjectname)[field]['soapType'])
+
+        if not transforms and not is_lookup:
+            return lambda value, record_id: convert(value)
+
+        get_value_for_lookup = self.get_value_for_lookup
+
+        def convert_column(value, record_id):
+            for transform in transforms:
+                value = transform(value)
+            if is_lookup:
+                value = get_value_for_lookup(field, value, record_id)
+            return convert(value)
+
+        return convert_column
+
+    def compile_row_plan(self, columns):
+        # Bind the column plan to the column order of an input file's rows, as (index, field, function).
+        plan = self.column_plan
+
+        return [(index, plan[column][0], plan[column][1]) for (index, column) in enumerate(columns) if column in plan]
+
+    def prepare_row(self, row, row_plan, record_id):
+        # Apply a row plan to a row of the input file.
+        prepared = {}
+
+        for (index, field, convert) in row_plan:
+            prepared[field] = convert(row[index], record_id)
+
+        return prepared
+
+    def prepare_record(self, record):
+        # Apply the column plan to an input record.
+        plan = self.column_plan
+        record_id = record['Id']
+        prepared = {}
+
+        for (column, value) in record.items():
+            entry = plan.get(column)
+            if entry is not None:
+                prepared[entry[0]] = entry[1](value, record_id)
+
+        return prepared
+
+    def prefetch_lookups(self, rows, indices):
+        # Warm the context's Id map with the record Ids and lookup values at `indices` in these rows,
+        # so that a disk-backed Id map can resolve them with a few batched queries
+        # rather than one query per value.
+        self.context.prefetch_new_ids(
+            row[i] for row in rows for i in indices if row[i]
+        )
 
-        return { k: record[k] for k in record if k in self.field_scope }
+    def prepare_records(self, reader):
+        # Yield (original Id, record) for each record in our input file that hasn't yet been loaded,
+        # with transformations applied (column name -> field name, for example) and direct lookups populated.
+        # Dependent lookups and self-lookups will be populated in a later pass.
+        # A record that can't be prepared is registered as an error and yielded as None.
+        plan = self.column_plan
+        (columns, rows) = read_rows(reader, lambda column: column == 'Id' or column in plan)
+        if not columns:
+            return
 
-    def clean_dependent_lookups(self, record):
-        all_lookups = self.dependent_lookups | self.self_lookups
+        id_index = columns.index('Id')
+        row_plan = self.compile_row_plan(columns)
+        prefetched = [id_index] + [index for (index, field, convert) in row_plan if field in self.descendent_lookups]
 
-        return { k: record[k] for k in record if k not in all_lookups }
-    
-    def extract_dependent_lookups(self, record):
-        all_lookups = self.dependent_lookups | self.self_lookups
+        for chunk in BatchIterator(rows):
+            self.prefetch_lookups(chunk, sorted(prefetched))
 
-        return { k: record[k] for k in record if k in all_lookups or k == 'Id' }
+            for row in chunk:
+                # We need to save off the original record Id because it'll be cleaned from the record before insert.
+                # We use the original Id for error reporting.
+                original_id = row[id_index]
 
-    def execute(self):
-        # Read our incoming file.
-        # Apply transformations specified in our configuration file (column name -> field name, for example)
-        # Then, populate all direct lookups. Dependent lookups and self-lookups will be populated in a later pass.
-        records_to_load = []
-        original_ids = []
-        success = True
+                # We might have resumed this operation. Check to be sure this record hasn't been loaded already.
+                if self.context.get_new_id(SalesforceId(original_id)) is not None:
+                    continue
 
+                # Then, prep this record for the Bulk API, populate its lookups, apply transforms, and clean dependent lookups
+                try:
+                    record = self.prepare_row(row, row_plan, original_id)
+                except AmaxaException as e:
+                    self.context.register_error(self.sobjectname, original_id, str(e))
+                    record = None
+                except ValueError as e:
+                    self.context.register_error(self.sobjectname, original_id, 'Bad data in record {}: {}'.format(original_id, str(e)))
+                    record = None
+
+                yield (original_id, record)
+
+    def iter_batches(self, prepared):
+        # Group (original Id, record) pairs into Bulk API batches of (original Ids, payload),
+        # within the operation's limits on the records and bytes in a batch.
+        return BatchSerializer(self.context.content_type).iter_batches(
+            prepared,
+            self.context.batch_records,
+            self.context.batch_bytes
+        )
+
+    def execute(self):
         reader = self.context.file_store.get_csv(self.sobjectname, FileType.INPUT)
-        for record in reader:
-            # We might have resumed this operation. Check to be sure this record hasn't been loaded already.
-            if self.context.get_new_id(SalesforceId(record['Id'])) is not None:
-                continue
 
-            # We need to save off the original record Id because it'll be cleaned from the record before insert.
-            # We use the original Id for error reporting.
-            original_ids.append(record['Id'])
+        self.load_records(
+            self.prepare_records(reader),
+            lambda: self.context.bulk.create_insert_job(self.sobjectname, contentType=self.context.content_type)
+        )
 
-            # Then, prep this record for the Bulk API, populate its lookups, apply transforms, and clean dependent lookups
-            try:
-                record = self.primitivize(
-                    self.populate_lookups(
-                        self.clean_dependent_lookups(
-                            self.transform_record(
-                                record
-                            )
-                        ),
-                        self.descendent_lookups,
-                        original_ids[-1]
-                    )
-                )
-                records_to_load.append(record)
-            except AmaxaException as e:
-                self.context.register_error(self.sobjectname, original_ids[-1], str(e))
-                success = False
-            except ValueError as e:
-                self.context.register_error(self.sobjectname, original_ids[-1], 'Bad data in record {}: {}'.format(original_ids[-1], str(e)))
-                success = False
-
-        if not success or len(records_to_load) == 0:
-            return
+    def load_records(self, prepared, create_job, register_ids=True):
+        # Load `prepared`, a sequence of (original Id, record) pairs in which records that can't be loaded are None,
+        # in a Bulk API job created by `create_job` if there are any records to load.
+        if self.context.streaming:
+            # Post each batch as soon as it fills, while later records are still being read.
+            # We stop reading at the first record that can't be loaded; batches already posted are completed.
+            batches = self.iter_batches(itertools.takewhile(lambda p: p[1] is not None, prepared))
+            first = next(batches, None)
+            if first is None:
+                return
+
+            self.load_batches(create_job(), itertools.chain([first], batches), self.context.batches_in_flight, register_ids)
+        else:
+            # Validate every record before loading any of them.
+            prepared = list(prepared)
+            if len(prepared) == 0 or any(record is None for (original_id, record) in prepared):
+                return
+
+            self.load_batches(create_job(), self.iter_batches(prepared), register_ids=register_ids)
+
+    def load_batches(self, job, batches, window=None, register_ids=True):
+        # Post `batches`, a sequence of (original Ids, payload) pairs, to a Bulk API job and register their results.
+        # Salesforce processes the batches of a job in parallel.
+        # With a `window`, no more than that many batches are in flight at once: results are registered as
+        # batches complete, and the sequence is consumed only as fast as Salesforce processes it.
+        in_flight = []
+        for (original_ids, payload) in batches:
+            while window is not None and len(in_flight) >= window:
+                completed = self.context.batch_monitor.wait_any([batch for (batch, ids) in in_flight])
+                for (batch, ids) in [b for b in in_flight if b[0] in completed]:
+                    self.register_batch_results(job, batch, ids, register_ids)
+                in_flight = [b for b in in_flight if b[0] not in completed]
+
+            batch = self.context.bulk.post_batch(job, payload)
+            self.context.batch_monitor.add(job, batch, len(original_ids))
+            self.context.increment_metric('bulk_payload_bytes', len(payload))
+            self.context.logger.debug('%s: posted batch %s of %d records in %d bytes', self.sobjectname, batch, len(original_ids), len(payload))
+            in_flight.append((batch, original_ids))
+
+        self.context.batch_monitor.wait([batch for (batch, ids) in in_flight])
+        self.context.bulk.close_job(job)
 
-        job = self.context.bulk.create_insert_job(self.sobjectname, contentType='JSON')
-        batches = []
-        for record_batch in BatchIterator(iter(records_to_load)):
-            json_iter = JSONIterator(record_batch)
-            batches.append(self.context.bulk.post_batch(job, json_iter))
+        for (batch, original_ids) in in_flight:
+            self.register_batch_results(job, batch, original_ids, register_ids)
 
-        for batch in batches:
-            self.context.bulk.wait_for_batch(job, batch)
+    def register_batch_results(self, job, batch, original_ids, register_ids=True):
+        # Register the errors in a batch's results and, if `register_ids`, the Ids of the records it created.
+        for (original_id, r) in zip(original_ids, self.context.bulk.get_batch_results(batch, job)):
+            # Results of CSV jobs are strings.
+            if r.success is True or r.success == 'true':
+                if not register_ids:
+                    continue
 
-        self.context.bulk.close_job(job)
-        
-        for batch in batches:
-            for i, r in enumerate(self.context.bulk.get_batch_results(batch, job)):
-                if r.success:
-                    self.context.register_new_id(
-                        self.sobjectname,
-                        SalesforceId(original_ids[i]),
-                        SalesforceId(r.id) # note lowercase in result
-                    )
-                else:
-                    self.context.register_error(
-                        self.sobjectname,
-                        original_ids[i],
-                        self.format_error(r.error)
-                    )
+                self.context.register_new_id(
+                    self.sobjectname,
+                    SalesforceId(original_id),
+                    SalesforceId(r.id) # note lowercase in result
+                )
+            else:
+                self.context.register_error(
+                    self.sobjectname,
+                    original_id,
+                    self.format_error(r.error)
+                )
+
+        self.context.checkpoint()
 
     def format_error(self, error):
+        if isinstance(error, str):
+            return error
+
         return '\n'.join(
             ['{}: {}{}{}'.format(
                 e['statusCode'],
@@ -488,86 +2191,245 @@ class LoadStep(Step):
             csv.DictReader(fh)
         )
 
+    def prepare_dependent_updates(self, reader, all_lookups):
+        # Yield (original Id, record) for each record in our input file that has a dependent or self-lookup
+        # to populate, with the record's new Id. A record that can't be prepared is registered as an error
+        # and yielded as None.
+        (columns, rows) = read_rows(reader, lambda column: column == 'Id' or column in all_lookups)
+        if not columns:
+            return
+
+        id_index = columns.index('Id')
+        lookups = [(index, column) for (index, column) in enumerate(columns) if column != 'Id']
+
+        for chunk in BatchIterator(rows):
+            self.prefetch_lookups(chunk, range(len(columns)))
+
+            for row in chunk:
+                original_id = row[id_index]
+                try:
+                    values = [self.get_value_for_lookup(column, row[index], original_id) for (index, column) in lookups]
+                except AmaxaException as e:
+                    self.context.register_error(self.sobjectname, original_id, str(e))
+                    yield (original_id, None)
+                    continue
+
+                if any(value is not None and value != '' for value in values):
+                    # Populate the new Id for this record
+                    cleaned_record = { 'Id': str(self.context.get_new_id(SalesforceId(original_id))) }
+                    cleaned_record.update(zip((column for (index, column) in lookups), values))
+                    yield (original_id, cleaned_record)
+
     def execute_dependent_updates(self):
-        # Populate dependent and self-lookups in a single pass
-        records_to_load = []
-        original_ids = []
+        # Populate dependent and self-lookups in a single pass, batched like the inserts.
         all_lookups = self.dependent_lookups | self.self_lookups
-        success = True
 
         if len(all_lookups) > 0:
             # Re-check, for each record, whether we have any loading to do.
             # If all of the dependent lookups prove to be dropped outside references, we have no work to do.
             self.reset_input_csv()
             reader = self.context.file_store.get_csv(self.sobjectname, FileType.INPUT)
-            for record in reader:
-                try:
-                    cleaned_record = self.populate_lookups(
-                        self.extract_dependent_lookups(record),
-                        all_lookups,
-                        record['Id']
-                    )
-                    if len(list(filter(lambda r: r is not None and r != '', cleaned_record.values()))) > 1: # 1 for the Id
-                        # Populate the new Id for this record
-                        original_ids.append(cleaned_record['Id'])
-                        cleaned_record['Id'] = str(self.context.get_new_id(SalesforceId(cleaned_record['Id'])))
-                        records_to_load.append(cleaned_record)
-                except AmaxaException as e:
-                    self.context.register_error(self.sobjectname, record['Id'], str(e))
-                    success = False
-            
-            if success and len(records_to_load) > 0:
-                job = self.context.bulk.create_update_job(self.sobjectname, contentType='JSON')
-                json_iter = JSONIterator(records_to_load)
-                batch = self.context.bulk.post_batch(job, json_iter)
-                self.context.bulk.wait_for_batch(job, batch)
-                self.context.bulk.close_job(job)
-
-                for i, r in enumerate(self.context.bulk.get_batch_results(batch, job)):
-                    if not r.success:
-                        self.context.register_error(
-                            self.sobjectname, 
-                            original_ids[i],
-                            self.format_error(r.error)
-                        )
+
+            self.load_records(
+                self.prepare_dependent_updates(reader, all_lookups),
+                lambda: self.context.bulk.create_update_job(self.sobjectname, contentType=self.context.content_type),
+                register_ids=False
+            )
 
 
 class ExtractOperation(Operation):
     def __init__(self, connection):
         super().__init__(connection)
+        # Ids by sObject, as IdSets.
         self.required_ids = {}
         self.extracted_ids = {}
+        self.dependencies_lock = threading.Lock()
         self.mappers = {}
+        self.download_parallelism = 4
+        # Id sets of this size or larger are queried with the Bulk API, rather than the REST API.
+        self.bulk_id_threshold = DEFAULT_BULK_ID_THRESHOLD
+        # In pipeline mode, Bulk API results are fetched and parsed on separate threads,
+        # and each output file is written on its own thread.
+        self.pipeline = False
+        self.pipeline_writers = {}
+        # The number of steps that may run at once. Steps run concurrently only
+        # when there are no lookups between them.
+        self.step_parallelism = 1
 
     def execute(self):
         self.logger.info('Starting extraction with sObjects %s', self.get_sobject_list())
+
+        if self.pipeline:
+            self.start_pipeline()
+        try:
+            if self.step_parallelism > 1:
+                return self.execute_steps_concurrently()
+
+            return self.execute_steps()
+        finally:
+            if self.pipeline:
+                self.finish_pipeline()
+
+    def start_pipeline(self):
+        # Move writing of each output file, and any field mapping, onto its own thread.
+        for sobjectname in self.get_sobject_list():
+            writer = PipelineWriter(
+                self.file_store.get_csv(sobjectname, FileType.OUTPUT),
+                self.get_output_transform(sobjectname),
+                functools.partial(self.record_stage, 'write')
+            )
+            self.pipeline_writers[sobjectname] = writer
+            self.file_store.set_csv(sobjectname, FileType.OUTPUT, writer)
+
+    def finish_pipeline(self):
+        # Wait for all output to be written, raising the first error encountered.
+        error = None
+        for (sobjectname, writer) in self.pipeline_writers.items():
+            self.file_store.set_csv(sobjectname, FileType.OUTPUT, writer.writer)
+            try:
+                writer.close()
+            except Exception as e:
+                error = error or e
+        self.pipeline_writers = {}
+
+        for (stage, unit) in [('fetch', 'bytes'), ('parse', 'records'), ('write', 'records')]:
+            throughput = self.get_stage_throughput(stage)
+            if throughput is not None:
+                self.logger.info(
+                    'Pipeline stage %s: %d %s in %.1f s (%.0f %s/s)',
+                    stage,
+                    self.metrics[stage + '_items'],
+                    unit,
+                    self.metrics[stage + '_seconds'],
+                    throughput,
+                    unit
+                )
+
+        if error is not None:
+            raise error
+
+    def execute_steps(self):
         for s in self.steps:
             self.logger.info('%s: starting extraction', s.sobjectname)
             s.execute()
-            if len(s.errors) > 0:
-                self.logger.error('%s: errors took place during extraction:\n%s', s.sobjectname, '\n'.join(s.errors))
+            if not self.finish_step(s):
                 return -1
-            else:
-                self.logger.info(
-                    '%s: extracted %d record%s',
-                    s.sobjectname,
-                    len(self.get_extracted_ids(s.sobjectname)),
-                    's' if len(self.get_extracted_ids(s.sobjectname)) != 1 else ''
-                )
 
+        self.logger.debug('Extraction metrics: %s', dict(self.metrics))
         return 0
 
+    def execute_steps_concurrently(self):
+        # Run each step once the steps it depends on have completed, up to step_parallelism at a time.
+        # Once any step fails, we start no more steps.
+        dependencies = self.get_step_dependencies()
+        waiting = list(self.steps)
+        completed = set()
+        running = {}
+        failed = False
+
+        self.configure_connection_pool(self.step_parallelism * max(self.query_parallelism, self.download_parallelism))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.step_parallelism) as executor:
+            while True:
+                if not failed:
+                    for s in [s for s in waiting if dependencies[s] <= completed]:
+                        waiting.remove(s)
+                        self.logger.info('%s: starting extraction', s.sobjectname)
+                        running[executor.submit(s.execute)] = s
+
+                if not running:
+                    break
+
+                (done, _) = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    s = running.pop(future)
+                    future.result()
+                    if not self.finish_step(s):
+                        failed = True
+                    completed.add(s)
+
+        if failed:
+            return -1
+
+        self.logger.debug('Extraction metrics: %s', dict(self.metrics))
+        return 0
+
+    def explain(self):
+        # Estimate the cost of each step, without extracting anything.
+        self.initialize()
+        return [s.explain() for s in self.steps]
+
+    def get_api_limits(self):
+        # The org's daily API request and Bulk API batch limits, as (maximum, remaining) pairs.
+        limits = self.connection.limits()
+        bulk = limits.get('DailyBulkApiBatches') or limits.get('DailyBulkApiRequests') or {}
+        api = limits.get('DailyApiRequests', {})
+
+        return {
+            'rest_calls': (api.get('Max'), api.get('Remaining')),
+            'bulk_batches': (bulk.get('Max'), bulk.get('Remaining'))
+        }
+
+    def get_step_dependencies(self):
+        # Map each step to the set of steps that must complete before it starts. If one step has a lookup
+        # to another, the later of the two in the operation may depend on Ids that the earlier extracts
+        # (descendent lookups) or registers as dependencies (dependent lookups), so it must wait for it.
+        sobjects = self.get_sobject_list()
+        steps = { s.sobjectname: s for s in self.steps }
+        dependencies = { s: set() for s in self.steps }
+
+        for s in self.steps:
+            field_map = self.get_field_map(s.sobjectname)
+            for f in s.all_lookups:
+                for target in field_map[f]['referenceTo']:
+                    if target in steps and target != s.sobjectname:
+                        if sobjects.index(target) < sobjects.index(s.sobjectname):
+                            dependencies[s].add(steps[target])
+                        else:
+                            dependencies[steps[target]].add(s)
+
+        return dependencies
+
+    def finish_step(self, s):
+        # Report the outcome of a step, returning False if it failed.
+        # Its extracted Ids are compacted now, before any step that reads them starts,
+        # so that steps running concurrently share a set that no longer changes.
+        if s.sobjectname in self.extracted_ids:
+            self.extracted_ids[s.sobjectname].compact()
+
+        self.logger.debug('%s: extraction used %d queries', s.sobjectname, s.query_count)
+        if len(s.errors) > 0:
+            self.logger.error('%s: errors took place during extraction:\n%s', s.sobjectname, '\n'.join(s.errors))
+            return False
+
+        self.logger.info(
+            '%s: extracted %d record%s',
+            s.sobjectname,
+            len(self.get_extracted_ids(s.sobjectname)),
+            's' if len(self.get_extracted_ids(s.sobjectname)) != 1 else ''
+        )
+        return True
+
+    def get_query_count(self):
+        # The number of REST API queries and Bulk API query batches run so far.
+        return self.metrics['rest_id_queries'] + self.metrics['bulk_query_batches']
+
+    def get_max_query_url_length(self):
+        # The longest URL-encoded query that fits in a REST API query request.
+        return MAX_URL_LENGTH - len(self.connection.base_url + 'query/?q=')
+
     def add_dependency(self, sobjectname, id):
-        if sobjectname not in self.required_ids:
-            self.required_ids[sobjectname] = set()
-        if id not in self.get_extracted_ids(sobjectname):
-            self.required_ids[sobjectname].add(id)
+        # Steps running concurrently may register dependencies for the same sObject.
+        with self.dependencies_lock:
+            if sobjectname not in self.required_ids:
+                self.required_ids[sobjectname] = IdSet()
+            if id not in self.get_extracted_ids(sobjectname):
+                self.required_ids[sobjectname].add(id)
 
     def get_dependencies(self, sobjectname):
-        return self.required_ids[sobjectname] if sobjectname in self.required_ids else set()
+        return self.required_ids[sobjectname] if sobjectname in self.required_ids else IdSet()
 
     def get_sobject_ids_for_reference(self, sobjectname, field):
-        ids = set()
+        ids = IdSet()
         for name in self.get_field_map(sobjectname)[field]['referenceTo']:
             # For each sObject that we've extracted data for,
             # if that object is a potential reference target for this field,
@@ -578,22 +2440,33 @@ class ExtractOperation(Operation):
         return ids
 
     def get_extracted_ids(self, sobjectname):
-        return self.extracted_ids[sobjectname] if sobjectname in self.extracted_ids else set()
+        return self.extracted_ids[sobjectname] if sobjectname in self.extracted_ids else IdSet()
+
+    def get_output_transform(self, sobjectname):
+        # Return the function to apply to records of this sObject before they're written, if any:
+        # its mapper, unless the output writer maps records itself.
+        writer = self.file_store.get_csv(sobjectname, FileType.OUTPUT)
+        if sobjectname not in self.mappers or (isinstance(writer, RecordWriter) and writer.mapper is not None):
+            return None
+
+        return self.mappers[sobjectname].transform_record
 
     def store_result(self, sobjectname, record):
         if sobjectname not in self.extracted_ids:
-            self.extracted_ids[sobjectname] = set()
-
-        if SalesforceId(record['Id']) not in self.extracted_ids[sobjectname]:
-            self.logger.debug('%s: extracting record %s', sobjectname, SalesforceId(record['Id']))
-            self.extracted_ids[sobjectname].add(SalesforceId(record['Id']))
+            self.extracted_ids[sobjectname] = IdSet()
+
+        record_id = SalesforceId(record['Id'])
+        if record_id not in self.extracted_ids[sobjectname]:
+            self.logger.debug('%s: extracting record %s', sobjectname, record_id)
+            self.extracted_ids[sobjectname].add(record_id)
+            # In pipeline mode, the output writer applies the mapper.
+            transform = self.get_output_transform(sobjectname) if not self.pipeline else None
             self.file_store.get_csv(sobjectname, FileType.OUTPUT).writerow(
-                self.mappers[sobjectname].transform_record(record) if sobjectname in self.mappers
-                else record
+                transform(record) if transform is not None else record
             )
 
-        if sobjectname in self.required_ids and SalesforceId(record['Id']) in self.required_ids[sobjectname]:
-            self.required_ids[sobjectname].remove(SalesforceId(record['Id']))
+        if sobjectname in self.required_ids:
+            self.required_ids[sobjectname].discard(record_id)
 
 
 class ExtractionStep(Step):
@@ -605,6 +2478,16 @@ class ExtractionStep(Step):
         self.outside_lookup_behavior = outside_lookup_behavior
         self.lookup_behaviors = {}
         self.errors = []
+        self.pk_chunk_size = None
+        # While tracing self-lookups, the Ids of records first extracted in the current iteration.
+        self.discovered = None
+        self.trace_query_counts = []
+        # Once this step's Bulk API query has run, the Ids of records extracted afterwards.
+        # A semi-join on the query finds the rest of this step's records.
+        self.post_query_ids = None
+        self.result_converter = None
+        self.query_count = 0
+        self.estimated_records = None
 
     def set_lookup_behavior_for_field(self, f, behavior):
         self.lookup_behaviors[f] = behavior
@@ -628,17 +2511,18 @@ class ExtractionStep(Step):
 
             self.context.logger.debug('%s: extracting all records using Bulk API query %s', self.sobjectname, query)
             self.perform_bulk_api_pass(query)
+            self.post_query_ids = set()
             return
         elif self.scope == ExtractionScope.QUERY:
             query = 'SELECT {} FROM {} WHERE {}'.format(self.get_field_list(), self.sobjectname, self.where_clause)
 
             self.context.logger.debug('%s: extracting filtered records using Bulk API query %s', self.sobjectname, query)
             self.perform_bulk_api_pass(query)
+            self.post_query_ids = set()
         elif self.scope == ExtractionScope.DESCENDENTS:
             self.context.logger.debug('%s: extracting descendent records based on lookups %s', self.sobjectname, ', '.join(self.descendent_lookups))
 
-            for f in self.descendent_lookups:
-                self.perform_lookup_pass(f)
+            self.perform_lookup_passes(self.descendent_lookups)
 
         # Fall through to grab all dependencies registered with the context, or SELECTED_RECORDS
         # Note that if we're tracing self-lookups, the parent objects of all extracted records so far
@@ -651,26 +2535,43 @@ class ExtractionStep(Step):
             and self.scope != ExtractionScope.ALL_RECORDS:
             # First we query up to the parents of objects we've already obtained (i.e. the targets of their lookups)
             # Then we query down to the children of all objects obtained.
-            # Then we query parents and children again.
+            # Then we query parents and children of the records found in that iteration - the frontier -
+            # since those of earlier records have already been queried.
             # We repeat until we get back no new Ids, which indicates that all references have been resolved.
 
             # Note that the initial parent query is handled in the dependency pass above, so we start on children.
 
             self.context.logger.debug('%s: recursing to trace self-lookups', self.sobjectname)
 
+            frontier = None
+            self.trace_query_counts = []
+
             while True:
-                before_count = len(self.context.get_extracted_ids(self.sobjectname))
+                queries_before = self.query_count
+                self.discovered = set()
 
                 # Children
-                for l in self.self_lookups:
-                    self.perform_lookup_pass(l)
+                if frontier is None:
+                    self.perform_lookup_passes(self.self_lookups)
+                else:
+                    self.perform_id_field_passes([(l, frontier) for l in sorted(self.self_lookups)])
 
                 # Parents
                 self.resolve_registered_dependencies()
 
-                after_count = len(self.context.get_extracted_ids(self.sobjectname))
+                frontier = self.discovered
+                self.discovered = None
+                self.trace_query_counts.append(self.query_count - queries_before)
 
-                if before_count == after_count:
+                self.context.logger.debug(
+                    '%s: self-lookup iteration %d found %d new records using %d queries',
+                    self.sobjectname,
+                    len(self.trace_query_counts),
+                    len(frontier),
+                    self.trace_query_counts[-1]
+                )
+
+                if len(frontier) == 0:
                     break
 
     def store_result(self, result):
@@ -740,6 +2641,15 @@ class ExtractionStep(Step):
                         )
                     )
 
+        # Track newly-found records while tracing self-lookups, and after our Bulk API query.
+        if self.discovered is not None or self.post_query_ids is not None:
+            record_id = SalesforceId(result['Id'])
+            if record_id not in self.context.get_extracted_ids(self.sobjectname):
+                if self.discovered is not None:
+                    self.discovered.add(record_id)
+                if self.post_query_ids is not None:
+                    self.post_query_ids.add(record_id)
+
         # Finally, call through to the context to store this result.
         self.context.store_result(self.sobjectname, result)
 
@@ -756,59 +2666,327 @@ class ExtractionStep(Step):
             )
 
     def perform_bulk_api_pass(self, query):
+        self.perform_bulk_query_job([query], self.pk_chunk_size)
+
+    def perform_bulk_query_job(self, queries, pk_chunk_size=None):
+        # Run each query as a batch of a single Bulk API query job.
+        self.context.increment_metric('bulk_query_batches', len(queries))
+        self.query_count += len(queries)
         bulk = self.context.bulk
-        job = bulk.create_query_job(self.sobjectname, contentType='JSON')
-        batch = bulk.query(job, query)
+        job = bulk.create_query_job(self.sobjectname, contentType='JSON', pk_chunking=pk_chunk_size or False)
+        batches = [bulk.query(job, query) for query in queries]
         bulk.close_job(job)
 
-        while not bulk.is_batch_done(batch):
-            sleep(5)
-
-        # The JSON Bulk API returns DateTime values as epoch seconds, instead of ISO 8601-format strings.
-        # If we have DateTime fields in our field set, postprocess the result before we store it.
-        date_time_fields = [f for f in self.field_scope if self.context.get_field_map(self.sobjectname)[f]['type'] == 'datetime']
+        if self.result_converter is None:
+            self.result_converter = BulkResultConverter(self.context.get_field_map(self.sobjectname), self.field_scope)
+
+        # As each batch (or, with PK chunking, each chunk's batch) completes, its results are
+        # downloaded and parsed on a thread pool. Parsed records come back to this thread
+        # through a bounded queue to be stored, so that deduplication stays single-threaded.
+        results = queue.Queue(maxsize=10000)
+        cancel = threading.Event()
+        monitor_thread = threading.Thread(
+            target=self.monitor_bulk_batches,
+            args=(job, batches, results, cancel, pk_chunk_size is not None),
+            daemon=True
+        )
+        monitor_thread.start()
 
-        for result in bulk.get_all_results_for_query_batch(batch):
-            result = json.load(result)
-            for rec in result:
-                if len(date_time_fields) > 0:
-                    for f in date_time_fields:
-                        if rec[f] is not None:
-                            # Format the datetime according to Salesforce's particular wants
-                            rec[f] = (datetime.utcfromtimestamp(0) + timedelta(milliseconds=rec[f])).isoformat(timespec='milliseconds') + '+0000'
+        try:
+            while True:
+                rec = results.get()
+                if rec is None:
+                    break
+                elif isinstance(rec, Exception):
+                    raise rec
 
                 self.store_result(rec)
+        finally:
+            cancel.set()
+
+        monitor_thread.join()
+
+    def monitor_bulk_batches(self, job, batches, results, cancel, chunked=False):
+        def put(item):
+            while not cancel.is_set():
+                try:
+                    results.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+
+            return False
+
+        def download(job, batch):
+            # Runs on the thread pool.
+            try:
+                for rec in self.read_bulk_results(job, batch):
+                    if not put(rec):
+                        return
+            except Exception as e:
+                put(e)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.context.download_parallelism)
+        try:
+            for batch in batches:
+                self.context.batch_monitor.add(
+                    job,
+                    batch,
+                    callback=lambda job, batch: executor.submit(download, job, batch),
+                    chunked=chunked
+                )
+            self.context.batch_monitor.wait(batches, cancel)
+        except Exception as e:
+            put(e)
+        finally:
+            executor.shutdown(wait=True)
+
+        put(None)
+
+    def read_bulk_results(self, job, batch):
+        # Convert Date and DateTime values a chunk of records at a time before we store them.
+        for result in self.context.bulk.get_all_results_for_query_batch(batch, job):
+            if not self.context.pipeline:
+                for records in BatchIterator(JSONArrayReader(result), 1000):
+                    yield from self.result_converter.convert(records)
+                continue
+
+            # Fetch the results on another thread while we parse them. Time spent waiting
+            # for data isn't counted against parsing.
+            reader = PrefetchReader(result, functools.partial(self.context.record_stage, 'fetch'))
+            try:
+                chunks = BatchIterator(JSONArrayReader(reader), 1000)
+                while True:
+                    start = monotonic()
+                    wait_time = reader.wait_time
+                    records = next(chunks, None)
+                    if records is None:
+                        break
+                    self.result_converter.convert(records)
+                    self.context.record_stage('parse', len(records), monotonic() - start - (reader.wait_time - wait_time))
+
+                    yield from records
+            finally:
+                reader.close()
 
     def perform_id_field_pass(self, id_field, id_set):
-        query = 'SELECT {} FROM {} WHERE {} IN ({})'
+        self.perform_id_field_passes([(id_field, id_set)])
 
-        if len(id_set) == 0:
-            return
+    def get_id_query_limits(self, id_count):
+        # Return whether to query by `id_count` Ids with the Bulk API, the prefix of
+        # each query, and the limit, if any, on the length of its URL.
+        prefix = 'SELECT {} FROM {}'.format(self.get_field_list(), self.sobjectname)
+
+        if id_count >= self.context.bulk_id_threshold:
+            # Very large Id sets would take a great many REST API calls.
+            # Run the queries instead as batches of one Bulk API job, which Salesforce processes in parallel.
+            return (True, prefix, None)
 
-        ids = id_set.copy()
-        max_len = 4000 - len('WHERE {} IN ()'.format(self.get_field_list()))
+        return (False, prefix, self.context.get_max_query_url_length())
 
-        while len(ids) > 0:
-            id_list = '\'' + str(ids.pop()) + '\''
+    def plan_id_queries(self, field_ids):
+        # Return whether to query by the given (field, Ids) pairs with the Bulk API,
+        # and an iterator over the queries to run.
+        (use_bulk_api, prefix, max_url_length) = self.get_id_query_limits(sum(len(ids) for (field, ids) in field_ids))
 
-            # The maximum length of the WHERE clause is 4,000 characters
-            # Account for the length of the WHERE clause skeleton (above)
-            # and iterate until we can't add another Id.
-            while len(id_list) < max_len - 22 and len(ids) > 0:
-                id_list += ', \'' + str(ids.pop()) + '\''
+        return (use_bulk_api, iter_id_queries(prefix, field_ids, max_url_length=max_url_length))
 
-            results = self.context.connection.query_all(
-                query.format(self.get_field_list(), self.sobjectname, id_field, id_list)
+    def perform_id_field_passes(self, field_ids):
+        # Extract the records whose value in each field is one of the accompanying Ids,
+        # given as (field, Ids) pairs, combining fields into as few queries as possible.
+        field_ids = [(field, ids) for (field, ids) in field_ids if len(ids) > 0]
+        id_count = sum(len(ids) for (field, ids) in field_ids)
+
+        if id_count == 0:
+            return
+
+        (use_bulk_api, queries) = self.plan_id_queries(field_ids)
+        queries = list(queries)
+
+        if use_bulk_api:
+            self.context.logger.info(
+                '%s: querying %d Ids in %s with the Bulk API (%d batches)',
+                self.sobjectname,
+                id_count,
+                ', '.join(field for (field, ids) in field_ids),
+                len(queries)
             )
+            self.context.increment_metric('bulk_id_jobs')
+            self.context.increment_metric('bulk_id_batches', len(queries))
+            self.perform_bulk_query_job(queries)
+            return
+
+        self.context.increment_metric('rest_id_queries', len(queries))
+        self.query_count += len(queries)
 
+        # The queries run concurrently, but we store their results on this thread.
+        for results in self.context.query_all_concurrently(queries):
             for rec in results.get('records'):
                 self.store_result(rec)
 
+    def get_semi_join(self, field):
+        # If the only records `field` may reference in this operation are those of an earlier
+        # ALL_RECORDS or QUERY step, return a semi-join condition selecting the records that
+        # reference that step's query results, and the step. Otherwise, return None.
+        sobjects = self.context.get_sobject_list()
+        targets = [
+            name for name in self.context.get_field_map(self.sobjectname)[field]['referenceTo']
+            if name in sobjects and sobjects.index(name) <= sobjects.index(self.sobjectname)
+        ]
+        # SOQL doesn't allow semi-joins against the same sObject or combined with OR.
+        if len(targets) != 1 or targets[0] == self.sobjectname:
+            return None
+
+        step = self.context.steps[sobjects.index(targets[0])]
+        if step.scope not in [ExtractionScope.ALL_RECORDS, ExtractionScope.QUERY]:
+            return None
+
+        subquery = 'SELECT Id FROM {}'.format(step.sobjectname)
+        if step.scope == ExtractionScope.QUERY:
+            subquery += ' WHERE {}'.format(step.where_clause)
+
+        return ('{} IN ({})'.format(field, subquery), step)
+
+    def use_semi_join(self, parent_records):
+        # A semi-join runs as a Bulk API job. For fewer parent records than would send an
+        # Id query to the Bulk API, querying by Id with the REST API is cheaper.
+        return parent_records is None or parent_records >= self.context.bulk_id_threshold
+
+    def perform_semi_join_pass(self, field):
+        # Extract the records that `field` relates to our parent's query results with a semi-join,
+        # if possible and worthwhile, and return the Ids of the parent's records that remain to be
+        # queried, those extracted after its query. Otherwise, return None.
+        semi_join = self.get_semi_join(field)
+        if semi_join is None or semi_join[1].post_query_ids is None:
+            return None
+
+        (condition, step) = semi_join
+        parent_records = len(self.context.get_extracted_ids(step.sobjectname))
+        if parent_records == 0:
+            # No record can reference our parent's, so there's nothing to query.
+            return IdSet()
+        if not self.use_semi_join(parent_records):
+            return None
+
+        remaining_ids = step.post_query_ids
+        query = 'SELECT {} FROM {} WHERE {}'.format(self.get_field_list(), self.sobjectname, condition)
+
+        # Let Salesforce select the records that reference our parent's query results,
+        # instead of sending it their Ids.
+        self.context.logger.debug('%s: extracting records by %s using Bulk API query %s', self.sobjectname, field, query)
+        try:
+            self.perform_bulk_query_job([query])
+        except salesforce_bulk.salesforce_bulk.BulkBatchFailed as e:
+            # Not every WHERE clause is valid in a semi-join. Fall back to querying by Id.
+            self.context.logger.warning(
+                '%s: unable to query by %s using a semi-join (%s); querying by Id instead',
+                self.sobjectname,
+                field,
+                e.state_message
+            )
+            return None
+
+        self.context.increment_metric('semi_join_passes')
+        return remaining_ids
+
     def perform_lookup_pass(self, field):
-        self.perform_id_field_pass(
-            field,
-            self.context.get_sobject_ids_for_reference(self.sobjectname, field)
-        )
+        self.perform_lookup_passes([field])
+
+    def count_records(self, condition=None):
+        query = 'SELECT COUNT() FROM {}'.format(self.sobjectname)
+        if condition is not None:
+            query += ' WHERE {}'.format(condition)
+
+        return self.context.connection.query(query)['totalSize']
+
+    def explain(self):
+        # Estimate the records this step will extract and the API calls it will make,
+        # without extracting anything, by planning its queries as execute() does.
+        # Records found by resolving dependencies and tracing self-lookups depend on the data
+        # extracted, and aren't included. None marks a figure that can't be estimated.
+        plan = {
+            'sobject': self.sobjectname,
+            'scope': self.scope.value,
+            'records': 0,
+            'rest_calls': 0,
+            'bulk_batches': 0,
+            'methods': []
+        }
+
+        if self.scope in [ExtractionScope.ALL_RECORDS, ExtractionScope.QUERY]:
+            plan['records'] = self.count_records(self.where_clause if self.scope == ExtractionScope.QUERY else None)
+            plan['bulk_batches'] = 1
+            if self.pk_chunk_size is not None:
+                # Salesforce adds a batch for each chunk of Ids.
+                plan['bulk_batches'] += max(1, math.ceil(plan['records'] / self.pk_chunk_size))
+                plan['methods'].append('Bulk API query with PK chunking')
+            else:
+                plan['methods'].append('Bulk API query')
+        elif self.scope == ExtractionScope.DESCENDENTS:
+            sobjects = self.context.get_sobject_list()
+            field_counts = []
+            for f in sorted(self.descendent_lookups):
+                semi_join = self.get_semi_join(f)
+                if semi_join is not None and self.use_semi_join(semi_join[1].estimated_records):
+                    plan['records'] = _add_estimates(plan['records'], self.count_records(semi_join[0]))
+                    plan['bulk_batches'] += 1
+                    plan['methods'].append('Bulk API semi-join on {}'.format(f))
+                    continue
+
+                # We can't count records by Id without the Ids. Count the queries
+                # for as many Ids as the parent steps expect to extract.
+                plan['records'] = None
+                parent_records = 0
+                for name in self.context.get_field_map(self.sobjectname)[f]['referenceTo']:
+                    if name in sobjects and sobjects.index(name) < sobjects.index(self.sobjectname):
+                        parent_records = _add_estimates(parent_records, self.context.steps[sobjects.index(name)].estimated_records)
+
+                if parent_records is None:
+                    plan['methods'].append('query by {}'.format(f))
+                    plan['rest_calls'] = None
+                else:
+                    field_counts.append((f, parent_records))
+
+            self.explain_id_queries(plan, field_counts)
+        elif self.scope == ExtractionScope.SELECTED_RECORDS:
+            ids = self.context.get_dependencies(self.sobjectname)
+            plan['records'] = len(ids)
+            self.explain_id_queries(plan, [('Id', len(ids))])
+
+        self.estimated_records = plan['records']
+        return plan
+
+    def explain_id_queries(self, plan, field_counts):
+        # Add the queries for the given (field, number of Ids) pairs to the plan.
+        field_counts = [(field, count) for (field, count) in field_counts if count > 0]
+        if len(field_counts) == 0:
+            return
+
+        (use_bulk_api, prefix, max_url_length) = self.get_id_query_limits(sum(count for (field, count) in field_counts))
+        count = count_id_queries(prefix, field_counts, max_url_length=max_url_length)
+        fields = ', '.join(field for (field, count) in field_counts)
+
+        if use_bulk_api:
+            plan['bulk_batches'] = _add_estimates(plan['bulk_batches'], count)
+            plan['methods'].append('Bulk API query by {}'.format(fields))
+        else:
+            plan['rest_calls'] = _add_estimates(plan['rest_calls'], count)
+            plan['methods'].append('REST API query by {}'.format(fields))
+
+    def perform_lookup_passes(self, fields):
+        # Fields whose referents can't be selected with a semi-join are queried together by Id.
+        field_ids = []
+        for field in sorted(fields):
+            ids = self.perform_semi_join_pass(field)
+            if ids is None:
+                ids = self.context.get_sobject_ids_for_reference(self.sobjectname, field)
+            field_ids.append((field, ids))
+
+        self.perform_id_field_passes(field_ids)
+
+
+def _add_estimates(a, b):
+    return a + b if a is not None and b is not None else None
 
 
 class DataMapper(object):
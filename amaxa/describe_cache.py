@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import tempfile
+from email.utils import formatdate
+from urllib.parse import urlparse
+
+GLOBAL_DESCRIBE = '_global' # sObject API names cannot begin with an underscore.
+
+class DescribeCache(object):
+    # An on-disk cache of global and sObject describe results, keyed by org Id and API version.
+    # Entries younger than `ttl` seconds are used without contacting Salesforce. Older entries
+    # are revalidated with a conditional (If-Modified-Since) request, and only downloaded again
+    # if the describe has changed.
+    def __init__(self, path, ttl=24 * 60 * 60):
+        self.path = path
+        self.ttl = ttl
+
+    def get_org_path(self, connection):
+        # Session Ids begin with the 15-character Id of the org that issued them.
+        session_id = connection.session_id
+        org = session_id.split('!')[0] if '!' in session_id else urlparse(connection.base_url).hostname
+
+        return os.path.join(self.path, '{}-v{}'.format(org, connection.sf_version))
+
+    def get_entry_path(self, connection, name):
+        return os.path.join(self.get_org_path(connection), name + '.json')
+
+    def read_entry(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, path, entry):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and rename, so that concurrent runs never see a partial entry.
+        (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def request(self, connection, url, headers):
+        all_headers = dict(connection.headers)
+        all_headers.update(headers)
+
+        return connection.session.request('GET', url, headers=all_headers)
+
+    def get(self, connection, name, url, fetch):
+        path = self.get_entry_path(connection, name)
+        entry = self.read_entry(path)
+        now = time.time()
+
+        if entry is not None:
+            if now - entry['fetched'] < self.ttl:
+                return entry['describe']
+
+            result = self.request(
+                connection,
+                url,
+                { 'If-Modified-Since': entry['last-modified'] or formatdate(entry['fetched'], usegmt=True) }
+            )
+            if result.status_code == 304:
+                entry['fetched'] = now
+                self.write_entry(path, entry)
+                return entry['describe']
+        else:
+            result = self.request(connection, url, {})
+
+        if result.status_code == 200:
+            describe = result.json()
+            last_modified = result.headers.get('Last-Modified')
+        else:
+            # Let simple_salesforce raise its usual exception for this failure.
+            describe = fetch()
+            last_modified = None
+
+        self.write_entry(
+            path,
+            {
+                'fetched': now,
+                'last-modified': last_modified,
+                'describe': describe
+            }
+        )
+
+        return describe
+
+    def get_global_describe(self, connection):
+        return self.get(
+            connection,
+            GLOBAL_DESCRIBE,
+            connection.base_url + 'sobjects',
+            connection.describe
+        )
+
+    def get_sobject_describe(self, connection, sobjectname):
+        return self.get(
+            connection,
+            sobjectname,
+            connection.base_url + 'sobjects/{}/describe'.format(sobjectname),
+            getattr(connection, sobjectname).describe
+        )
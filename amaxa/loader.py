@@ -74,8 +74,11 @@ def load_load_operation(incoming, context, resume = False):
     if incoming is None:
         return (None, errors)
     
+    # Describe every sObject in the operation concurrently while we wait for the global describe.
+    context.prefetch_describes([entry['sobject'] for entry in incoming['operation']])
+
     try:
-        global_describe = { entry['name']: entry for entry in context.connection.describe()["sobjects"] }
+        global_describe = { entry['name']: entry for entry in context.get_global_describe()["sobjects"] }
     except Exception as e:
         errors.append('Unable to authenticate to Salesforce: {}'.format(e))
         return (None, errors)
@@ -276,16 +279,20 @@ def load_load_operation(incoming, context, resume = False):
 
     return (context, [])
 
-def load_extraction_operation(incoming, context):
+def load_extraction_operation(incoming, context, open_files=True):
     # Inbound is raw, deserialized structures from JSON or YAML input files.
     # First, validate them against our schema and normalize them.
+    # If `open_files` is False, the operation is only to be explained, and we leave its output files alone.
 
     (incoming, errors) = validate_extraction_schema(incoming)
     if incoming is None:
         return (None, errors)
     
+    # Describe every sObject in the operation concurrently while we wait for the global describe.
+    context.prefetch_describes([entry['sobject'] for entry in incoming['operation']])
+
     try:
-        global_describe = { entry['name']: entry for entry in context.connection.describe()["sobjects"] }
+        global_describe = { entry['name']: entry for entry in context.get_global_describe()["sobjects"] }
     except Exception as e:
         errors.append('Unable to authenticate to Salesforce: {}'.format(e))
         return (None, errors)
@@ -416,6 +423,9 @@ def load_extraction_operation(incoming, context):
         # Populate expected lookup behaviors
         for l in lookup_behaviors:
             step.set_lookup_behavior_for_field(l, lookup_behaviors[l])
+
+        if to_extract.get('pk-chunking'):
+            step.pk_chunk_size = to_extract.get('pk-chunk-size', amaxa.DEFAULT_PK_CHUNK_SIZE)
         
         context.add_step(step)
 
@@ -425,17 +435,21 @@ def load_extraction_operation(incoming, context):
 
     if len(errors) > 0:
         return (None, errors)
+
+    if not open_files:
+        return (context, [])
     
     # Open all of the output files
-    # Create DictWriters and populate them in the context
+    # Create RecordWriters, which apply any mapper, and populate them in the context
     for (s, e) in zip(context.steps, incoming['operation']):
         try:
             f = open(e['file'], 'w')
-            fieldnames = s.field_scope if s.sobjectname not in context.mappers else [context.mappers[s.sobjectname].transform_key(k) for k in s.field_scope]
-            output = csv.DictWriter(
+            mapper = context.mappers.get(s.sobjectname)
+            fieldnames = s.field_scope if mapper is None else [mapper.transform_key(k) for k in s.field_scope]
+            output = amaxa.RecordWriter(
                 f,
                 fieldnames = sorted(fieldnames, key=lambda x: x if x != 'Id' else ' Id'),
-                extrasaction='ignore'
+                mapper=mapper
             )
             output.writeheader()
             context.file_store.set_file(s.sobjectname, amaxa.FileType.OUTPUT, f)
@@ -612,6 +626,16 @@ def get_operation_schema(is_extract = True):
                                 'schema': {
                                     'type': 'string'
                                 }
+                            },
+                            'pk-chunking': {
+                                'type': 'boolean',
+                                'excludes': ['descendents', 'ids']
+                            },
+                            'pk-chunk-size': {
+                                'type': 'integer',
+                                'min': 1,
+                                'max': 250000,
+                                'dependencies': ['pk-chunking']
                             }
                         }
                     },
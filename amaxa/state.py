@@ -1,9 +1,111 @@
+import io
+import os
+import itertools
+import struct
 import yaml
 import json
+import logging
 import cerberus
 from . import amaxa
 
+# The state journal is an append-only text file. After a header line, each line is
+# a single record: `S <stage>` for a stage transition, or `I <old Id> <new Id>`
+# for a newly-registered record Id. Later records supersede earlier ones.
+JOURNAL_HEADER = 'amaxa-state-journal 1'
+STAGE_RECORD = 'S'
+ID_RECORD = 'I'
+ID_RECORD_LENGTH = 40 # 'I ' + 18 + ' ' + 18 + newline
+ID_RECORD_FORMAT = struct.Struct('2x18s1x18s1x')
+REPLAY_CHUNK_SIZE = 1000000
+
+class StateJournal(object):
+    def __init__(self, f):
+        self.file = f
+
+    def write_header(self):
+        self.file.write(JOURNAL_HEADER + '\n')
+
+    def record_stage(self, stage):
+        self.file.write('{} {}\n'.format(STAGE_RECORD, stage.value))
+
+    def record_new_id(self, old_id, new_id):
+        self.file.write('{} {} {}\n'.format(ID_RECORD, str(old_id), str(new_id)))
+
+    def sync(self):
+        self.file.flush()
+        try:
+            fd = self.file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # In-memory streams have nothing to sync.
+            return
+
+        os.fsync(fd)
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+def open_journal(operation, path, append=False):
+    # When appending to the journal we resumed from, the operation's state is already
+    # on disk. Otherwise, start a new journal with a snapshot of the current state.
+    if append:
+        f = open(path, 'a+')
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            # Terminate any record torn by a crash so that it's skipped on replay.
+            f.seek(f.tell() - 1)
+            if f.read(1) != '\n':
+                f.write('\n')
+        journal = StateJournal(f)
+    else:
+        journal = StateJournal(open(path, 'w'))
+        journal.write_header()
+        journal.record_stage(operation.stage)
+        for (old_id, new_id) in operation.global_id_map.items():
+            journal.record_new_id(old_id, new_id)
+
+    journal.sync()
+    return journal
+
+def replay_journal(operation, journal_data):
+    # Replays a state journal (less its header line) onto the operation.
+    # Id records are read in chunks, each packed into a sorted run, and the runs
+    # are merged into the Id map in a single pass. Records torn by a crash are skipped.
+    stages = amaxa.LoadStage.values_dict()
+    stage = operation.stage
+    skipped = 0
+    runs = []
+
+    while True:
+        lines = list(itertools.islice(journal_data, REPLAY_CHUNK_SIZE))
+        if not lines:
+            break
+
+        id_lines = [line for line in lines if len(line) == ID_RECORD_LENGTH and line[0] == ID_RECORD]
+        try:
+            runs.append(amaxa.IdMap.pack_run(ID_RECORD_FORMAT.iter_unpack(''.join(id_lines).encode('ascii'))))
+        except ValueError as e:
+            return (None, ['Invalid Salesforce Id in state journal: {}'.format(str(e))])
+
+        for line in lines:
+            if len(line) == ID_RECORD_LENGTH and line[0] == ID_RECORD:
+                continue
+            elif line[0:1] == STAGE_RECORD and line[2:].rstrip('\n') in stages:
+                stage = stages[line[2:].rstrip('\n')]
+            elif line.strip() != '':
+                skipped += 1
+
+    if skipped > 0:
+        logging.getLogger('amaxa').warning('Skipped %d incomplete records in state journal', skipped)
+
+    operation.stage = stage
+    operation.global_id_map = amaxa.IdMap.from_runs(runs)
+
+    return (operation, [])
+
 def save_state(operation, json_mode = False):
+    # Writes a one-shot YAML or JSON snapshot of the operation's state. Loads
+    # journal their state as they run (see open_journal()); load_state() accepts either.
     output = {
         'version': 1,
         'state': {
@@ -15,11 +117,18 @@ def save_state(operation, json_mode = False):
     return yaml.dump(output) if not json_mode else json.dumps(output)
 
 def load_state(operation, state_data, json_mode = False):
+    if not json_mode and hasattr(state_data, 'readline'):
+        header = state_data.readline()
+        if header.rstrip('\n') == JOURNAL_HEADER:
+            return replay_journal(operation, state_data)
+
+        state_data = header + state_data.read()
+
     (state, errors) = validate_state_schema(yaml.safe_load(state_data) if not json_mode else json.load(state_data))
 
     if len(errors) == 0:
         operation.stage = amaxa.LoadStage.values_dict()[state['state']['stage']]
-        operation.global_id_map = { amaxa.SalesforceId(k): amaxa.SalesforceId(v) for k, v in state['state']['id-map'].items() }
+        operation.global_id_map = amaxa.IdMap(state['state']['id-map'])
 
         return (operation, [])
     
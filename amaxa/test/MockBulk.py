@@ -0,0 +1,20 @@
+import json
+from unittest.mock import Mock
+
+def mock_batch_states(bulk_proxy, *states):
+    # Report the batches created by a mock Bulk API proxy's post_batch() and query()
+    # as passing through `states` on successive polls, remaining in the last state.
+    states = list(states) or ['Completed']
+
+    def get_batch_list(job):
+        state = states.pop(0) if len(states) > 1 else states[0]
+        return [
+            { 'id': bulk_proxy.post_batch.return_value, 'state': state, 'numberRecordsProcessed': 0 },
+            { 'id': bulk_proxy.query.return_value, 'state': state, 'numberRecordsProcessed': 0 }
+        ]
+
+    bulk_proxy.get_batch_list = Mock(side_effect=get_batch_list)
+
+def posted_records(bulk_proxy):
+    # Decode the records of each batch posted through a mock Bulk API proxy's post_batch().
+    return [json.loads(c[0][1]) for c in bulk_proxy.post_batch.call_args_list]
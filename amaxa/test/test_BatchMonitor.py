@@ -0,0 +1,201 @@
+import unittest
+import threading
+from unittest.mock import Mock, patch
+from salesforce_bulk.salesforce_bulk import BulkBatchFailed
+from .. import amaxa
+
+
+def batch_info(batch, state, processed=0):
+    return { 'id': batch, 'state': state, 'numberRecordsProcessed': processed }
+
+def lock_is_free(lock):
+    # Whether another thread could take the lock now.
+    acquired = []
+    def try_acquire():
+        acquired.append(lock.acquire(blocking=False))
+        if acquired[0]:
+            lock.release()
+
+    t = threading.Thread(target=try_acquire)
+    t.start()
+    t.join()
+    return acquired[0]
+
+class test_BatchMonitor(unittest.TestCase):
+    def test_polls_each_job_once(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=lambda job: {
+            'job1': [batch_info('b1', 'Completed'), batch_info('b2', 'InProgress'), batch_info('other', 'Completed')],
+            'job2': [batch_info('b3', 'Completed')]
+        }[job])
+        monitor = amaxa.BatchMonitor(bulk)
+
+        monitor.add('job1', 'b1')
+        monitor.add('job1', 'b2')
+        monitor.add('job2', 'b3')
+
+        self.assertEqual(['b1', 'b3'], monitor.poll())
+        self.assertEqual(2, bulk.get_batch_list.call_count)
+        self.assertEqual(['b2'], list(monitor.outstanding))
+
+    def test_wait_polls_only_awaited_jobs(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=lambda job: {
+            'job1': [batch_info('b1', 'Completed')],
+            'job2': [batch_info('b2', 'Failed')]
+        }[job])
+        monitor = amaxa.BatchMonitor(bulk)
+
+        monitor.add('job1', 'b1')
+        monitor.add('job2', 'b2')
+
+        # Another thread waiting on job2 sees its failure; this one doesn't.
+        monitor.wait(['b1'])
+        bulk.get_batch_list.assert_called_once_with('job1')
+        self.assertEqual(['b2'], list(monitor.outstanding))
+
+    def test_calls_callbacks_on_completion(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=[
+            [batch_info('b1', 'InProgress'), batch_info('b2', 'Queued')],
+            [batch_info('b1', 'Completed'), batch_info('b2', 'InProgress')],
+            [batch_info('b1', 'Completed'), batch_info('b2', 'Completed')]
+        ])
+        callback = Mock()
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1', callback=callback)
+        monitor.add('job', 'b2', callback=callback)
+
+        monitor.poll()
+        callback.assert_not_called()
+        monitor.poll()
+        callback.assert_called_once_with('job', 'b1')
+        monitor.poll()
+        callback.assert_called_with('job', 'b2')
+
+    def test_releases_lock_for_requests_and_callbacks(self):
+        bulk = Mock()
+        monitor = amaxa.BatchMonitor(bulk)
+        def get_batch_list(job):
+            self.assertTrue(lock_is_free(monitor.lock))
+            return [batch_info('b1', 'Completed')]
+        bulk.get_batch_list = Mock(side_effect=get_batch_list)
+
+        def callback(job, batch):
+            self.assertTrue(lock_is_free(monitor.lock))
+            # The batch remains outstanding until its callback returns, and another poll doesn't complete it again.
+            self.assertIn('b1', monitor.outstanding)
+            self.assertEqual([], monitor.poll())
+        callback = Mock(side_effect=callback)
+        monitor.add('job', 'b1', callback=callback)
+
+        self.assertEqual(['b1'], monitor.poll())
+        callback.assert_called_once_with('job', 'b1')
+        self.assertEqual(2, bulk.get_batch_list.call_count)
+        self.assertEqual({}, monitor.outstanding)
+
+    def test_backs_off_without_progress(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(return_value=[batch_info('b1', 'Queued')])
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1')
+
+        intervals = []
+        for i in range(20):
+            monitor.poll()
+            intervals.append(monitor.interval)
+
+        self.assertEqual(sorted(intervals), intervals)
+        self.assertLess(amaxa.BatchMonitor.MIN_INTERVAL, intervals[0])
+        self.assertEqual(amaxa.BatchMonitor.MAX_INTERVAL, intervals[-1])
+
+        monitor.add('job', 'b2')
+        self.assertEqual(amaxa.BatchMonitor.MIN_INTERVAL, monitor.interval)
+
+    @patch('amaxa.amaxa.monotonic')
+    def test_estimates_completion_from_record_counts(self, monotonic_mock):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(return_value=[batch_info('b1', 'InProgress', 2000)])
+        monotonic_mock.return_value = 100
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1', 10000)
+
+        # 2,000 records in 4 seconds: 8,000 remain, at 500 per second.
+        monotonic_mock.return_value = 104
+        monitor.poll()
+
+        self.assertEqual(16, monitor.interval)
+
+    def test_raises_for_failed_batches(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(return_value=[
+            { 'id': 'b1', 'state': 'Failed', 'stateMessage': 'InvalidBatch' }
+        ])
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1')
+
+        with self.assertRaises(BulkBatchFailed):
+            monitor.wait()
+
+        self.assertEqual({}, monitor.outstanding)
+
+    @patch('amaxa.amaxa.sleep')
+    def test_wait_polls_until_batches_complete(self, sleep_mock):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=[
+            [batch_info('b1', 'Queued'), batch_info('b2', 'Queued')],
+            [batch_info('b1', 'Completed'), batch_info('b2', 'InProgress')],
+        ])
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1')
+        monitor.add('job', 'b2')
+
+        monitor.wait(['b1'])
+
+        self.assertEqual(2, bulk.get_batch_list.call_count)
+        sleep_mock.assert_called_once_with(amaxa.BatchMonitor.MIN_INTERVAL * amaxa.BatchMonitor.BACKOFF)
+        self.assertEqual(['b2'], list(monitor.outstanding))
+
+    @patch('amaxa.amaxa.sleep')
+    def test_wait_any_returns_first_completed_batches(self, sleep_mock):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=[
+            [batch_info('b1', 'Queued'), batch_info('b2', 'InProgress'), batch_info('b3', 'Queued')],
+            [batch_info('b1', 'InProgress'), batch_info('b2', 'Completed'), batch_info('b3', 'Queued')],
+        ])
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1')
+        monitor.add('job', 'b2')
+        monitor.add('job', 'b3')
+
+        self.assertEqual(['b2'], monitor.wait_any(['b1', 'b2']))
+        self.assertEqual(2, bulk.get_batch_list.call_count)
+        sleep_mock.assert_called_once()
+        self.assertEqual(['b1', 'b3'], list(monitor.outstanding))
+
+    def test_tracks_chunks_of_chunked_batches(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(side_effect=[
+            [batch_info('b1', 'InProgress')],
+            [batch_info('b1', 'NotProcessed'), batch_info('c1', 'Completed'), batch_info('c2', 'InProgress')],
+            [batch_info('b1', 'NotProcessed'), batch_info('c1', 'Completed'), batch_info('c2', 'Completed')]
+        ])
+        callback = Mock()
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1', callback=callback, chunked=True)
+
+        self.assertEqual([], monitor.poll())
+        self.assertEqual(['c1'], monitor.poll())
+        callback.assert_called_once_with('job', 'c1')
+        self.assertEqual(['c2', 'b1'], monitor.poll())
+        callback.assert_called_with('job', 'c2')
+        self.assertEqual({}, monitor.outstanding)
+
+    def test_raises_for_unchunked_batches_not_processed(self):
+        bulk = Mock()
+        bulk.get_batch_list = Mock(return_value=[batch_info('b1', 'NotProcessed')])
+        monitor = amaxa.BatchMonitor(bulk)
+        monitor.add('job', 'b1')
+
+        with self.assertRaises(BulkBatchFailed):
+            monitor.poll()
@@ -0,0 +1,117 @@
+import unittest
+import io
+import csv
+import json
+from unittest.mock import patch
+from .. import amaxa
+
+
+class test_BatchSerializer(unittest.TestCase):
+    records = [
+        { 'Name': 'Caprica Steel', 'Description': 'Steel, "tempered"\nand rolled', 'ParentId': None },
+        { 'Name': 'Gemenon Gastronomícs', 'Description': '', 'ParentId': '001000000000000AAA' }
+    ]
+
+    def test_serializes_json(self):
+        serializer = amaxa.BatchSerializer()
+
+        payload = serializer.serialize(self.records)
+
+        self.assertIsInstance(payload, bytes)
+        self.assertEqual(json.loads(json.dumps(self.records)), json.loads(payload))
+
+    def test_serializes_json_without_orjson(self):
+        with patch.object(amaxa, 'orjson', None):
+            payload = amaxa.BatchSerializer().serialize(self.records)
+
+        self.assertEqual(self.records, json.loads(payload))
+
+    def test_serializes_csv(self):
+        serializer = amaxa.BatchSerializer('CSV')
+
+        payload = serializer.serialize(self.records)
+
+        self.assertEqual(
+            [
+                ['Name', 'Description', 'ParentId'],
+                ['Caprica Steel', 'Steel, "tempered"\nand rolled', '#N/A'],
+                ['Gemenon Gastronomícs', '', '001000000000000AAA']
+            ],
+            list(csv.reader(io.StringIO(payload.decode('utf-8'))))
+        )
+
+    def test_rejects_csv_records_with_other_fields(self):
+        mismatched = [
+            { 'Name': 'Picon Fleet' },
+            { 'Name': 'Picon Fleet', 'Description': '', 'ParentId': None, 'Industry': 'Defense' },
+            { 'Name': 'Picon Fleet', 'Description': '', 'Industry': 'Defense' }
+        ]
+
+        for record in mismatched:
+            serializer = amaxa.BatchSerializer('CSV')
+            with self.assertRaises(amaxa.AmaxaException):
+                serializer.serialize(self.records + [record])
+
+            serializer.start(self.records[0])
+            with self.assertRaises(amaxa.AmaxaException):
+                serializer.encode(record)
+
+            with self.assertRaises(amaxa.AmaxaException):
+                list(serializer.iter_batches(enumerate(self.records + [record])))
+
+    def test_serializes_empty_batches(self):
+        self.assertEqual([], json.loads(amaxa.BatchSerializer().serialize([])))
+
+    def test_reports_payload_size_incrementally(self):
+        for content_type in ['JSON', 'CSV']:
+            serializer = amaxa.BatchSerializer(content_type)
+
+            size = serializer.start(self.records[0])
+            encoded = []
+            for record in self.records:
+                (e, n) = serializer.encode(record)
+                encoded.append(e)
+                size += n
+
+            self.assertEqual(len(serializer.get_payload(encoded)), size)
+            self.assertEqual(serializer.serialize(self.records), serializer.get_payload(encoded))
+
+    def test_rejects_unknown_content_types(self):
+        with self.assertRaises(amaxa.AmaxaException):
+            amaxa.BatchSerializer('XML')
+
+    def test_iter_batches_limits_records(self):
+        serializer = amaxa.BatchSerializer()
+        records = [{ 'Name': 'Account {}'.format(i) } for i in range(25)]
+
+        batches = list(serializer.iter_batches(enumerate(records), max_records=10))
+
+        self.assertEqual([10, 10, 5], [len(keys) for (keys, payload) in batches])
+        self.assertEqual(list(range(25)), [k for (keys, payload) in batches for k in keys])
+        self.assertEqual(records, [r for (keys, payload) in batches for r in json.loads(payload)])
+
+    def test_iter_batches_limits_bytes(self):
+        records = [{ 'Name': 'Account {}'.format(i), 'Description': 'x' * (i * 10) } for i in range(50)]
+
+        for content_type in ['JSON', 'CSV']:
+            serializer = amaxa.BatchSerializer(content_type)
+
+            batches = list(serializer.iter_batches(enumerate(records), max_bytes=2000))
+
+            self.assertGreater(len(batches), 1)
+            self.assertEqual(list(range(50)), [k for (keys, payload) in batches for k in keys])
+            for (keys, payload) in batches:
+                self.assertLessEqual(len(payload), 2000)
+                self.assertEqual(serializer.serialize([records[k] for k in keys]), payload)
+            # Each batch is filled before the next is begun.
+            for (batch, following) in zip(batches, batches[1:]):
+                self.assertGreater(len(batch[1]) + len(json.dumps(records[following[0][0]])), 2000)
+
+    def test_iter_batches_posts_oversized_records_alone(self):
+        serializer = amaxa.BatchSerializer()
+        records = [{ 'Name': 'A' }, { 'Name': 'x' * 200 }, { 'Name': 'B' }]
+
+        batches = list(serializer.iter_batches(enumerate(records), max_bytes=100))
+
+        self.assertEqual([[0], [1], [2]], [keys for (keys, payload) in batches])
+        self.assertEqual(records[1:2], json.loads(batches[1][1]))
@@ -0,0 +1,46 @@
+import unittest
+import random
+from datetime import datetime, timedelta
+from .. import amaxa
+
+class test_BulkResultConverter(unittest.TestCase):
+    def setUp(self):
+        self.field_map = {
+            'Id': { 'name': 'Id', 'type': 'id' },
+            'Name': { 'name': 'Name', 'type': 'string' },
+            'Amount': { 'name': 'Amount', 'type': 'currency' },
+            'CloseDate': { 'name': 'CloseDate', 'type': 'date' },
+            'CreatedDate': { 'name': 'CreatedDate', 'type': 'datetime' }
+        }
+
+    def test_compiles_date_and_datetime_columns(self):
+        converter = amaxa.BulkResultConverter(self.field_map, ['Id', 'Name', 'Amount', 'CloseDate', 'CreatedDate'])
+
+        self.assertEqual(['CloseDate', 'CreatedDate'], [f for (f, c) in converter.columns])
+
+    def test_converts_records(self):
+        converter = amaxa.BulkResultConverter(self.field_map, ['Id', 'Amount', 'CloseDate', 'CreatedDate'])
+        records = [
+            { 'Id': '006000000000001', 'Amount': 1.5, 'CloseDate': 1546646400000, 'CreatedDate': 1546659665000 },
+            { 'Id': '006000000000002', 'Amount': None, 'CloseDate': None, 'CreatedDate': None }
+        ]
+
+        self.assertEqual(
+            [
+                { 'Id': '006000000000001', 'Amount': 1.5, 'CloseDate': '2019-01-05', 'CreatedDate': '2019-01-05T03:41:05.000+0000' },
+                { 'Id': '006000000000002', 'Amount': None, 'CloseDate': None, 'CreatedDate': None }
+            ],
+            converter.convert(records)
+        )
+
+    def test_converts_datetimes_like_timedelta(self):
+        converter = amaxa.BulkResultConverter(self.field_map, ['CreatedDate'])
+        rng = random.Random(0)
+        values = [0, -1, 999, 1000, 86399999, 86400000, -86400001, 253402300799999] + \
+            [rng.randrange(-2208988800000, 4102444800000) for i in range(10000)]
+
+        for value in values:
+            self.assertEqual(
+                (datetime.utcfromtimestamp(0) + timedelta(milliseconds=value)).isoformat(timespec='milliseconds') + '+0000',
+                converter.convert_datetime(value)
+            )
@@ -0,0 +1,127 @@
+import unittest
+import os
+import json
+import tempfile
+from unittest.mock import Mock, patch
+from .. import amaxa
+from ..describe_cache import DescribeCache
+
+
+def mock_connection():
+    connection = Mock()
+    connection.session_id = '00D000000000001!AQ0AQ'
+    connection.sf_version = '46.0'
+    connection.base_url = 'https://example.my.salesforce.com/services/data/v46.0/'
+    connection.headers = { 'Authorization': 'Bearer 00D000000000001!AQ0AQ' }
+
+    return connection
+
+def mock_response(status_code, body=None, last_modified=None):
+    return Mock(
+        status_code=status_code,
+        json=Mock(return_value=body),
+        headers={ 'Last-Modified': last_modified } if last_modified is not None else {}
+    )
+
+class test_DescribeCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DescribeCache(self.directory.name, ttl=60)
+        self.connection = mock_connection()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fetches_and_stores_describe(self):
+        self.connection.session.request.return_value = mock_response(200, { 'fields': [] }, 'Sat, 01 Jun 2019 00:00:00 GMT')
+
+        self.assertEqual({ 'fields': [] }, self.cache.get_sobject_describe(self.connection, 'Account'))
+
+        self.connection.session.request.assert_called_once_with(
+            'GET',
+            'https://example.my.salesforce.com/services/data/v46.0/sobjects/Account/describe',
+            headers={ 'Authorization': 'Bearer 00D000000000001!AQ0AQ' }
+        )
+        path = os.path.join(self.directory.name, '00D000000000001-v46.0', 'Account.json')
+        with open(path, 'r') as f:
+            entry = json.load(f)
+        self.assertEqual({ 'fields': [] }, entry['describe'])
+        self.assertEqual('Sat, 01 Jun 2019 00:00:00 GMT', entry['last-modified'])
+
+    def test_uses_fresh_entries_without_requests(self):
+        self.connection.session.request.return_value = mock_response(200, { 'sobjects': [] })
+
+        self.cache.get_global_describe(self.connection)
+        self.connection.session.request.reset_mock()
+
+        self.assertEqual({ 'sobjects': [] }, self.cache.get_global_describe(self.connection))
+        self.connection.session.request.assert_not_called()
+
+    @patch('amaxa.describe_cache.time.time')
+    def test_revalidates_stale_entries(self, time_mock):
+        time_mock.return_value = 1000
+        self.connection.session.request.return_value = mock_response(200, { 'fields': [] }, 'Sat, 01 Jun 2019 00:00:00 GMT')
+        self.cache.get_sobject_describe(self.connection, 'Account')
+
+        time_mock.return_value = 2000
+        self.connection.session.request.reset_mock()
+        self.connection.session.request.return_value = mock_response(304)
+
+        self.assertEqual({ 'fields': [] }, self.cache.get_sobject_describe(self.connection, 'Account'))
+        self.assertEqual(
+            'Sat, 01 Jun 2019 00:00:00 GMT',
+            self.connection.session.request.call_args[1]['headers']['If-Modified-Since']
+        )
+
+        # The revalidated entry is fresh again.
+        self.connection.session.request.reset_mock()
+        time_mock.return_value = 2030
+        self.cache.get_sobject_describe(self.connection, 'Account')
+        self.connection.session.request.assert_not_called()
+
+    @patch('amaxa.describe_cache.time.time')
+    def test_replaces_modified_entries(self, time_mock):
+        time_mock.return_value = 1000
+        self.connection.session.request.return_value = mock_response(200, { 'fields': [] })
+        self.cache.get_sobject_describe(self.connection, 'Account')
+
+        time_mock.return_value = 2000
+        self.connection.session.request.return_value = mock_response(200, { 'fields': [{ 'name': 'Id' }] })
+
+        self.assertEqual(
+            { 'fields': [{ 'name': 'Id' }] },
+            self.cache.get_sobject_describe(self.connection, 'Account')
+        )
+
+    def test_falls_back_to_connection_on_errors(self):
+        self.connection.session.request.return_value = mock_response(401)
+        self.connection.Account.describe.side_effect = Exception('INVALID_SESSION_ID')
+
+        with self.assertRaises(Exception):
+            self.cache.get_sobject_describe(self.connection, 'Account')
+
+        self.connection.Account.describe.assert_called_once_with()
+
+    def test_keys_entries_by_org_and_api_version(self):
+        self.connection.session.request.return_value = mock_response(200, { 'sobjects': [] })
+        self.cache.get_global_describe(self.connection)
+
+        other = mock_connection()
+        other.sf_version = '47.0'
+        other.session.request.return_value = mock_response(200, { 'sobjects': [{ 'name': 'Account' }] })
+
+        self.assertEqual({ 'sobjects': [{ 'name': 'Account' }] }, self.cache.get_global_describe(other))
+        other.session.request.assert_called_once()
+
+    def test_operation_uses_describe_cache(self):
+        op = amaxa.Operation(self.connection)
+        op.describe_cache = Mock()
+        op.describe_cache.get_global_describe.return_value = { 'sobjects': [{ 'name': 'Account', 'keyPrefix': '001' }] }
+        op.describe_cache.get_sobject_describe.return_value = { 'fields': [{ 'name': 'Id' }] }
+
+        self.assertEqual('Account', op.get_sobject_name_for_id('001000000000000'))
+        self.assertEqual({ 'Id': { 'name': 'Id' } }, op.get_field_map('Account'))
+
+        op.describe_cache.get_global_describe.assert_called_once_with(self.connection)
+        op.describe_cache.get_sobject_describe.assert_called_once_with(self.connection, 'Account')
+        self.connection.describe.assert_not_called()
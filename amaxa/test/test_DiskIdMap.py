@@ -0,0 +1,130 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import Mock
+from .. import amaxa
+
+
+def make_id(prefix, i):
+    return amaxa.SalesforceId('{}{:012d}'.format(prefix, i))
+
+class test_DiskIdMap(unittest.TestCase):
+    def setUp(self):
+        self.id_map = amaxa.DiskIdMap(cache_size=10, write_batch_size=5)
+
+    def tearDown(self):
+        self.id_map.close()
+
+    def test_maps_ids(self):
+        self.id_map[amaxa.SalesforceId('001000000000000')] = amaxa.SalesforceId('001000000000001')
+
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), self.id_map.get(amaxa.SalesforceId('001000000000000')))
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), self.id_map['001000000000000'])
+        self.assertIn(amaxa.SalesforceId('001000000000000'), self.id_map)
+        self.assertIsNone(self.id_map.get(amaxa.SalesforceId('001000000000002')))
+        self.assertNotIn(amaxa.SalesforceId('001000000000002'), self.id_map)
+        self.assertEqual(1, len(self.id_map))
+
+    def test_retains_entries_beyond_cache_size(self):
+        self.id_map.update((make_id('001', i), make_id('a01', i)) for i in range(100))
+
+        self.assertEqual(100, len(self.id_map))
+        for i in range(100):
+            self.assertEqual(make_id('a01', i), self.id_map.get(make_id('001', i)))
+        self.assertLessEqual(len(self.id_map._cache), 10)
+        self.assertEqual(
+            { make_id('001', i): make_id('a01', i) for i in range(100) },
+            dict(self.id_map.items())
+        )
+
+    def test_updates_cached_entries(self):
+        self.id_map[make_id('001', 1)] = make_id('a01', 1)
+        self.id_map.flush()
+        self.assertEqual(make_id('a01', 1), self.id_map.get(make_id('001', 1)))
+        self.assertIsNone(self.id_map.get(make_id('001', 2)))
+
+        self.id_map[make_id('001', 1)] = make_id('a01', 3)
+        self.id_map[make_id('001', 2)] = make_id('a01', 2)
+        self.id_map.flush()
+
+        self.assertEqual(make_id('a01', 3), self.id_map.get(make_id('001', 1)))
+        self.assertEqual(make_id('a01', 2), self.id_map.get(make_id('001', 2)))
+
+    def test_prefetch_batches_queries(self):
+        self.id_map.update((make_id('001', i), make_id('a01', i)) for i in range(1000))
+        self.id_map.flush()
+
+        db = self.id_map._db
+        self.id_map._db = Mock(wraps=db)
+        keys = [make_id('001', i) for i in range(600)] + ['001000000000999', 'bad']
+        self.id_map.prefetch(keys)
+
+        # 601 valid keys take two queries
+        self.assertEqual(2, self.id_map._db.execute.call_count)
+        self.id_map._db.execute.reset_mock()
+        for i in range(600):
+            self.assertEqual(make_id('a01', i), self.id_map.get(make_id('001', i)))
+        self.id_map._db.execute.assert_not_called()
+
+        # The cache stays within its bound.
+        self.assertEqual(10, self.id_map.cache_size)
+        self.assertLessEqual(len(self.id_map._cache), 10)
+
+    def test_prefetch_replaces_working_set(self):
+        self.id_map.update((make_id('001', i), make_id('a01', i)) for i in range(100))
+        self.id_map.flush()
+
+        self.id_map.prefetch(make_id('001', i) for i in range(50))
+        self.id_map.prefetch(make_id('001', i) for i in range(50, 60))
+
+        self.assertEqual(10, len(self.id_map._working))
+        self.assertEqual(make_id('a01', 5), self.id_map.get(make_id('001', 5)))
+
+    def test_get_many_returns_values_in_order(self):
+        self.id_map.update((make_id('001', i), make_id('a01', i)) for i in range(50))
+
+        self.assertEqual(
+            [make_id('a01', 3), None, make_id('a01', 49)],
+            self.id_map.get_many([make_id('001', 3), make_id('001', 60), make_id('001', 49)])
+        )
+
+    def test_close_removes_temporary_file(self):
+        id_map = amaxa.DiskIdMap()
+        path = id_map.path
+        self.assertTrue(os.path.exists(path))
+
+        id_map.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_initializes_from_id_map(self):
+        source = amaxa.IdMap()
+        source.update((make_id('001', i), make_id('a01', i)) for i in range(20))
+
+        id_map = amaxa.DiskIdMap(items=source)
+        try:
+            self.assertEqual(source, id_map)
+        finally:
+            id_map.close()
+
+    def test_discards_existing_entries_in_file(self):
+        (fd, path) = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            id_map = amaxa.DiskIdMap(path)
+            id_map[make_id('001', 1)] = make_id('a01', 1)
+            id_map.flush()
+            id_map.close()
+
+            source = amaxa.IdMap()
+            source[make_id('001', 2)] = make_id('a01', 2)
+            id_map = amaxa.DiskIdMap(path, source)
+            try:
+                self.assertIsNone(id_map.get(make_id('001', 1)))
+                self.assertEqual(make_id('a01', 2), id_map.get(make_id('001', 2)))
+                self.assertEqual(1, len(id_map))
+            finally:
+                id_map.close()
+
+            self.assertTrue(os.path.exists(path))
+        finally:
+            os.remove(path)
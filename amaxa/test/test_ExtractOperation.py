@@ -1,4 +1,7 @@
 import unittest
+import threading
+import io
+import csv
 from unittest.mock import Mock, MagicMock, PropertyMock, patch
 from .. import amaxa
 from .MockFileStore import MockFileStore
@@ -19,6 +22,149 @@ class test_ExtractOperation(unittest.TestCase):
             s.execute.assert_called_once_with()
             self.assertEqual(oc, s.context)
     
+    def test_execute_writes_output_through_pipeline(self):
+        connection = Mock()
+        oc = amaxa.ExtractOperation(connection)
+        oc.pipeline = True
+        output = io.StringIO()
+        oc.file_store.set_csv('Account', amaxa.FileType.OUTPUT, csv.DictWriter(output, ['Id', 'Name'], lineterminator='\n'))
+        oc.mappers['Account'] = amaxa.DataMapper(field_transforms={ 'Name': [lambda x: x.upper()] })
+
+        step = Mock(sobjectname='Account', errors=[])
+        step.execute = Mock(side_effect=lambda: [
+            oc.store_result('Account', { 'Id': '001000000000000', 'Name': 'Caprica Steel' }),
+            oc.store_result('Account', { 'Id': '001000000000001', 'Name': 'Picon Fleet Headquarters' })
+        ])
+        oc.add_step(step)
+
+        self.assertEqual(0, oc.execute())
+
+        self.assertEqual('001000000000000,CAPRICA STEEL\n001000000000001,PICON FLEET HEADQUARTERS\n', output.getvalue())
+        self.assertIsInstance(oc.file_store.get_csv('Account', amaxa.FileType.OUTPUT), csv.DictWriter)
+        self.assertEqual(2, oc.metrics['write_items'])
+        self.assertIsNotNone(oc.get_stage_throughput('write'))
+
+    def test_store_result_maps_records_once_through_record_writer(self):
+        for pipeline in [False, True]:
+            connection = Mock()
+            oc = amaxa.ExtractOperation(connection)
+            oc.pipeline = pipeline
+            oc.mappers['Account'] = amaxa.DataMapper({ 'Name': 'Account Name' }, { 'Name': [lambda x: x + '!'] })
+            output = io.StringIO()
+            oc.file_store.set_csv(
+                'Account',
+                amaxa.FileType.OUTPUT,
+                amaxa.RecordWriter(output, ['Account Name', 'Id'], mapper=oc.mappers['Account'], lineterminator='\n')
+            )
+
+            step = Mock(sobjectname='Account', errors=[])
+            step.execute = Mock(side_effect=lambda: [
+                oc.store_result('Account', { 'Id': '001000000000000', 'Name': 'Caprica Steel' })
+            ])
+            oc.add_step(step)
+
+            self.assertEqual(0, oc.execute())
+
+            self.assertIsNone(oc.get_output_transform('Account'))
+            self.assertEqual('Caprica Steel!,001000000000000\n', output.getvalue())
+
+    def get_concurrent_operation(self):
+        # Contact looks up to Account; Product2 and Pricebook2 have no lookups to either.
+        connection = Mock()
+        oc = amaxa.ExtractOperation(connection)
+        oc.step_parallelism = 3
+        oc.get_field_map = Mock(side_effect=lambda sobjectname: {
+            'Account': {},
+            'Product2': {},
+            'Pricebook2': {},
+            'Contact': {
+                'AccountId': {
+                    'name': 'AccountId',
+                    'type': 'reference',
+                    'referenceTo': ['Account']
+                }
+            }
+        }[sobjectname])
+
+        for (sobjectname, lookups) in [('Account', set()), ('Product2', set()), ('Pricebook2', set()), ('Contact', set(['AccountId']))]:
+            oc.add_step(Mock(sobjectname=sobjectname, errors=[], all_lookups=lookups, query_count=0))
+
+        return oc
+
+    def test_get_step_dependencies_follows_lookups(self):
+        oc = self.get_concurrent_operation()
+        (account, product, pricebook, contact) = oc.steps
+
+        self.assertEqual(
+            {
+                account: set(),
+                product: set(),
+                pricebook: set(),
+                contact: set([account])
+            },
+            oc.get_step_dependencies()
+        )
+
+    def test_execute_runs_independent_steps_concurrently(self):
+        oc = self.get_concurrent_operation()
+        (account, product, pricebook, contact) = oc.steps
+        barrier = threading.Barrier(3, timeout=5)
+        order = []
+
+        account.execute = Mock(side_effect=lambda: [barrier.wait(), order.append('Account')])
+        product.execute = Mock(side_effect=lambda: [barrier.wait(), order.append('Product2')])
+        pricebook.execute = Mock(side_effect=lambda: [barrier.wait(), order.append('Pricebook2')])
+        contact.execute = Mock(side_effect=lambda: order.append('Contact'))
+
+        self.assertEqual(0, oc.execute())
+
+        self.assertEqual(4, len(order))
+        self.assertLess(order.index('Account'), order.index('Contact'))
+
+    def test_execute_concurrently_shares_compacted_parent_ids(self):
+        # Contact and Opportunity both look up to Account, and run together once it's extracted.
+        connection = Mock()
+        oc = amaxa.ExtractOperation(connection)
+        oc.step_parallelism = 2
+        oc.file_store = MockFileStore()
+        lookup = { 'AccountId': { 'name': 'AccountId', 'type': 'reference', 'referenceTo': ['Account'] } }
+        oc.get_field_map = Mock(side_effect=lambda sobjectname: lookup if sobjectname != 'Account' else {})
+
+        account = Mock(sobjectname='Account', errors=[], all_lookups=set(), query_count=0)
+        account.execute = Mock(side_effect=lambda: [
+            oc.store_result('Account', { 'Id': '001{:012d}'.format(i) }) for i in range(5000)
+        ])
+        barrier = threading.Barrier(2, timeout=5)
+        read = {}
+
+        def read_parent_ids(sobjectname):
+            barrier.wait()
+            # The parent's Ids were compacted before either step started.
+            self.assertFalse(oc.extracted_ids['Account']._added)
+            read[sobjectname] = [len(oc.get_sobject_ids_for_reference(sobjectname, 'AccountId')) for i in range(20)]
+
+        oc.add_step(account)
+        for sobjectname in ['Contact', 'Opportunity']:
+            step = Mock(sobjectname=sobjectname, errors=[], all_lookups=set(['AccountId']), query_count=0)
+            step.execute = Mock(side_effect=lambda sobjectname=sobjectname: read_parent_ids(sobjectname))
+            oc.add_step(step)
+
+        self.assertEqual(0, oc.execute())
+
+        self.assertEqual({ 'Contact': [5000] * 20, 'Opportunity': [5000] * 20 }, read)
+        self.assertEqual(5000, len(oc.extracted_ids['Account']))
+        self.assertEqual(set(amaxa.SalesforceId('001{:012d}'.format(i)) for i in range(5000)), set(oc.extracted_ids['Account']))
+
+    def test_execute_concurrently_stops_after_failed_step(self):
+        oc = self.get_concurrent_operation()
+        (account, product, pricebook, contact) = oc.steps
+        account.errors = ['Failure']
+
+        self.assertEqual(-1, oc.execute())
+
+        account.execute.assert_called_once_with()
+        contact.execute.assert_not_called()
+
     def test_add_dependency_tracks_dependencies(self):
         connection = Mock()
 
@@ -113,3 +259,20 @@ class test_ExtractOperation(unittest.TestCase):
 
         self.assertEqual(set([amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('003000000000000')]),
                          oc.get_sobject_ids_for_reference('Account', 'Lookup__c'))
+
+    def test_get_api_limits_returns_daily_limits(self):
+        connection = Mock()
+        connection.limits = Mock(return_value={
+            'DailyApiRequests': { 'Max': 15000, 'Remaining': 14000 },
+            'DailyBulkApiRequests': { 'Max': 10000, 'Remaining': 9990 }
+        })
+
+        oc = amaxa.ExtractOperation(connection)
+
+        self.assertEqual(
+            {
+                'rest_calls': (15000, 14000),
+                'bulk_batches': (10000, 9990)
+            },
+            oc.get_api_limits()
+        )
@@ -1,7 +1,11 @@
 import unittest
 import json
+import re
 from unittest.mock import Mock, MagicMock, PropertyMock, patch
 from salesforce_bulk.util import IteratorBytesIO
+from salesforce_bulk.salesforce_bulk import BulkBatchFailed
+from .MockBulk import mock_batch_states
+from .MockFileStore import MockFileStore
 from .. import amaxa
 
 
@@ -270,6 +274,50 @@ class test_ExtractionStep(unittest.TestCase):
         step.store_result({'Id': '003000000000001', 'AccountId': '001000000000001'})
         oc.store_result.assert_called_once_with('Contact', {'Id': '003000000000001', 'AccountId': '001000000000001'})
 
+    def test_store_result_handles_null_lookups_with_extracted_ids(self):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+
+        oc.file_store = MockFileStore()
+        oc.add_dependency = Mock()
+        oc.get_field_map = Mock(return_value={
+            'AccountId': {
+                'name': 'AccountId',
+                'type': 'reference',
+                'referenceTo': ['Account']
+            },
+            'LastName': {
+                'name': 'Name',
+                'type': 'string'
+            }
+        })
+        oc.get_sobject_list = Mock(return_value=['Account', 'Contact'])
+        oc.store_result('Account', {'Id': '001000000000001'})
+
+        step = amaxa.ExtractionStep(
+            'Contact',
+            amaxa.ExtractionScope.DESCENDENTS,
+            ['AccountId'],
+            outside_lookup_behavior=amaxa.OutsideLookupBehavior.DROP_FIELD
+        )
+
+        oc.add_step(step)
+        step.initialize()
+
+        for value in [None, '']:
+            step.store_result({'Id': '003000000000001', 'AccountId': value})
+        step.store_result({'Id': '003000000000002', 'AccountId': '001000000000001'})
+
+        self.assertEqual(
+            [
+                unittest.mock.call({'Id': '003000000000001'}),
+                unittest.mock.call({'Id': '003000000000002', 'AccountId': '001000000000001'})
+            ],
+            oc.file_store.get_csv('Contact', amaxa.FileType.OUTPUT).writerow.call_args_list
+        )
+        self.assertEqual([], step.errors)
+
     def test_store_result_discriminates_polymorphic_lookup_type(self):
         connection = Mock()
 
@@ -322,14 +370,137 @@ class test_ExtractionStep(unittest.TestCase):
         oc.add_step(step)
         step.initialize()
 
-        step.perform_id_field_pass = Mock()
+        step.perform_id_field_passes = Mock()
         step.perform_lookup_pass('Lookup__c')
 
         oc.get_sobject_ids_for_reference.assert_called_once_with('Account', 'Lookup__c')
-        step.perform_id_field_pass.assert_called_once_with('Lookup__c', set([amaxa.SalesforceId('001000000000000')]))
+        step.perform_id_field_passes.assert_called_once_with([('Lookup__c', set([amaxa.SalesforceId('001000000000000')]))])
+
+    def _get_semi_join_operation(self, parent_scope, where_clause=None):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(side_effect=lambda sobjectname: {
+            'Account': {
+                'Name': {
+                    'name': 'Name',
+                    'type': 'string'
+                }
+            },
+            'Contact': {
+                'AccountId': {
+                    'name': 'AccountId',
+                    'type': 'reference',
+                    'referenceTo': ['Account']
+                }
+            }
+        }[sobjectname])
+
+        parent = amaxa.ExtractionStep('Account', parent_scope, ['Name'], where_clause)
+        oc.add_step(parent)
+        step = amaxa.ExtractionStep('Contact', amaxa.ExtractionScope.DESCENDENTS, ['AccountId'])
+        oc.add_step(step)
+        parent.initialize()
+        step.initialize()
+
+        oc.extracted_ids['Account'] = set([amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002')])
+        step.perform_bulk_query_job = Mock()
+        step.perform_id_field_passes = Mock()
+
+        return (oc, parent, step)
+
+    def test_perform_lookup_pass_uses_semi_join_for_query_parent(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.QUERY, 'Name = \'ACME\'')
+        oc.bulk_id_threshold = 2
+        parent.post_query_ids = set([amaxa.SalesforceId('001000000000002')])
+
+        step.perform_lookup_pass('AccountId')
+
+        step.perform_bulk_query_job.assert_called_once_with(
+            ['SELECT AccountId FROM Contact WHERE AccountId IN (SELECT Id FROM Account WHERE Name = \'ACME\')']
+        )
+        # Records extracted after the parent's query are still queried by Id.
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', set([amaxa.SalesforceId('001000000000002')]))])
+        self.assertEqual(1, oc.metrics['semi_join_passes'])
+
+    def test_perform_lookup_pass_uses_semi_join_for_all_records_parent(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.ALL_RECORDS)
+        oc.bulk_id_threshold = 2
+        parent.post_query_ids = set()
+
+        step.perform_lookup_pass('AccountId')
+
+        step.perform_bulk_query_job.assert_called_once_with(
+            ['SELECT AccountId FROM Contact WHERE AccountId IN (SELECT Id FROM Account)']
+        )
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', set())])
+
+    def test_perform_lookup_pass_queries_few_parents_by_id(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.QUERY, 'Name = \'ACME\'')
+        oc.bulk_id_threshold = 3
+        parent.post_query_ids = set()
+
+        step.perform_lookup_pass('AccountId')
+
+        # Two parent records take one REST API query, which is cheaper than a Bulk API job.
+        step.perform_bulk_query_job.assert_not_called()
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', oc.extracted_ids['Account'])])
+        self.assertEqual(0, oc.metrics['semi_join_passes'])
+
+    def test_perform_lookup_pass_skips_query_without_parents(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.QUERY, 'Name = \'ACME\'')
+        oc.extracted_ids['Account'] = amaxa.IdSet()
+        parent.post_query_ids = set()
+
+        step.perform_lookup_pass('AccountId')
+
+        step.perform_bulk_query_job.assert_not_called()
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', set())])
+
+    def test_perform_lookup_pass_does_not_use_semi_join_for_descendent_parent(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.DESCENDENTS)
+
+        step.perform_lookup_pass('AccountId')
+
+        step.perform_bulk_query_job.assert_not_called()
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', oc.extracted_ids['Account'])])
+
+    def test_perform_lookup_pass_falls_back_when_semi_join_fails(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.QUERY, 'Name = \'ACME\'')
+        oc.bulk_id_threshold = 2
+        parent.post_query_ids = set()
+        step.perform_bulk_query_job.side_effect = BulkBatchFailed('075000000000000AAA', 'batch', 'MALFORMED_QUERY', 'Failed')
+
+        step.perform_lookup_pass('AccountId')
+
+        step.perform_id_field_passes.assert_called_once_with([('AccountId', oc.extracted_ids['Account'])])
+        self.assertEqual(0, oc.metrics['semi_join_passes'])
+
+    def test_store_result_tracks_records_extracted_after_query(self):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.file_store = Mock()
+        oc.get_field_map = Mock(return_value={
+            'Name': {
+                'name': 'Name',
+                'type': 'string'
+            }
+        })
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.QUERY, ['Name'], 'Name = \'ACME\'')
+        step.perform_bulk_api_pass = Mock(side_effect=lambda q: step.store_result({ 'Id': '001000000000001', 'Name': 'ACME' }))
+        step.resolve_registered_dependencies = Mock(side_effect=lambda: step.store_result({ 'Id': '001000000000002', 'Name': 'Parent' }))
+        oc.add_step(step)
+        step.initialize()
+
+        step.execute()
+
+        self.assertEqual(set([amaxa.SalesforceId('001000000000002')]), step.post_query_ids)
 
     def test_perform_id_field_pass_queries_all_records(self):
         connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
         connection.query_all = Mock(side_effect=lambda x: { 'records': [{ 'Id': '001000000000001'}] })
 
         oc = amaxa.ExtractOperation(connection)
@@ -365,6 +536,7 @@ class test_ExtractionStep(unittest.TestCase):
 
     def test_perform_id_field_pass_stores_results(self):
         connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
         connection.query_all = Mock(side_effect=lambda x: { 'records': [{ 'Id': '001000000000001'}, { 'Id': '001000000000002'}] })
 
         oc = amaxa.ExtractOperation(connection)
@@ -385,6 +557,111 @@ class test_ExtractionStep(unittest.TestCase):
         step.store_result.assert_any_call(connection.query_all('Account')['records'][0])
         step.store_result.assert_any_call(connection.query_all('Account')['records'][1])
 
+    def test_perform_id_field_pass_counts_rest_queries(self):
+        connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        connection.query_all = Mock(side_effect=lambda x: { 'records': [] })
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'Lookup__c': {
+                'name': 'Lookup__c',
+                'type': 'reference',
+                'referenceTo': ['Account']
+            }
+        })
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.ALL_RECORDS, ['Lookup__c'])
+        oc.add_step(step)
+        step.initialize()
+
+        step.perform_id_field_pass('Lookup__c', set([amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002')]))
+
+        self.assertEqual(1, oc.metrics['rest_id_queries'])
+        self.assertEqual(0, oc.metrics['bulk_id_jobs'])
+
+    @patch('amaxa.ExtractOperation.bulk', new_callable=PropertyMock())
+    def test_perform_id_field_pass_uses_bulk_api_above_threshold(self, bulk_proxy):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.bulk_id_threshold = 300
+        oc.get_field_map = Mock(return_value={
+            'Lookup__c': {
+                'name': 'Lookup__c',
+                'type': 'reference',
+                'referenceTo': ['Account']
+            }
+        })
+        retval = [{ 'Id': '001000000000001'}, { 'Id': '001000000000002'}]
+        bulk_proxy.create_query_job = Mock(return_value='075000000000000AAA')
+        bulk_proxy.query = Mock(side_effect=['batch1', 'batch2'])
+        bulk_proxy.get_batch_list = Mock(return_value=[
+            { 'id': 'batch1', 'state': 'Completed' },
+            { 'id': 'batch2', 'state': 'Completed' }
+        ])
+        bulk_proxy.get_all_results_for_query_batch = Mock(
+            side_effect=lambda batch, job: [IteratorBytesIO([json.dumps(retval if batch == 'batch1' else []).encode('utf-8')])]
+        )
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.ALL_RECORDS, ['Lookup__c'])
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        id_set = set(amaxa.SalesforceId('001000000000' + str(i + 1).zfill(3)) for i in range(300))
+        step.perform_id_field_pass('Lookup__c', id_set)
+
+        connection.query_all.assert_not_called()
+        bulk_proxy.create_query_job.assert_called_once_with('Account', contentType='JSON', pk_chunking=False)
+        self.assertEqual(2, bulk_proxy.query.call_count)
+        total = 0
+        for call in bulk_proxy.query.call_args_list:
+            self.assertEqual('075000000000000AAA', call[0][0])
+            self.assertLess(len(call[0][1]) - call[0][1].find('WHERE'), 4000)
+            total += call[0][1].count('\'001')
+        self.assertEqual(300, total)
+        self.assertEqual(2, bulk_proxy.get_all_results_for_query_batch.call_count)
+        step.store_result.assert_any_call(retval[0])
+        step.store_result.assert_any_call(retval[1])
+        self.assertEqual(1, oc.metrics['bulk_id_jobs'])
+        self.assertEqual(2, oc.metrics['bulk_id_batches'])
+        self.assertEqual(0, oc.metrics['rest_id_queries'])
+
+    def test_perform_lookup_passes_combines_fields(self):
+        connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        connection.query_all = Mock(side_effect=lambda x: { 'records': [{ 'Id': '003000000000001'}] })
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'AccountId': {
+                'name': 'AccountId',
+                'type': 'reference',
+                'referenceTo': ['Account']
+            },
+            'Household__c': {
+                'name': 'Household__c',
+                'type': 'reference',
+                'referenceTo': ['Account']
+            }
+        })
+        oc.get_sobject_ids_for_reference = Mock(return_value=set([amaxa.SalesforceId('001000000000001')]))
+
+        step = amaxa.ExtractionStep('Contact', amaxa.ExtractionScope.DESCENDENTS, ['AccountId', 'Household__c'])
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        step.perform_lookup_passes(set(['AccountId', 'Household__c']))
+
+        connection.query_all.assert_called_once_with(
+            'SELECT AccountId, Household__c FROM Contact WHERE AccountId IN (\'001000000000001AAA\') '
+            'OR Household__c IN (\'001000000000001AAA\')'
+        )
+        step.store_result.assert_called_once_with({ 'Id': '003000000000001'})
+        self.assertEqual(1, oc.get_query_count())
+
     def test_perform_id_field_pass_ignores_empty_set(self):
         connection = Mock()
 
@@ -417,7 +694,7 @@ class test_ExtractionStep(unittest.TestCase):
             }
         })
         retval = [{ 'Id': '001000000000001'}, { 'Id': '001000000000002'}]
-        bulk_proxy.is_batch_done = Mock(side_effect=[False, True])
+        mock_batch_states(bulk_proxy, 'InProgress', 'Completed')
         bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
         bulk_proxy.get_all_results_for_query_batch = Mock(
             return_value = [IteratorBytesIO([json.dumps(retval).encode('utf-8')])]
@@ -444,7 +721,7 @@ class test_ExtractionStep(unittest.TestCase):
             }
         })
         retval = [{ 'Id': '001000000000001'}, { 'Id': '001000000000002'}]
-        bulk_proxy.is_batch_done = Mock(side_effect=[False, True])
+        mock_batch_states(bulk_proxy, 'InProgress', 'Completed')
         bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
         bulk_proxy.get_all_results_for_query_batch = Mock(
             return_value = [IteratorBytesIO([json.dumps(retval).encode('utf-8')])]
@@ -480,7 +757,7 @@ class test_ExtractionStep(unittest.TestCase):
             ])
 
 
-        bulk_proxy.is_batch_done = Mock(side_effect=[False, True])
+        mock_batch_states(bulk_proxy, 'InProgress', 'Completed')
         bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
         bulk_proxy.get_all_results_for_query_batch = Mock(
             return_value = [IteratorBytesIO([json.dumps(chunk).encode('utf-8')]) for chunk in retval]
@@ -506,7 +783,7 @@ class test_ExtractionStep(unittest.TestCase):
             }
         })
         retval = [{ 'Id': '001000000000001', 'CreatedDate': 1546659665000}]
-        bulk_proxy.is_batch_done = Mock(side_effect=[False, True])
+        mock_batch_states(bulk_proxy, 'InProgress', 'Completed')
         bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
         bulk_proxy.get_all_results_for_query_batch = Mock(
             return_value = [IteratorBytesIO([json.dumps(retval).encode('utf-8')])]
@@ -525,6 +802,136 @@ class test_ExtractionStep(unittest.TestCase):
             }
         )
 
+    @patch('amaxa.ExtractOperation.bulk', new_callable=PropertyMock())
+    def test_perform_bulk_api_pass_pipelines_fetch_and_parse(self, bulk_proxy):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.pipeline = True
+        oc.get_field_map = Mock(return_value={
+            'CreatedDate': {
+                'name': 'CreatedDate',
+                'type': 'datetime'
+            }
+        })
+        retval = [{ 'Id': '001000000000{:03d}'.format(i), 'CreatedDate': 1546659665000} for i in range(500)]
+        data = json.dumps(retval).encode('utf-8')
+        mock_batch_states(bulk_proxy, 'Completed')
+        bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
+        bulk_proxy.get_all_results_for_query_batch = Mock(
+            return_value = [IteratorBytesIO([data[i:i + 100] for i in range(0, len(data), 100)])]
+        )
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.QUERY, ['CreatedDate'])
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        step.perform_bulk_api_pass('SELECT Id, CreatedDate FROM Account')
+
+        self.assertEqual(
+            [dict(r, CreatedDate='2019-01-05T03:41:05.000+0000') for r in retval],
+            [c[0][0] for c in step.store_result.call_args_list]
+        )
+        self.assertEqual(len(data), oc.metrics['fetch_items'])
+        self.assertEqual(500, oc.metrics['parse_items'])
+
+    @patch('amaxa.ExtractOperation.bulk', new_callable=PropertyMock())
+    def test_perform_bulk_api_pass_converts_dates(self, bulk_proxy):
+        connection = Mock()
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'CloseDate': {
+                'name': 'CloseDate',
+                'type': 'date'
+            }
+        })
+        retval = [{ 'Id': '006000000000001', 'CloseDate': 1546646400000}]
+        mock_batch_states(bulk_proxy, 'Completed')
+        bulk_proxy.create_query_job = Mock(return_value = '075000000000000AAA')
+        bulk_proxy.get_all_results_for_query_batch = Mock(
+            return_value = [IteratorBytesIO([json.dumps(retval).encode('utf-8')])]
+        )
+
+        step = amaxa.ExtractionStep('Opportunity', amaxa.ExtractionScope.QUERY, ['CloseDate'])
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        step.perform_bulk_api_pass('SELECT Id, CloseDate FROM Opportunity')
+        step.store_result.assert_called_once_with(
+            {
+                'Id': '006000000000001',
+                'CloseDate': '2019-01-05'
+            }
+        )
+
+    @patch('amaxa.ExtractOperation.bulk', new_callable=PropertyMock())
+    def test_perform_bulk_api_pass_downloads_pk_chunks(self, bulk_proxy):
+        connection = Mock()
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'Name': {
+                'name': 'Name',
+                'type': 'string'
+            }
+        })
+        chunks = {
+            'chunk1': [{ 'Id': '001000000000001', 'Name': 'Test 1' }],
+            'chunk2': [{ 'Id': '001000000000002', 'Name': 'Test 2' }, { 'Id': '001000000000003', 'Name': 'Test 3' }]
+        }
+        bulk_proxy.create_query_job = Mock(return_value='075000000000000AAA')
+        bulk_proxy.query = Mock(return_value='batch')
+        bulk_proxy.get_batch_list = Mock(return_value=[
+            { 'id': 'batch', 'state': 'NotProcessed' },
+            { 'id': 'chunk1', 'state': 'Completed' },
+            { 'id': 'chunk2', 'state': 'Completed' }
+        ])
+        bulk_proxy.get_all_results_for_query_batch = Mock(
+            side_effect=lambda batch, job: [IteratorBytesIO([json.dumps(chunks[batch]).encode('utf-8')])]
+        )
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.ALL_RECORDS, ['Name'])
+        step.pk_chunk_size = 50000
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        step.perform_bulk_api_pass('SELECT Id, Name FROM Account')
+
+        bulk_proxy.create_query_job.assert_called_once_with('Account', contentType='JSON', pk_chunking=50000)
+        self.assertEqual(2, bulk_proxy.get_all_results_for_query_batch.call_count)
+        self.assertEqual(
+            sorted(chunks['chunk1'] + chunks['chunk2'], key=lambda r: r['Id']),
+            sorted([c[0][0] for c in step.store_result.call_args_list], key=lambda r: r['Id'])
+        )
+
+    @patch('amaxa.ExtractOperation.bulk', new_callable=PropertyMock())
+    def test_perform_bulk_api_pass_raises_batch_failures(self, bulk_proxy):
+        connection = Mock()
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'Name': {
+                'name': 'Name',
+                'type': 'string'
+            }
+        })
+        bulk_proxy.query = Mock(return_value='batch')
+        bulk_proxy.get_batch_list = Mock(return_value=[
+            { 'id': 'batch', 'state': 'Failed', 'stateMessage': 'InvalidBatch' }
+        ])
+
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.ALL_RECORDS, ['Name'])
+        step.store_result = Mock()
+        oc.add_step(step)
+        step.initialize()
+
+        with self.assertRaises(BulkBatchFailed):
+            step.perform_bulk_api_pass('SELECT Id, Name FROM Account')
+
+        step.store_result.assert_not_called()
+
     def test_resolve_registered_dependencies_loads_records(self):
         connection = Mock()
 
@@ -664,19 +1071,13 @@ class test_ExtractionStep(unittest.TestCase):
         oc.get_sobject_list = Mock(return_value=['Account', 'Contact'])
 
         step = amaxa.ExtractionStep('Contact', amaxa.ExtractionScope.DESCENDENTS, ['Name', 'AccountId', 'Household__c'])
-        step.perform_lookup_pass = Mock()
+        step.perform_lookup_passes = Mock()
         oc.add_step(step)
         
         step.initialize()
         step.execute()
 
-        step.perform_lookup_pass.assert_has_calls(
-            [
-                unittest.mock.call('AccountId'),
-                unittest.mock.call('Household__c')
-            ],
-            any_order=True
-        )
+        step.perform_lookup_passes.assert_called_once_with(set(['AccountId', 'Household__c']))
 
     def test_execute_resolves_self_lookups(self):
         connection = Mock()
@@ -695,14 +1096,6 @@ class test_ExtractionStep(unittest.TestCase):
                 ]
             }
         })
-        oc.get_extracted_ids = Mock(
-            side_effect=[
-                set([amaxa.SalesforceId('001000000000001')]),
-                set([amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002')]),
-                set([amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002')]),
-                set([amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002')])
-            ]
-        )
 
         step = amaxa.ExtractionStep(
             'Account',
@@ -711,7 +1104,9 @@ class test_ExtractionStep(unittest.TestCase):
             'Name = \'ACME\''
         )
         step.perform_bulk_api_pass = Mock()
-        step.perform_lookup_pass = Mock()
+        # The first pass over all records finds a child; querying that child's children finds nothing.
+        step.perform_lookup_passes = Mock(side_effect=lambda f: step.discovered.add(amaxa.SalesforceId('001000000000002')))
+        step.perform_id_field_passes = Mock()
         step.resolve_registered_dependencies = Mock()
         oc.add_step(step)
 
@@ -721,26 +1116,69 @@ class test_ExtractionStep(unittest.TestCase):
         step.execute()
 
         step.perform_bulk_api_pass.assert_called_once_with('SELECT Name, ParentId FROM Account WHERE Name = \'ACME\'')
-        oc.get_extracted_ids.assert_has_calls(
-            [
-                unittest.mock.call('Account'),
-                unittest.mock.call('Account'),
-                unittest.mock.call('Account'),
-                unittest.mock.call('Account')
-            ]
-        )
-        step.perform_lookup_pass.assert_has_calls(
-            [
-                unittest.mock.call('ParentId'),
-                unittest.mock.call('ParentId')
-            ]
-        )
+        step.perform_lookup_passes.assert_called_once_with(set(['ParentId']))
+        step.perform_id_field_passes.assert_called_once_with([('ParentId', set([amaxa.SalesforceId('001000000000002')]))])
         step.resolve_registered_dependencies.assert_has_calls(
             [
+                unittest.mock.call(),
                 unittest.mock.call(),
                 unittest.mock.call()
             ]
         )
+        self.assertEqual([0, 0], step.trace_query_counts)
+
+    def test_execute_queries_only_frontier_of_self_lookup_hierarchy(self):
+        # A chain of Accounts, each the parent of the next. Only the top is selected by the query.
+        depth = 20
+        accounts = [
+            { 'Id': str(amaxa.SalesforceId('001{:012d}'.format(i))), 'ParentId': str(amaxa.SalesforceId('001{:012d}'.format(i - 1))) if i > 0 else None }
+            for i in range(depth)
+        ]
+
+        def query_all(query):
+            ids = set(re.findall(r'\'(\w+)\'', query))
+            if ' ParentId IN ' in query:
+                return { 'records': [a for a in accounts if a['ParentId'] in ids] }
+            return { 'records': [a for a in accounts if a['Id'] in ids] }
+
+        connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        connection.query_all = Mock(side_effect=query_all)
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.file_store = Mock()
+        oc.get_field_map = Mock(return_value={
+            'Id': {
+                'name': 'Id',
+                'type': 'id'
+            },
+            'ParentId': {
+                'name': 'ParentId',
+                'type': 'reference',
+                'referenceTo': [
+                    'Account'
+                ]
+            }
+        })
+
+        step = amaxa.ExtractionStep(
+            'Account',
+            amaxa.ExtractionScope.QUERY,
+            ['Id', 'ParentId'],
+            'ParentId = null'
+        )
+        step.perform_bulk_api_pass = Mock(side_effect=lambda q: step.store_result(dict(accounts[0])))
+        oc.add_step(step)
+
+        step.initialize()
+        step.execute()
+
+        self.assertEqual(depth, len(oc.get_extracted_ids('Account')))
+        # One child query per level, plus the last that finds nothing.
+        self.assertEqual([1] * depth, step.trace_query_counts)
+        self.assertEqual(depth, connection.query_all.call_count)
+        for call in connection.query_all.call_args_list:
+            self.assertEqual(1, call[0][0].count('\'001'))
 
     def test_execute_does_not_trace_self_lookups_without_trace_all(self):
         connection = Mock()
@@ -780,4 +1218,88 @@ class test_ExtractionStep(unittest.TestCase):
 
         self.assertEqual(set(['ParentId']), step.self_lookups)
         step.resolve_registered_dependencies.assert_called_once_with()
-        oc.get_extracted_ids.assert_not_called()
\ No newline at end of file
+        oc.get_extracted_ids.assert_not_called()
+
+    def test_explain_counts_records_for_query(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.QUERY, 'Name = \'ACME\'')
+        oc.connection.query = Mock(return_value={ 'totalSize': 250000, 'records': [] })
+        parent.pk_chunk_size = 100000
+
+        plan = parent.explain()
+
+        oc.connection.query.assert_called_once_with('SELECT COUNT() FROM Account WHERE Name = \'ACME\'')
+        self.assertEqual(250000, plan['records'])
+        self.assertEqual(0, plan['rest_calls'])
+        # One batch for the job, plus one per chunk.
+        self.assertEqual(4, plan['bulk_batches'])
+        self.assertEqual(250000, parent.estimated_records)
+
+    def test_explain_counts_semi_join_descendents(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.ALL_RECORDS)
+        oc.connection.query = Mock(return_value={ 'totalSize': 12, 'records': [] })
+
+        plan = step.explain()
+
+        oc.connection.query.assert_called_once_with(
+            'SELECT COUNT() FROM Contact WHERE AccountId IN (SELECT Id FROM Account)'
+        )
+        self.assertEqual(12, plan['records'])
+        self.assertEqual(1, plan['bulk_batches'])
+        self.assertEqual(['Bulk API semi-join on AccountId'], plan['methods'])
+
+    def test_explain_queries_few_parents_by_id(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.ALL_RECORDS)
+        oc.connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        oc.connection.query = Mock()
+        parent.estimated_records = 10
+
+        plan = step.explain()
+
+        oc.connection.query.assert_not_called()
+        self.assertEqual(0, plan['bulk_batches'])
+        self.assertEqual(1, plan['rest_calls'])
+        self.assertEqual(['REST API query by AccountId'], plan['methods'])
+
+    def test_explain_plans_id_queries_for_descendents_from_parent_estimate(self):
+        (oc, parent, step) = self._get_semi_join_operation(amaxa.ExtractionScope.DESCENDENTS)
+        oc.connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        oc.connection.query = Mock()
+        parent.estimated_records = 1000
+
+        plan = step.explain()
+
+        oc.connection.query.assert_not_called()
+        self.assertIsNone(plan['records'])
+        self.assertEqual(0, plan['bulk_batches'])
+        expected = len(list(amaxa.iter_id_queries(
+            'SELECT {} FROM Contact'.format(step.get_field_list()),
+            [('AccountId', [amaxa.EXPLAIN_PLACEHOLDER_ID] * 1000)],
+            max_url_length=oc.get_max_query_url_length()
+        )))
+        self.assertGreater(expected, 1)
+        self.assertEqual(expected, plan['rest_calls'])
+
+    def test_explain_matches_queries_run_for_selected_records(self):
+        connection = Mock()
+        connection.base_url = 'https://test.salesforce.com/services/data/v45.0/'
+        connection.query_all = Mock(return_value={ 'records': [] })
+
+        oc = amaxa.ExtractOperation(connection)
+        oc.get_field_map = Mock(return_value={
+            'Name': {
+                'name': 'Name',
+                'type': 'string'
+            }
+        })
+        step = amaxa.ExtractionStep('Account', amaxa.ExtractionScope.SELECTED_RECORDS, ['Name'])
+        oc.add_step(step)
+        step.initialize()
+        for i in range(1000):
+            oc.add_dependency('Account', amaxa.SalesforceId('001000000' + str(i).zfill(6)))
+
+        plan = step.explain()
+        step.execute()
+
+        self.assertEqual(1000, plan['records'])
+        self.assertEqual(connection.query_all.call_count, plan['rest_calls'])
+        self.assertEqual(0, plan['bulk_batches'])
@@ -0,0 +1,112 @@
+import unittest
+import random
+from .. import amaxa
+
+
+def make_id(prefix, i):
+    return amaxa.SalesforceId('{}{:012d}'.format(prefix, i))
+
+class test_IdMap(unittest.TestCase):
+    def test_maps_ids(self):
+        id_map = amaxa.IdMap()
+
+        id_map[amaxa.SalesforceId('001000000000000')] = amaxa.SalesforceId('001000000000001')
+
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), id_map.get(amaxa.SalesforceId('001000000000000')))
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), id_map[amaxa.SalesforceId('001000000000000')])
+        self.assertIsInstance(id_map.get(amaxa.SalesforceId('001000000000000')), amaxa.SalesforceId)
+        self.assertIn(amaxa.SalesforceId('001000000000000'), id_map)
+        self.assertEqual(1, len(id_map))
+
+    def test_accepts_string_keys(self):
+        id_map = amaxa.IdMap()
+
+        id_map['001000000000000'] = '001000000000001'
+
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), id_map.get('001000000000000AAA'))
+        self.assertIn('001000000000000', id_map)
+
+    def test_returns_default_for_missing_keys(self):
+        id_map = amaxa.IdMap()
+
+        self.assertIsNone(id_map.get(amaxa.SalesforceId('001000000000000')))
+        self.assertEqual('x', id_map.get(amaxa.SalesforceId('001000000000000'), 'x'))
+        self.assertNotIn(amaxa.SalesforceId('001000000000000'), id_map)
+        with self.assertRaises(KeyError):
+            id_map[amaxa.SalesforceId('001000000000000')]
+
+    def test_retains_entries_across_compaction(self):
+        id_map = amaxa.IdMap(overflow_limit=100)
+        expected = {}
+
+        keys = list(range(5000))
+        random.Random(1).shuffle(keys)
+        for i in keys:
+            id_map[make_id('001', i)] = make_id('a01', i)
+            expected[make_id('001', i)] = make_id('a01', i)
+
+        self.assertEqual(5000, len(id_map))
+        self.assertLess(len(id_map._overflow), len(id_map))
+        for (k, v) in expected.items():
+            self.assertEqual(v, id_map.get(k))
+        self.assertIsNone(id_map.get(make_id('001', 5001)))
+        self.assertIsNone(id_map.get(make_id('000', 0)))
+        self.assertEqual(expected, dict(id_map.items()))
+
+    def test_overwrites_existing_entries(self):
+        id_map = amaxa.IdMap(overflow_limit=10)
+
+        id_map.update((make_id('001', i), make_id('a01', i)) for i in range(100))
+        id_map.compact()
+        id_map[make_id('001', 50)] = make_id('a01', 500)
+        id_map[make_id('001', 200)] = make_id('a01', 200)
+        id_map[make_id('001', 200)] = make_id('a01', 201)
+
+        self.assertEqual(101, len(id_map))
+        self.assertEqual(make_id('a01', 500), id_map.get(make_id('001', 50)))
+        self.assertEqual(make_id('a01', 201), id_map.get(make_id('001', 200)))
+
+    def test_get_many_returns_values_in_order(self):
+        id_map = amaxa.IdMap(overflow_limit=10)
+
+        id_map.update((make_id('001', i), make_id('a01', i)) for i in range(50))
+
+        self.assertEqual(
+            [make_id('a01', 3), None, make_id('a01', 49)],
+            id_map.get_many([make_id('001', 3), make_id('001', 60), str(make_id('001', 49))])
+        )
+
+    def test_initializes_from_dict(self):
+        id_map = amaxa.IdMap({ '001000000000000': '001000000000001' })
+
+        self.assertEqual(amaxa.SalesforceId('001000000000001'), id_map.get(amaxa.SalesforceId('001000000000000')))
+        self.assertEqual([amaxa.SalesforceId('001000000000000')], list(id_map))
+
+    def test_uses_less_memory_than_dict(self):
+        id_map = amaxa.IdMap(overflow_limit=100)
+
+        id_map.update((make_id('001', i), make_id('a01', i)) for i in range(10000))
+        id_map.compact()
+
+        self.assertLess(id_map.nbytes, 10000 * 40)
+
+    def test_builds_from_runs(self):
+        def pairs(r):
+            return [(make_id('001', i).id.encode('ascii'), make_id('a01', i * 10 + r).id.encode('ascii')) for i in range(r, 100, 3)]
+
+        runs = [amaxa.IdMap.pack_run(pairs(r)) for r in range(3)]
+        runs.append(amaxa.IdMap.pack_run([(make_id('001', 5).id.encode('ascii'), make_id('a01', 1000).id.encode('ascii'))]))
+
+        id_map = amaxa.IdMap.from_runs(runs)
+
+        self.assertEqual(100, len(id_map))
+        self.assertEqual(make_id('a01', 41), id_map.get(make_id('001', 4)))
+        self.assertEqual(make_id('a01', 1000), id_map.get(make_id('001', 5)))
+        self.assertEqual(
+            sorted(make_id('001', i).id for i in range(100)),
+            [k.id for k in id_map]
+        )
+
+    def test_pack_run_raises_valueerror_for_bad_ids(self):
+        with self.assertRaises(ValueError):
+            amaxa.IdMap.pack_run([(b'001000000000001AAA', b'001000000000!')])
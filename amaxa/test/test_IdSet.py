@@ -0,0 +1,187 @@
+import unittest
+import random
+import threading
+from .. import amaxa
+
+
+def make_id(prefix, i):
+    return amaxa.SalesforceId('{}{:012d}'.format(prefix, i))
+
+class test_IdSet(unittest.TestCase):
+    def test_adds_and_discards_ids(self):
+        id_set = amaxa.IdSet()
+
+        id_set.add(amaxa.SalesforceId('001000000000000'))
+        id_set.add('001000000000001')
+        id_set.add(amaxa.SalesforceId('001000000000000'))
+
+        self.assertEqual(2, len(id_set))
+        self.assertIn(amaxa.SalesforceId('001000000000000'), id_set)
+        self.assertIn('001000000000001AAA', id_set)
+        self.assertNotIn(amaxa.SalesforceId('001000000000002'), id_set)
+
+        id_set.discard(amaxa.SalesforceId('001000000000000'))
+        id_set.discard(amaxa.SalesforceId('001000000000002'))
+        id_set.remove(amaxa.SalesforceId('001000000000001'))
+
+        self.assertEqual(0, len(id_set))
+        with self.assertRaises(KeyError):
+            id_set.remove(amaxa.SalesforceId('001000000000001'))
+
+    def test_does_not_contain_non_ids(self):
+        id_set = amaxa.IdSet([amaxa.SalesforceId('001000000000000')])
+
+        for value in [None, '', '001', 12]:
+            self.assertNotIn(value, id_set)
+
+    def test_retains_ids_across_compaction(self):
+        id_set = amaxa.IdSet(overflow_limit=100)
+        expected = set()
+
+        keys = list(range(5000))
+        random.Random(1).shuffle(keys)
+        for i in keys:
+            id_set.add(make_id('001', i))
+            expected.add(make_id('001', i))
+        for i in keys[:1000]:
+            id_set.discard(make_id('001', i))
+            expected.discard(make_id('001', i))
+        for i in keys[:10]:
+            id_set.add(make_id('001', i))
+            expected.add(make_id('001', i))
+
+        self.assertEqual(4010, len(id_set))
+        self.assertLess(len(id_set._added) + len(id_set._removed), len(id_set))
+        self.assertEqual(expected, id_set)
+        self.assertEqual(expected, set(id_set))
+        for i in keys:
+            self.assertEqual(make_id('001', i) in expected, make_id('001', i) in id_set)
+
+    def test_keeps_added_ids_pending_until_compacted(self):
+        id_set = amaxa.IdSet(make_id('001', i) for i in range(5000))
+
+        self.assertEqual(0, len(id_set._keys))
+        self.assertEqual(5000, len(id_set._added))
+        self.assertIn(make_id('001', 4999), id_set)
+
+        id_set.compact()
+
+        self.assertEqual(5000, len(id_set._keys))
+        self.assertEqual(0, len(id_set._added))
+        self.assertIn(make_id('001', 4999), id_set)
+
+    def test_iterates_ids_in_order_once_compacted(self):
+        id_set = amaxa.IdSet(make_id('001', i) for i in [5, 3, 9, 1])
+        id_set.compact()
+
+        self.assertEqual([make_id('001', i) for i in [1, 3, 5, 9]], list(id_set))
+        self.assertIsInstance(next(iter(id_set)), amaxa.SalesforceId)
+
+    def test_iteration_is_unaffected_by_compaction(self):
+        id_set = amaxa.IdSet((make_id('001', i) for i in range(100)), overflow_limit=10)
+        id_set.compact()
+
+        ids = iter(id_set)
+        first = next(ids)
+        id_set.update(make_id('001', i) for i in range(100, 120))
+
+        self.assertEqual([first] + [make_id('001', i) for i in range(1, 100)], [first] + list(ids))
+
+    def test_unions_id_sets(self):
+        accounts = amaxa.IdSet(make_id('001', i) for i in range(0, 100))
+        contacts = amaxa.IdSet(make_id('003', i) for i in range(0, 100))
+        more_accounts = amaxa.IdSet(make_id('001', i) for i in range(50, 150))
+
+        result = amaxa.IdSet()
+        result |= accounts
+        result |= contacts
+
+        self.assertEqual(200, len(result))
+        self.assertEqual(set(accounts) | set(contacts), result)
+
+        result |= more_accounts
+
+        self.assertEqual(250, len(result))
+        self.assertEqual(set(accounts) | set(contacts) | set(more_accounts), result)
+        # The operands are unchanged.
+        self.assertEqual(100, len(accounts))
+        self.assertEqual(100, len(more_accounts))
+
+    def test_union_merges_interleaved_arrays(self):
+        evens = amaxa.IdSet((make_id('001', i) for i in range(0, 1000, 2)), overflow_limit=10)
+        thirds = amaxa.IdSet((make_id('001', i) for i in range(0, 1000, 3)), overflow_limit=10)
+
+        result = evens.union(thirds, [make_id('001', 1001)])
+
+        expected = set(make_id('001', i) for i in range(1000) if i % 2 == 0 or i % 3 == 0)
+        expected.add(make_id('001', 1001))
+        self.assertEqual(expected, result)
+        result.compact()
+        self.assertEqual(sorted(i.id for i in expected), [i.id for i in result])
+
+    def test_differences_and_intersections(self):
+        id_set = amaxa.IdSet(make_id('001', i) for i in range(100))
+        other = amaxa.IdSet(make_id('001', i) for i in range(50, 500))
+
+        self.assertEqual(set(make_id('001', i) for i in range(50)), id_set.difference(other))
+        self.assertEqual(set(make_id('001', i) for i in range(50)), id_set.difference(set(other)))
+        self.assertEqual(set(make_id('001', i) for i in range(50, 100)), id_set.intersection(other))
+        self.assertEqual(set(make_id('001', i) for i in range(50, 100)), id_set.intersection(list(other)))
+
+        id_set -= other
+
+        self.assertEqual(set(make_id('001', i) for i in range(50)), id_set)
+
+    def test_copy_is_independent(self):
+        id_set = amaxa.IdSet(make_id('001', i) for i in range(10))
+
+        copy = id_set.copy()
+        copy.add(make_id('001', 10))
+        id_set.discard(make_id('001', 0))
+
+        self.assertEqual(11, len(copy))
+        self.assertIn(make_id('001', 0), copy)
+        self.assertEqual(9, len(id_set))
+
+    def test_reads_do_not_modify_shared_sets(self):
+        # A parent step's extracted Ids, with changes pending since its last compaction.
+        shared = amaxa.IdSet(overflow_limit=100)
+        shared |= amaxa.IdSet(make_id('001', i) for i in range(0, 20000, 2))
+        for i in range(1, 2000, 2):
+            shared.add(make_id('001', i))
+        shared.discard(make_id('001', 0))
+        expected = set(make_id('001', i) for i in range(2, 20000, 2)) | set(make_id('001', i) for i in range(1, 2000, 2))
+        self.assertTrue(shared._added and shared._removed)
+
+        packed = bytes(shared._keys.keys)
+        errors = []
+        def read():
+            try:
+                for i in range(5):
+                    ids = amaxa.IdSet()
+                    ids |= shared
+                    ids |= shared.copy()
+                    if len(ids) != len(expected) or len(shared.intersection(ids)) != len(expected):
+                        errors.append('wrong size')
+                    if make_id('001', 1999) not in shared or make_id('001', 0) in shared:
+                        errors.append('wrong membership')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([], errors)
+        # The reads left the pending changes alone.
+        self.assertTrue(shared._added and shared._removed)
+        self.assertEqual(packed, bytes(shared._keys.keys))
+        self.assertEqual(expected, set(shared))
+
+    def test_uses_less_memory_than_set(self):
+        id_set = amaxa.IdSet((make_id('001', i) for i in range(10000)), overflow_limit=100)
+        id_set.compact()
+
+        self.assertLess(id_set.nbytes, 10000 * 30)
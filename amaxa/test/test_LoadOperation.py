@@ -15,6 +15,59 @@ class test_LoadOperation(unittest.TestCase):
 
         self.assertEqual(amaxa.SalesforceId('001000000000001'), op.get_new_id(amaxa.SalesforceId('001000000000000')))
 
+    def test_moves_id_map_to_disk_past_memory_budget(self):
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.file_store = MockFileStore()
+        op.id_map_budget = 1000
+
+        for i in range(10):
+            op.register_new_id('Account', amaxa.SalesforceId('001000000{:06d}'.format(i)), amaxa.SalesforceId('001000001{:06d}'.format(i)))
+
+        try:
+            self.assertIsInstance(op.global_id_map, amaxa.DiskIdMap)
+            self.assertEqual(10, len(op.global_id_map))
+            for i in range(10):
+                self.assertEqual(
+                    amaxa.SalesforceId('001000001{:06d}'.format(i)),
+                    op.get_new_id(amaxa.SalesforceId('001000000{:06d}'.format(i)))
+                )
+        finally:
+            op.global_id_map.close()
+
+    def test_keeps_id_map_in_memory_without_budget(self):
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.file_store = MockFileStore()
+
+        for i in range(10):
+            op.register_new_id('Account', amaxa.SalesforceId('001000000{:06d}'.format(i)), amaxa.SalesforceId('001000001{:06d}'.format(i)))
+
+        self.assertIsInstance(op.global_id_map, amaxa.IdMap)
+
+    def test_register_new_id_writes_journal_entries(self):
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.file_store = MockFileStore()
+        op.journal = Mock()
+
+        op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000001'))
+        op.checkpoint()
+
+        op.journal.record_new_id.assert_called_once_with(amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000001'))
+        op.journal.sync.assert_called_once_with()
+
+    def test_execute_journals_stage_transitions(self):
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.journal = Mock()
+        op.add_step(Mock(sobjectname='Account'))
+
+        self.assertEqual(0, op.execute())
+
+        op.journal.record_stage.assert_called_once_with(amaxa.LoadStage.DEPENDENTS)
+        op.journal.sync.assert_called_once_with()
+
     def test_register_new_id_writes_result_entries(self):
         connection = Mock()
         op = amaxa.LoadOperation(connection)
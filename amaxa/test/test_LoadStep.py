@@ -1,9 +1,12 @@
 import unittest
 import json
-from unittest.mock import Mock, MagicMock, PropertyMock, patch
+import io
+import csv
+from unittest.mock import Mock, MagicMock, PropertyMock, ANY, patch
 from salesforce_bulk import UploadResult
 from .MockFileStore import MockFileStore
-from .. import amaxa
+from .MockBulk import mock_batch_states, posted_records
+from .. import amaxa, transforms
 
 
 class test_LoadStep(unittest.TestCase):
@@ -86,196 +89,299 @@ class test_LoadStep(unittest.TestCase):
             ):
             l.get_value_for_lookup('ParentId', '001000000000000', '001000000000002')
 
-    def test_populates_lookups(self):
-        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
-        l.get_value_for_lookup = Mock(return_value='001000000000002')
+    def _get_column_plan_step(self):
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.file_store = MockFileStore()
+        op.get_field_map = Mock(return_value={
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'id', 'soapType': 'tns:ID' },
+            'IsActive__c': { 'type': 'boolean', 'soapType': 'xsd:boolean' },
+            'Description': { 'type': 'textarea', 'soapType': 'xsd:string' },
+            'ParentId': { 'type': 'reference', 'soapType': 'tns:ID', 'referenceTo': ['Account'] },
+            'Contact__c': { 'type': 'reference', 'soapType': 'tns:ID', 'referenceTo': ['Contact'] },
+            'Owner__c': { 'type': 'reference', 'soapType': 'tns:ID', 'referenceTo': ['User'] }
+        })
+        op.get_sobject_list = Mock(return_value=['User', 'Account', 'Contact'])
+        op.mappers['Account'] = amaxa.DataMapper(
+            { 'Account Name': 'Name', 'Active': 'IsActive__c' },
+            { 'Account Name': [transforms.strip, transforms.uppercase], 'Description': [transforms.lowercase] }
+        )
+        op.register_new_id('User', amaxa.SalesforceId('005000000000000'), amaxa.SalesforceId('005000000000001'))
+
+        l = amaxa.LoadStep('Account', ['Name', 'IsActive__c', 'Description', 'ParentId', 'Contact__c', 'Owner__c'])
+        op.add_step(l)
+        l.set_lookup_behavior_for_field('Owner__c', amaxa.OutsideLookupBehavior.ERROR)
+        l.initialize()
+
+        return (op, l)
 
-        record = {
-            'Id': '001000000000000',
-            'Name': 'Test',
-            'ParentId': '001000000000001'
-        }
+    def test_prepare_record_populates_lookups(self):
+        (op, l) = self._get_column_plan_step()
 
         self.assertEqual(
-            {
-                'Id': '001000000000000',
-                'Name': 'Test',
-                'ParentId': '001000000000002'
-            },
-            l.populate_lookups(record, ['ParentId'], '001000000000000')
+            { 'Owner__c': str(amaxa.SalesforceId('005000000000001')) },
+            l.prepare_record({ 'Id': '001000000000000', 'Owner__c': '005000000000000' })
+        )
+        self.assertEqual(
+            { 'Owner__c': None },
+            l.prepare_record({ 'Id': '001000000000000', 'Owner__c': '' })
         )
 
-    def test_converts_data_for_bulk_api(self):
+    def test_prepare_record_converts_data_for_bulk_api(self):
         connection = Mock()
         op = amaxa.LoadOperation(connection)
         op.get_field_map = Mock(return_value={
-            'Name': { 'soapType': 'xsd:string' },
-            'Boolean__c': { 'soapType': 'xsd:boolean' },
-            'Id': { 'soapType': 'tns:ID' },
-            'Date__c': { 'soapType': 'xsd:date' },
-            'DateTime__c': { 'soapType': 'xsd:dateTime' },
-            'Int__c': { 'soapType': 'xsd:int' },
-            'Double__c': { 'soapType': 'xsd:double' },
-            'Random__c': { 'soapType': 'xsd:string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Boolean__c': { 'type': 'boolean', 'soapType': 'xsd:boolean' },
+            'Id': { 'type': 'id', 'soapType': 'tns:ID' },
+            'Date__c': { 'type': 'date', 'soapType': 'xsd:date' },
+            'DateTime__c': { 'type': 'datetime', 'soapType': 'xsd:dateTime' },
+            'Int__c': { 'type': 'int', 'soapType': 'xsd:int' },
+            'Double__c': { 'type': 'double', 'soapType': 'xsd:double' },
+            'Random__c': { 'type': 'string', 'soapType': 'xsd:string' }
         })
+        op.get_sobject_list = Mock(return_value=['Account'])
 
-        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
-        l.context = op
-
-        record = {
-            'Name': 'Test',
-            'Boolean__c': 'yes',
-            'Id': '001000000000001',
-            'Date__c': '2018-12-31',
-            'DateTime__c': '2018-12-31T00:00:00.000Z',
-            'Int__c': '100',
-            'Double__c': '10.1',
-            'Random__c': ''
-        }
+        l = amaxa.LoadStep('Account', ['Name', 'Boolean__c', 'Date__c', 'DateTime__c', 'Int__c', 'Double__c', 'Random__c'])
+        op.add_step(l)
+        l.initialize()
 
         self.assertEqual(
             {
                 'Name': 'Test',
                 'Boolean__c': 'true',
-                'Id': '001000000000001',
                 'Date__c': '2018-12-31',
                 'DateTime__c': '2018-12-31T00:00:00.000Z',
                 'Int__c': '100',
                 'Double__c': '10.1',
                 'Random__c': None
             },
-            l.primitivize(record)
+            l.prepare_record({
+                'Name': 'Test',
+                'Boolean__c': 'yes',
+                'Id': '001000000000001',
+                'Date__c': '2018-12-31',
+                'DateTime__c': '2018-12-31T00:00:00.000Z',
+                'Int__c': '100',
+                'Double__c': '10.1',
+                'Random__c': ''
+            })
         )
 
-    def test_transform_records_calls_context_mapper(self):
-        connection = Mock()
-        op = amaxa.LoadOperation(connection)
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(
-            return_value={
-                'Name': 'Test2',
-                'ParentId': '001000000000001'
-            }
+    def test_prepare_record_maps_and_transforms_columns(self):
+        (op, l) = self._get_column_plan_step()
+
+        # Columns are mapped to fields before they're checked against the step's scope.
+        self.assertEqual(
+            { 'Name': 'CAPRICA STEEL', 'IsActive__c': 'false', 'Description': 'a steel company' },
+            l.prepare_record({
+                'Id': '001000000000000',
+                'Account Name': '  Caprica Steel ',
+                'Active': 'no',
+                'Description': 'A Steel Company'
+            })
         )
 
-        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
-        l.context = op
-        l.dependent_lookups = set()
-        l.self_lookups = set()
+    def test_prepare_record_drops_columns_outside_scope(self):
+        (op, l) = self._get_column_plan_step()
 
         self.assertEqual(
-            {
-                'Name': 'Test2',
-                'ParentId': '001000000000001'
-            },
-            l.transform_record(
-                {
-                    'Name': 'Test1',
-                    'ParentId': '001000000000000'
-                }
-            )
-        )
-        op.mappers['Account'].transform_record.assert_called_once_with(
-            {
-                'Name': 'Test1',
-                'ParentId': '001000000000000'
-            }
+            { 'Name': 'CAPRICA STEEL' },
+            l.prepare_record({ 'Id': '001000000000000', 'Account Name': 'Caprica Steel', 'Excess__c': 'x', 'Name__c': 'y' })
         )
 
-    def test_transform_records_cleans_excess_fields(self):
-        connection = Mock()
-        op = amaxa.LoadOperation(connection)
-
-        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
-        l.context = op
-        l.dependent_lookups = set()
-        l.self_lookups = set()
+    def test_prepare_record_leaves_dependent_lookups_for_updates(self):
+        (op, l) = self._get_column_plan_step()
 
+        self.assertEqual(set(['ParentId']), l.self_lookups)
+        self.assertEqual(set(['Contact__c']), l.dependent_lookups)
         self.assertEqual(
+            { 'Name': 'CAPRICA STEEL' },
+            l.prepare_record({
+                'Id': '001000000000000',
+                'Account Name': 'Caprica Steel',
+                'ParentId': '001000000000001',
+                'Contact__c': '003000000000000'
+            })
+        )
+
+    def test_prepare_record_prepares_all_columns(self):
+        (op, l) = self._get_column_plan_step()
+        records = [
             {
-                'Name': 'Test2',
-                'ParentId': '001000000000001'
+                'Id': '001000000000000',
+                'Account Name': '  Caprica Steel ',
+                'Active': 'yes',
+                'Description': 'A Steel Company',
+                'ParentId': '001000000000001',
+                'Contact__c': '003000000000000',
+                'Owner__c': '005000000000000',
+                'Extra': 'x'
             },
-            l.transform_record(
+            {
+                'Id': '001000000000001',
+                'Account Name': 'Picon Fleet',
+                'Active': '',
+                'Description': '',
+                'ParentId': '',
+                'Contact__c': '',
+                'Owner__c': ''
+            }
+        ]
+
+        self.assertEqual(
+            [
                 {
-                    'Name': 'Test2',
-                    'ParentId': '001000000000001',
-                    'Excess__c': True
+                    'Name': 'CAPRICA STEEL',
+                    'IsActive__c': 'true',
+                    'Description': 'a steel company',
+                    'Owner__c': str(amaxa.SalesforceId('005000000000001'))
+                },
+                {
+                    'Name': 'PICON FLEET',
+                    'IsActive__c': 'false',
+                    'Description': None,
+                    'Owner__c': None
                 }
-            )
+            ],
+            [l.prepare_record(record) for record in records]
         )
 
-    def test_transform_records_runs_transform_before_cleaning(self):
-        connection = Mock()
-        op = amaxa.LoadOperation(connection)
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(
-            return_value={
-                'Name': 'Test2',
-                'ParentId': '001000000000001',
-                'Excess__c': True
-            }
+    def test_prepare_record_raises_exceptions(self):
+        (op, l) = self._get_column_plan_step()
+
+        with self.assertRaises(ValueError):
+            l.prepare_record({ 'Id': '001000000000000', 'Active': 'maybe' })
+        with self.assertRaises(amaxa.AmaxaException):
+            l.prepare_record({ 'Id': '001000000000000', 'Owner__c': '005000000000002' })
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_reads_projected_csv_rows(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
+        (op, l) = self._get_column_plan_step()
+        op.register_new_id = Mock()
+        op.file_store.records['Account'] = csv.DictReader(io.StringIO(
+            'Id,Account Name,Active,Description,ParentId,Contact__c,Owner__c,Extra\n'
+            '001000000000000,  Caprica Steel ,yes,A Steel Company,001000000000001,003000000000000,005000000000000,x\n'
+            '\n'
+            '001000000000001,Picon Fleet,,,,,,\n'
+        ))
+        bulk_proxy.get_batch_results = Mock(
+            return_value=[
+                UploadResult('001000000000002', True, True, ''),
+                UploadResult('001000000000003', True, True, '')
+            ]
         )
 
-        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
-        l.context = op
-        l.dependent_lookups = set()
-        l.self_lookups = set()
+        l.execute()
 
         self.assertEqual(
-            {
-                'Name': 'Test2',
-                'ParentId': '001000000000001'
-            },
-            l.transform_record(
-                {
-                    'Account Name': 'Test2',
-                    'ParentId': '001000000000001',
-                    'Excess__c': True
-                }
-            )
+            [
+                [
+                    {
+                        'Name': 'CAPRICA STEEL',
+                        'IsActive__c': 'true',
+                        'Description': 'a steel company',
+                        'Owner__c': str(amaxa.SalesforceId('005000000000001'))
+                    },
+                    {
+                        'Name': 'PICON FLEET',
+                        'IsActive__c': 'false',
+                        'Description': None,
+                        'Owner__c': None
+                    }
+                ]
+            ],
+            posted_records(bulk_proxy)
         )
-    def test_extract_dependent_lookups_returns_dependent_fields(self):
-        l = amaxa.LoadStep('Account', ['Id', 'Name', 'ParentId'])
-        l.self_lookups = set(['ParentId'])
-        l.dependent_lookups = set()
+        self.assertEqual(2, op.register_new_id.call_count)
 
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_dependent_updates_reads_projected_csv_rows(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
+        (op, l) = self._get_column_plan_step()
+        op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002'))
+        op.register_new_id('Account', amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000003'))
+        op.register_new_id('Contact', amaxa.SalesforceId('003000000000000'), amaxa.SalesforceId('003000000000001'))
+        op.register_error = Mock()
+        op.file_store.records['Account'] = csv.DictReader(io.StringIO(
+            'Id,Account Name,ParentId,Contact__c,Extra\n'
+            '001000000000000,Caprica Steel,001000000000001,003000000000000,x\n'
+            '001000000000001,Picon Fleet,,,y\n'
+        ))
+        bulk_proxy.get_batch_results = Mock(
+            return_value=[UploadResult('001000000000002', True, False, '')]
+        )
+
+        l.execute_dependent_updates()
+
+        op.register_error.assert_not_called()
         self.assertEqual(
-            {
-                'Id': '001000000000001',
-                'ParentId': '001000000000002',
-            },
-            l.extract_dependent_lookups(
-                {
-                    'Name': 'Gemenon Gastronomics',
-                    'Id': '001000000000001',
-                    'ParentId': '001000000000002',
-                }
-            )
+            [
+                [
+                    {
+                        'Id': str(amaxa.SalesforceId('001000000000002')),
+                        'ParentId': str(amaxa.SalesforceId('001000000000003')),
+                        'Contact__c': str(amaxa.SalesforceId('003000000000001'))
+                    }
+                ]
+            ],
+            posted_records(bulk_proxy)
         )
 
-    def test_clean_dependent_lookups_returns_clean_record(self):
-        l = amaxa.LoadStep('Account', ['Id', 'Name', 'ParentId'])
-        l.self_lookups = set(['ParentId'])
-        l.dependent_lookups = set()
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_posts_csv_batches(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.content_type = 'CSV'
+        op.file_store = MockFileStore()
+        op.get_field_map = Mock(return_value={
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Description': { 'type': 'textarea', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' }
+        })
+        op.register_new_id = Mock()
+        op.register_error = Mock()
+        op.file_store.records['Account'] = [
+            { 'Id': '001000000000000', 'Name': 'Test', 'Description': 'A "quoted", multi-line\ndescription' },
+            { 'Id': '001000000000001', 'Name': '', 'Description': '' }
+        ]
+        # The Bulk API returns the results of CSV jobs as strings.
+        bulk_proxy.get_batch_results = Mock(
+            return_value=[
+                UploadResult('001000000000002', 'true', 'true', ''),
+                UploadResult('', 'false', 'false', 'REQUIRED_FIELD_MISSING:Required fields are missing: [Name]:Name --')
+            ]
+        )
+
+        l = amaxa.LoadStep('Account', ['Name', 'Description'])
+        l.context = op
+        l.initialize()
+        l.execute()
 
+        bulk_proxy.create_insert_job.assert_called_once_with('Account', contentType='CSV')
+        payload = bulk_proxy.post_batch.call_args[0][1]
         self.assertEqual(
-            {
-                'Name': 'Gemenon Gastronomics',
-                'Id': '001000000000001'
-            },
-            l.clean_dependent_lookups(
-                {
-                    'Name': 'Gemenon Gastronomics',
-                    'Id': '001000000000001',
-                    'ParentId': '001000000000002'
-                }
-            )
+            [
+                ['Name', 'Description'],
+                ['Test', 'A "quoted", multi-line\ndescription'],
+                ['#N/A', '#N/A']
+            ],
+            list(csv.reader(io.StringIO(payload.decode('utf-8'))))
+        )
+        self.assertEqual(len(payload), op.metrics['bulk_payload_bytes'])
+        op.register_new_id.assert_called_once_with(
+            'Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002')
+        )
+        op.register_error.assert_called_once_with(
+            'Account', '001000000000001', 'REQUIRED_FIELD_MISSING:Required fields are missing: [Name]:Name --'
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_transforms_and_loads_records_without_lookups(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_transforms_and_loads_records_without_lookups(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000' },
             { 'Name': 'Test 2', 'Id': '001000000000001' }
@@ -288,8 +394,8 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' }
         })
         op.register_new_id = Mock()
         op.file_store.records['Account'] = record_list
@@ -299,28 +405,16 @@ class test_LoadStep(unittest.TestCase):
                 UploadResult('001000000000003', True, True, '')
             ]
         )
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(side_effect=lambda x: x)
+        op.mappers['Account'] = amaxa.DataMapper()
 
         l = amaxa.LoadStep('Account', ['Name'])
         l.context = op
-        l.primitivize = Mock(side_effect=lambda x: x)
-        l.populate_lookups = Mock(side_effect=lambda x, y, z: x)
 
         l.initialize()
         l.execute()
 
-        op.mappers['Account'].transform_record.assert_has_calls([unittest.mock.call(x) for x in record_list])
-        l.primitivize.assert_has_calls([unittest.mock.call(x) for x in clean_record_list])
-        l.populate_lookups.assert_has_calls(
-            [unittest.mock.call(x, set(), y['Id']) for (x, y) in zip(clean_record_list, record_list)]
-        )
-
-        json_iterator_proxy.assert_called_once_with(clean_record_list)
-        bulk_proxy.post_batch.assert_called_once_with(
-            bulk_proxy.create_insert_job.return_value,
-            json_iterator_proxy.return_value
-        )
+        bulk_proxy.post_batch.assert_called_once_with(bulk_proxy.create_insert_job.return_value, ANY)
+        self.assertEqual([clean_record_list], posted_records(bulk_proxy))
         op.register_new_id.assert_has_calls(
             [
                 unittest.mock.call('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002')),
@@ -329,8 +423,8 @@ class test_LoadStep(unittest.TestCase):
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_transforms_and_loads_records_with_lookups(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_transforms_and_loads_records_with_lookups(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000', 'Lookup__c': '003000000000000' },
             { 'Name': 'Test 2', 'Id': '001000000000001', 'Lookup__c': '003000000000001'}
@@ -344,9 +438,9 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' },
-            'Lookup__c': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' },
+            'Lookup__c': { 'type': 'string', 'soapType': 'tns:ID' }
         })
 
         op.register_new_id('Account', amaxa.SalesforceId('003000000000000'), amaxa.SalesforceId('003000000000002'))
@@ -361,26 +455,19 @@ class test_LoadStep(unittest.TestCase):
             ]
         )
         bulk_proxy.create_insert_job = Mock(return_value=Mock())
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(side_effect=lambda x: x)
+        op.mappers['Account'] = amaxa.DataMapper()
 
         l = amaxa.LoadStep('Account', ['Name', 'Lookup__c'])
         l.context = op
-        l.primitivize = Mock(side_effect=lambda x: x)
 
         l.initialize()
         l.descendent_lookups = set(['Lookup__c'])
+        l.column_plan = l.compile_column_plan()
 
         l.execute()
 
-        op.mappers['Account'].transform_record.assert_has_calls([unittest.mock.call(x) for x in record_list])
-        l.primitivize.assert_has_calls([unittest.mock.call(x) for x in transformed_record_list])
-
-        json_iterator_proxy.assert_called_once_with(transformed_record_list)
-        bulk_proxy.post_batch.assert_called_once_with(
-            bulk_proxy.create_insert_job.return_value,
-            json_iterator_proxy.return_value
-        )
+        bulk_proxy.post_batch.assert_called_once_with(bulk_proxy.create_insert_job.return_value, ANY)
+        self.assertEqual([transformed_record_list], posted_records(bulk_proxy))
         op.register_new_id.assert_has_calls(
             [
                 unittest.mock.call('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002')),
@@ -389,8 +476,8 @@ class test_LoadStep(unittest.TestCase):
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_loads_cleaned_records(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_loads_cleaned_records(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000', 'ParentId': '001000000000001' },
             { 'Name': 'Test 2', 'Id': '001000000000001', 'ParentId': ''}
@@ -404,9 +491,9 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' },
-            'ParentId': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' },
+            'ParentId': { 'type': 'string', 'soapType': 'tns:ID' }
         })
 
         op.file_store.records['Account'] = record_list
@@ -417,29 +504,23 @@ class test_LoadStep(unittest.TestCase):
             ]
         )
         bulk_proxy.create_insert_job = Mock(return_value=Mock())
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(side_effect=lambda x: x)
+        op.mappers['Account'] = amaxa.DataMapper()
 
         l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
         l.context = op
-        l.primitivize = Mock(side_effect=lambda x: x)
 
         l.initialize()
         l.self_lookups = set(['ParentId'])
+        l.column_plan = l.compile_column_plan()
 
         l.execute()
 
-        op.mappers['Account'].transform_record.assert_has_calls([unittest.mock.call(x) for x in record_list])
-        l.primitivize.assert_has_calls([unittest.mock.call(x) for x in cleaned_record_list])
-
-        json_iterator_proxy.assert_called_once_with(cleaned_record_list)
-        bulk_proxy.post_batch.assert_called_once_with(
-            bulk_proxy.create_insert_job.return_value,
-            json_iterator_proxy.return_value
-        )
+        bulk_proxy.post_batch.assert_called_once_with(bulk_proxy.create_insert_job.return_value, ANY)
+        self.assertEqual([cleaned_record_list], posted_records(bulk_proxy))
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
     def test_execute_loads_high_volume_records(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         connection = Mock()
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
@@ -466,12 +547,46 @@ class test_LoadStep(unittest.TestCase):
         l.execute()
 
         self.assertEqual(2, bulk_proxy.post_batch.call_count)
-        self.assertEqual(2, bulk_proxy.wait_for_batch.call_count)
+        self.assertEqual(1, bulk_proxy.get_batch_list.call_count)
         self.assertEqual(2, bulk_proxy.get_batch_results.call_count)
         self.assertEqual(20000, op.register_new_id.call_count)
 
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_prefetches_lookups(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
+        record_list = [
+            { 'Name': 'Test', 'Id': '001000000000000', 'Lookup__c': '003000000000000' },
+            { 'Name': 'Test 2', 'Id': '001000000000001', 'Lookup__c': '' }
+        ]
+        connection = Mock()
+        op = amaxa.LoadOperation(connection)
+        op.file_store = MockFileStore()
+        op.file_store.records['Account'] = record_list
+        op.get_field_map = Mock(return_value={
+            'Name': { 'soapType': 'xsd:string', 'type': 'string' },
+            'Id': { 'soapType': 'xsd:string', 'type': 'string' },
+            'Lookup__c': { 'soapType': 'tns:ID', 'type': 'string' }
+        })
+        op.prefetch_new_ids = Mock()
+        op.register_new_id = Mock()
+        bulk_proxy.get_batch_results = Mock(return_value=[])
+
+        l = amaxa.LoadStep('Account', ['Name', 'Lookup__c'])
+        l.context = op
+
+        l.initialize()
+        l.descendent_lookups = set(['Lookup__c'])
+        l.execute()
+
+        op.prefetch_new_ids.assert_called_once()
+        self.assertEqual(
+            ['001000000000000', '003000000000000', '001000000000001'],
+            list(op.prefetch_new_ids.call_args[0][0])
+        )
+
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
     def test_execute_handles_errors(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000' },
             { 'Name': 'Test 2', 'Id': '001000000000001' }
@@ -509,8 +624,8 @@ class test_LoadStep(unittest.TestCase):
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_dependent_updates_handles_lookups(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_dependent_updates_handles_lookups(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000', 'Lookup__c': '001000000000001' },
             { 'Name': 'Test 2', 'Id': '001000000000001', 'Lookup__c': '001000000000000'}
@@ -528,9 +643,9 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' },
-            'Lookup__c': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' },
+            'Lookup__c': { 'type': 'string', 'soapType': 'tns:ID' }
         })
 
         op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002'))
@@ -556,14 +671,12 @@ class test_LoadStep(unittest.TestCase):
 
         op.register_error.assert_not_called()
         bulk_proxy.create_update_job.assert_called_once_with('Account', contentType='JSON')
-        json_iterator_proxy.assert_called_once_with(transformed_record_list)
-        bulk_proxy.post_batch.assert_called_once_with(
-            bulk_proxy.create_update_job.return_value, 
-            json_iterator_proxy.return_value
-        )
+        bulk_proxy.post_batch.assert_called_once_with(bulk_proxy.create_update_job.return_value, ANY)
+        self.assertEqual([transformed_record_list], posted_records(bulk_proxy))
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
     def test_execute_dependent_updates_handles_errors(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000', 'Lookup__c': '001000000000001' },
             { 'Name': 'Test 2', 'Id': '001000000000001', 'Lookup__c': '001000000000000' }
@@ -577,9 +690,9 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' },
-            'Lookup__c': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' },
+            'Lookup__c': { 'type': 'string', 'soapType': 'tns:ID' }
         })
 
         op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000002'))
@@ -614,8 +727,67 @@ class test_LoadStep(unittest.TestCase):
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_does_not_insert_records_prepopulated_in_id_map(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_dependent_updates_batches_high_volume_records(self, bulk_proxy):
+        # A hierarchy of 25,000 Accounts, each a child of the one before. In the target org,
+        # 001000000000123 became 001N00000000123. Every thousandth update fails.
+        posted = {}
+
+        def post_batch(job, data):
+            batch = 'batch{}'.format(len(posted) + 1)
+            posted[batch] = json.loads(data)
+            return batch
+
+        def get_batch_results(batch, job):
+            return [
+                UploadResult(r['Id'], int(r['Id'][4:15]) % 1000 != 0, False, error)
+                for r in posted[batch]
+            ]
+
+        error = [{ 'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'Locked', 'fields': [], 'extendedErrorDetails': None }]
+        bulk_proxy.post_batch = Mock(side_effect=post_batch)
+        bulk_proxy.get_batch_results = Mock(side_effect=get_batch_results)
+        bulk_proxy.get_batch_list = Mock(side_effect=lambda job: [{ 'id': b, 'state': 'Completed' } for b in posted])
+
+        op = amaxa.LoadOperation(Mock())
+        op.file_store = MockFileStore()
+        op.get_field_map = Mock(return_value={
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'xsd:string' },
+            'ParentId': { 'type': 'reference', 'soapType': 'tns:ID', 'referenceTo': ['Account'] }
+        })
+        op.get_sobject_list = Mock(return_value=['Account'])
+        op.global_id_map.update(
+            ('001{:012d}'.format(i), '001N{:011d}'.format(i)) for i in range(25000)
+        )
+        op.register_error = Mock()
+        op.file_store.records['Account'] = [
+            { 'Id': '001{:012d}'.format(i), 'Name': 'Account', 'ParentId': '001{:012d}'.format(i - 1) if i > 0 else '' }
+            for i in range(25000)
+        ]
+        op.file_store.get_file('Account', amaxa.FileType.INPUT)
+
+        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
+        l.context = op
+        l.initialize()
+
+        l.execute_dependent_updates()
+
+        bulk_proxy.create_update_job.assert_called_once_with('Account', contentType='JSON')
+        self.assertEqual(3, bulk_proxy.post_batch.call_count)
+        self.assertEqual(24999, sum(len(records) for records in posted.values()))
+        self.assertEqual(
+            { 'Id': str(amaxa.SalesforceId('001N00000012346')), 'ParentId': str(amaxa.SalesforceId('001N00000012345')) },
+            posted['batch2'][2345]
+        )
+        # Errors are reported against the records of the batch in which they occurred.
+        self.assertEqual(
+            ['001{:012d}'.format(i) for i in range(1000, 25000, 1000)],
+            [call[0][1] for call in op.register_error.call_args_list]
+        )
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_does_not_insert_records_prepopulated_in_id_map(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000' },
             { 'Name': 'Test 2', 'Id': '001000000000001' },
@@ -629,8 +801,8 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' }
         })
         op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000005'))
         op.register_new_id = Mock()
@@ -641,18 +813,15 @@ class test_LoadStep(unittest.TestCase):
                 UploadResult('001000000000008', True, True, '')
             ]
         )
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(side_effect=lambda x: x)
+        op.mappers['Account'] = amaxa.DataMapper()
 
         l = amaxa.LoadStep('Account', ['Name'])
         l.context = op
-        l.primitivize = Mock(side_effect=lambda x: x)
-        l.populate_lookups = Mock(side_effect=lambda x, y, z: x)
 
         l.initialize()
         l.execute()
 
-        json_iterator_proxy.assert_called_once_with(clean_record_list)
+        self.assertEqual([clean_record_list], posted_records(bulk_proxy))
         op.register_new_id.assert_has_calls(
             [
                 unittest.mock.call('Account', amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000007')),
@@ -661,8 +830,8 @@ class test_LoadStep(unittest.TestCase):
         )
 
     @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
-    @patch.object(amaxa, 'JSONIterator')
-    def test_execute_does_not_run_bulk_job_if_all_records_inserted(self, json_iterator_proxy, bulk_proxy):
+    def test_execute_does_not_run_bulk_job_if_all_records_inserted(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
         record_list = [
             { 'Name': 'Test', 'Id': '001000000000000' }
         ]
@@ -674,26 +843,170 @@ class test_LoadStep(unittest.TestCase):
         op = amaxa.LoadOperation(connection)
         op.file_store = MockFileStore()
         op.get_field_map = Mock(return_value={
-            'Name': { 'type': 'string '},
-            'Id': { 'type': 'string' }
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'tns:ID' }
         })
         op.register_new_id('Account', amaxa.SalesforceId('001000000000000'), amaxa.SalesforceId('001000000000005'))
         op.register_new_id = Mock()
         op.file_store.records['Account'] = record_list
         bulk_proxy.get_batch_results = Mock()
-        op.mappers['Account'] = Mock()
-        op.mappers['Account'].transform_record = Mock(side_effect=lambda x: x)
+        op.mappers['Account'] = amaxa.DataMapper()
 
         l = amaxa.LoadStep('Account', ['Name'])
         l.context = op
-        l.primitivize = Mock(side_effect=lambda x: x)
-        l.populate_lookups = Mock(side_effect=lambda x, y, z: x)
 
         l.initialize()
         l.execute()
 
         bulk_proxy.create_insert_job.assert_not_called()
-        json_iterator_proxy.assert_not_called()
+        bulk_proxy.post_batch.assert_not_called()
+
+    def _get_streaming_step(self, bulk_proxy, record_count, events):
+        # Each posted batch gets its own Id. Every batch is complete when first polled,
+        # and its results give the new Id of each record as a01 + the record's number.
+        posted = {}
+
+        def post_batch(job, data):
+            batch = 'batch{}'.format(len(posted) + 1)
+            posted[batch] = json.loads(data)
+            events.append(('post', batch))
+            return batch
+
+        def get_batch_results(batch, job):
+            events.append(('results', batch))
+            return [UploadResult('a01' + r['Name'][-12:], True, True, '') for r in posted[batch]]
+
+        def read():
+            for i in range(record_count):
+                events.append(('read', i))
+                yield { 'Id': '001{:012d}'.format(i), 'Name': 'Account {:012d}'.format(i) }
+
+        bulk_proxy.post_batch = Mock(side_effect=post_batch)
+        bulk_proxy.get_batch_results = Mock(side_effect=get_batch_results)
+        bulk_proxy.get_batch_list = Mock(side_effect=lambda job: [{ 'id': b, 'state': 'Completed' } for b in posted])
+
+        op = amaxa.LoadOperation(Mock())
+        op.file_store = MockFileStore()
+        op.get_field_map = Mock(return_value={
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'xsd:string' }
+        })
+        op.register_new_id = Mock()
+        op.register_error = Mock()
+        op.streaming = True
+        op.batches_in_flight = 2
+        op.file_store.records['Account'] = read()
+
+        l = amaxa.LoadStep('Account', ['Name'])
+        l.context = op
+        l.initialize()
+
+        return (op, l)
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_streams_batches_while_reading(self, bulk_proxy):
+        events = []
+        (op, l) = self._get_streaming_step(bulk_proxy, 45000, events)
+
+        l.execute()
+
+        self.assertEqual(5, bulk_proxy.post_batch.call_count)
+        # Each batch is posted before later records are read...
+        self.assertLess(events.index(('post', 'batch1')), events.index(('read', 10000)))
+        # ...and no more than two are in flight at once.
+        self.assertLess(events.index(('results', 'batch1')), events.index(('post', 'batch3')))
+        self.assertLess(events.index(('results', 'batch2')), events.index(('post', 'batch4')))
+        self.assertLess(events.index(('results', 'batch3')), events.index(('post', 'batch5')))
+        bulk_proxy.close_job.assert_called_once_with(bulk_proxy.create_insert_job.return_value)
+
+        # Results are matched to the records of their own batch.
+        self.assertEqual(45000, op.register_new_id.call_count)
+        for (args, kwargs) in op.register_new_id.call_args_list:
+            self.assertEqual(args[1].id[3:15], args[2].id[3:15])
+        op.register_error.assert_not_called()
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_streaming_stops_at_bad_record(self, bulk_proxy):
+        events = []
+        (op, l) = self._get_streaming_step(bulk_proxy, 25000, events)
+        prepare_row = l.prepare_row
+        l.prepare_row = Mock(side_effect=lambda row, row_plan, record_id: prepare_row(row, row_plan, record_id) if record_id != '001000000012000' else int('x'))
+
+        l.execute()
+
+        # Records before the bad record are loaded; nothing after it is, and no more of the file is read.
+        self.assertEqual(2, bulk_proxy.post_batch.call_count)
+        self.assertEqual(12000, op.register_new_id.call_count)
+        op.register_error.assert_called_once()
+        self.assertEqual('001000000012000', op.register_error.call_args[0][1])
+        self.assertNotIn(('read', 20000), events)
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_matches_results_to_records_of_each_batch(self, bulk_proxy):
+        events = []
+        (op, l) = self._get_streaming_step(bulk_proxy, 15000, events)
+        op.streaming = False
+
+        l.execute()
+
+        self.assertEqual(2, bulk_proxy.post_batch.call_count)
+        # Without streaming, every record is read before the first batch is posted.
+        self.assertLess(events.index(('read', 14999)), events.index(('post', 'batch1')))
+        self.assertEqual(15000, op.register_new_id.call_count)
+        for (args, kwargs) in op.register_new_id.call_args_list:
+            self.assertEqual(args[1].id[3:15], args[2].id[3:15])
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_limits_bytes_in_batches(self, bulk_proxy):
+        events = []
+        (op, l) = self._get_streaming_step(bulk_proxy, 3000, events)
+        op.streaming = False
+        op.batch_bytes = 50000
+
+        l.execute()
+
+        payloads = [c[0][1] for c in bulk_proxy.post_batch.call_args_list]
+        self.assertEqual(2, len(payloads))
+        for payload in payloads:
+            self.assertLessEqual(len(payload), 50000)
+        self.assertEqual(sum(len(p) for p in payloads), op.metrics['bulk_payload_bytes'])
+        self.assertEqual(3000, op.register_new_id.call_count)
+        for (args, kwargs) in op.register_new_id.call_args_list:
+            self.assertEqual(args[1].id[3:15], args[2].id[3:15])
+
+    @patch('amaxa.LoadOperation.bulk', new_callable=PropertyMock())
+    def test_execute_dependent_updates_limits_bytes_in_batches(self, bulk_proxy):
+        mock_batch_states(bulk_proxy)
+        bulk_proxy.get_batch_results = Mock(return_value=[])
+
+        op = amaxa.LoadOperation(Mock())
+        op.file_store = MockFileStore()
+        op.get_field_map = Mock(return_value={
+            'Name': { 'type': 'string', 'soapType': 'xsd:string' },
+            'Id': { 'type': 'string', 'soapType': 'xsd:string' },
+            'ParentId': { 'type': 'reference', 'soapType': 'tns:ID', 'referenceTo': ['Account'] }
+        })
+        op.get_sobject_list = Mock(return_value=['Account'])
+        op.global_id_map.update(
+            ('001{:012d}'.format(i), '001N{:011d}'.format(i)) for i in range(1000)
+        )
+        op.batch_bytes = 20000
+        op.file_store.records['Account'] = [
+            { 'Id': '001{:012d}'.format(i), 'Name': 'Account', 'ParentId': '001{:012d}'.format(i - 1) if i > 0 else '' }
+            for i in range(1000)
+        ]
+
+        l = amaxa.LoadStep('Account', ['Name', 'ParentId'])
+        l.context = op
+        l.initialize()
+
+        l.execute_dependent_updates()
+
+        payloads = [c[0][1] for c in bulk_proxy.post_batch.call_args_list]
+        self.assertEqual(3, len(payloads))
+        for payload in payloads:
+            self.assertLessEqual(len(payload), 20000)
+        self.assertEqual(999, sum(len(records) for records in posted_records(bulk_proxy)))
 
     def test_format_error_constructs_messages(self):
         l = amaxa.LoadStep('Account', ['Name'])
@@ -1,4 +1,5 @@
 import unittest
+import threading
 from unittest.mock import Mock, MagicMock, PropertyMock, patch
 from .. import amaxa
 
@@ -154,3 +155,68 @@ class test_Operation(unittest.TestCase):
 
         op.logger.error.assert_called_once_with('Unexpected exception Test occurred.')
         op.file_store.close.assert_called_once_with()
+
+    def test_prefetches_describes_concurrently(self):
+        # Each describe waits for all of the others, so they must run concurrently.
+        barrier = threading.Barrier(3, timeout=10)
+        def describe(result):
+            barrier.wait()
+            return result
+
+        connection = Mock()
+        connection.describe = Mock(side_effect=lambda: describe({ 'sobjects': [] }))
+        connection.Account.describe = Mock(side_effect=lambda: describe({ 'fields': [{ 'name': 'Name' }] }))
+        connection.Contact.describe = Mock(side_effect=lambda: describe({ 'fields': [{ 'name': 'Email' }] }))
+
+        oc = amaxa.Operation(connection)
+        oc.prefetch_describes(['Account', 'Contact'])
+
+        self.assertEqual({ 'sobjects': [] }, oc.get_global_describe())
+        self.assertEqual({ 'Name': { 'name': 'Name' } }, oc.get_field_map('Account'))
+        self.assertEqual({ 'Email': { 'name': 'Email' } }, oc.get_field_map('Contact'))
+
+        connection.describe.assert_called_once_with()
+        connection.Account.describe.assert_called_once_with()
+        connection.Contact.describe.assert_called_once_with()
+
+    def test_prefetch_describes_reports_errors_on_use(self):
+        connection = Mock()
+        connection.describe = Mock(return_value={ 'sobjects': [] })
+        connection.Object__c.describe = Mock(side_effect=Exception('NOT_FOUND'))
+
+        oc = amaxa.Operation(connection)
+        oc.prefetch_describes(['Object__c'])
+
+        self.assertEqual({ 'sobjects': [] }, oc.get_global_describe())
+        with self.assertRaises(Exception):
+            oc.get_describe('Object__c')
+
+    def test_query_all_concurrently_runs_queries_concurrently(self):
+        # Each query waits for the others, so they must run concurrently.
+        barrier = threading.Barrier(3, timeout=10)
+        def query_all(q):
+            barrier.wait()
+            return { 'records': [{ 'Id': q }] }
+
+        connection = Mock()
+        connection.query_all = Mock(side_effect=query_all)
+        oc = amaxa.Operation(connection)
+        oc.query_parallelism = 3
+
+        results = list(oc.query_all_concurrently(['q1', 'q2', 'q3']))
+
+        self.assertEqual(['q1', 'q2', 'q3'], sorted(r['records'][0]['Id'] for r in results))
+        connection.session.mount.assert_called_once()
+
+    def test_query_all_concurrently_limits_queries_in_flight(self):
+        connection = Mock()
+        connection.query_all = Mock(side_effect=lambda q: { 'records': [] })
+        oc = amaxa.Operation(connection)
+        oc.query_parallelism = 2
+
+        results = oc.query_all_concurrently('q{}'.format(i) for i in range(100))
+        next(results)
+
+        self.assertLessEqual(connection.query_all.call_count, 4)
+        self.assertEqual(99, len(list(results)))
+        self.assertEqual(100, connection.query_all.call_count)
@@ -0,0 +1,58 @@
+import unittest
+import io
+import csv
+from .. import amaxa, transforms
+
+
+class test_RecordWriter(unittest.TestCase):
+    def test_writes_records_in_column_order(self):
+        output = io.StringIO()
+        writer = amaxa.RecordWriter(output, ['Id', 'Name'], lineterminator='\n')
+
+        writer.writeheader()
+        writer.writerow({ 'Name': 'Caprica Steel', 'Id': '001000000000000', 'attributes': {} })
+        writer.writerows([{ 'Name': 'Picon Fleet', 'Id': '001000000000001' }])
+
+        self.assertEqual(
+            'Id,Name\n001000000000000,Caprica Steel\n001000000000001,Picon Fleet\n',
+            output.getvalue()
+        )
+
+    def test_writes_single_column(self):
+        output = io.StringIO()
+        writer = amaxa.RecordWriter(output, ['Id'], lineterminator='\n')
+
+        writer.writerow({ 'Id': '001000000000000', 'Name': 'Caprica Steel' })
+
+        self.assertEqual('001000000000000\n', output.getvalue())
+
+    def test_writes_missing_fields_as_restval(self):
+        output = io.StringIO()
+        mapper = amaxa.DataMapper({ 'Name': 'Account Name' }, { 'Name': [transforms.uppercase] })
+        writer = amaxa.RecordWriter(output, ['Account Name', 'Id', 'ParentId'], mapper=mapper, lineterminator='\n')
+
+        writer.writerow({ 'Id': '001000000000000', 'Name': 'Caprica Steel' })
+        writer.writerow({ 'Id': '001000000000001' })
+
+        self.assertEqual('CAPRICA STEEL,001000000000000,\n,001000000000001,\n', output.getvalue())
+
+    def test_matches_mapped_dict_writer(self):
+        mapper = amaxa.DataMapper(
+            { 'Name': 'Account Name', 'Description': 'Notes' },
+            { 'Name': [transforms.strip, transforms.uppercase], 'Industry': [transforms.lowercase] }
+        )
+        fieldnames = sorted(mapper.transform_key(f) for f in ['Id', 'Name', 'Description', 'Industry'])
+        records = [
+            { 'Id': '001000000000000', 'Name': ' Caprica Steel ', 'Description': 'Steel, "tempered"', 'Industry': 'Steel' },
+            { 'Id': '001000000000001', 'Name': 'Picon Fleet', 'Description': None, 'Industry': 'Defense', 'attributes': {} }
+        ]
+
+        expected = io.StringIO()
+        dict_writer = csv.DictWriter(expected, fieldnames, extrasaction='ignore')
+        dict_writer.writerows(mapper.transform_record(r) for r in records)
+
+        output = io.StringIO()
+        writer = amaxa.RecordWriter(output, fieldnames, mapper=mapper)
+        writer.writerows(records)
+
+        self.assertEqual(expected.getvalue(), output.getvalue())
@@ -55,4 +55,36 @@ class test_SalesforceId(unittest.TestCase):
             new_id = amaxa.SalesforceId('001000000000' + str(i + 1).zfill(3))
             self.assertNotIn(new_id, id_set)
             id_set.add(new_id)
-            self.assertIn(new_id, id_set)
\ No newline at end of file
+            self.assertIn(new_id, id_set)
+
+    def test_from_iterable_converts_column(self):
+        ids = amaxa.SalesforceId.from_iterable(
+            ['01Q36000000RXX5', '005360000016xkGAAQ', amaxa.SalesforceId('0013600001ohPTp')]
+        )
+
+        self.assertEqual(
+            [
+                amaxa.SalesforceId('01Q36000000RXX5EAO'),
+                amaxa.SalesforceId('005360000016xkGAAQ'),
+                amaxa.SalesforceId('0013600001ohPTpAAM')
+            ],
+            ids
+        )
+        self.assertTrue(all(isinstance(i, amaxa.SalesforceId) for i in ids))
+
+    def test_from_iterable_raises_valueerror(self):
+        with self.assertRaises(ValueError):
+            amaxa.SalesforceId.from_iterable(['001000000000000', 'test'])
+
+    def test_strips_whitespace(self):
+        self.assertEqual('0013600001ohPTpAAM', str(amaxa.SalesforceId(' 0013600001ohPTp ')))
+        self.assertEqual('0013600001ohPTpAAM', str(amaxa.SalesforceId('0013600001ohPTpAAM\n')))
+
+    def test_raises_valueerror_for_non_ascii_characters(self):
+        with self.assertRaises(ValueError):
+            # pylint: disable=W0612
+            bad_id = amaxa.SalesforceId('001000000\u00e900000')
+
+    def test_does_not_allow_attributes(self):
+        with self.assertRaises(AttributeError):
+            amaxa.SalesforceId('001000000000000').other = 1
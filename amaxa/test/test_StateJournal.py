@@ -0,0 +1,135 @@
+import unittest
+import io
+import os
+import tempfile
+from unittest.mock import Mock
+from .. import amaxa, state
+
+
+class test_StateJournal(unittest.TestCase):
+    def test_records_stages_and_ids(self):
+        f = io.StringIO()
+        journal = state.StateJournal(f)
+
+        journal.write_header()
+        journal.record_stage(amaxa.LoadStage.INSERTS)
+        journal.record_new_id(amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002'))
+        journal.sync()
+
+        self.assertEqual(
+            'amaxa-state-journal 1\n'
+            'S inserts\n'
+            'I 001000000000001AAA 001000000000002AAA\n',
+            f.getvalue()
+        )
+
+    def test_load_state_replays_journal(self):
+        op = amaxa.LoadOperation(Mock())
+        journal = io.StringIO(
+            'amaxa-state-journal 1\n'
+            'S inserts\n'
+            'I 001000000000001AAA 001000000000002AAA\n'
+            'I 001000000000003AAA 001000000000004AAA\n'
+            'I 001000000000001AAA 001000000000005AAA\n'
+            'S dependents\n'
+        )
+
+        (op, errors) = state.load_state(op, journal)
+
+        self.assertEqual([], errors)
+        self.assertEqual(amaxa.LoadStage.DEPENDENTS, op.stage)
+        self.assertEqual(
+            {
+                amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000005'),
+                amaxa.SalesforceId('001000000000003'): amaxa.SalesforceId('001000000000004')
+            },
+            op.global_id_map
+        )
+
+    def test_save_state_round_trips_through_load_state(self):
+        for json_mode in (False, True):
+            op = amaxa.LoadOperation(Mock())
+            op.stage = amaxa.LoadStage.DEPENDENTS
+            op.global_id_map[amaxa.SalesforceId('001000000000001')] = amaxa.SalesforceId('001000000000002')
+
+            data = state.save_state(op, json_mode)
+            loaded = amaxa.LoadOperation(Mock())
+            (loaded, errors) = state.load_state(loaded, io.StringIO(data), json_mode)
+
+            self.assertEqual([], errors)
+            self.assertEqual(amaxa.LoadStage.DEPENDENTS, loaded.stage)
+            self.assertEqual(
+                { amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000002') },
+                loaded.global_id_map
+            )
+
+    def test_load_state_skips_torn_records(self):
+        op = amaxa.LoadOperation(Mock())
+        journal = io.StringIO(
+            'amaxa-state-journal 1\n'
+            'S inserts\n'
+            'I 001000000000001AAA 001000000000002AAA\n'
+            'I 001000000000003AAA 0010000\n'
+            'I 001000000000005AAA 001000000000006AAA\n'
+        )
+
+        (op, errors) = state.load_state(op, journal)
+
+        self.assertEqual([], errors)
+        self.assertEqual(
+            {
+                amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000002'),
+                amaxa.SalesforceId('001000000000005'): amaxa.SalesforceId('001000000000006')
+            },
+            op.global_id_map
+        )
+
+    def test_load_state_returns_errors_for_bad_ids(self):
+        op = amaxa.LoadOperation(Mock())
+        journal = io.StringIO(
+            'amaxa-state-journal 1\n'
+            'I 001000000000001AAA 00100000000000\u00e9AAA\n'
+        )
+
+        (op, errors) = state.load_state(op, journal)
+
+        self.assertIsNone(op)
+        self.assertEqual(1, len(errors))
+
+    def test_open_journal_writes_snapshot(self):
+        op = amaxa.LoadOperation(Mock())
+        op.stage = amaxa.LoadStage.DEPENDENTS
+        op.global_id_map[amaxa.SalesforceId('001000000000001')] = amaxa.SalesforceId('001000000000002')
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'test.state.journal')
+            state.open_journal(op, path).close()
+
+            with open(path, 'r') as f:
+                self.assertEqual(
+                    'amaxa-state-journal 1\n'
+                    'S dependents\n'
+                    'I 001000000000001AAA 001000000000002AAA\n',
+                    f.read()
+                )
+
+    def test_open_journal_appends_after_torn_record(self):
+        op = amaxa.LoadOperation(Mock())
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'test.state.journal')
+            with open(path, 'w') as f:
+                f.write('amaxa-state-journal 1\nS inserts\nI 0010000')
+
+            journal = state.open_journal(op, path, append=True)
+            journal.record_new_id(amaxa.SalesforceId('001000000000001'), amaxa.SalesforceId('001000000000002'))
+            journal.close()
+
+            with open(path, 'r') as f:
+                (op, errors) = state.load_state(op, f)
+
+        self.assertEqual([], errors)
+        self.assertEqual(
+            { amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000002') },
+            op.global_id_map
+        )
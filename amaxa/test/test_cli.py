@@ -3,7 +3,7 @@ import json
 import yaml
 import io
 from unittest.mock import Mock
-from .. import loader, amaxa
+from .. import loader, amaxa, state, describe_cache
 from ..__main__ import main as main
 
 
@@ -87,7 +87,18 @@ state:
         '001000000000003': '001000000000004'
 '''
 
-state_file = io.StringIO()
+state_journal = '''amaxa-state-journal 1
+S inserts
+I 001000000000001AAA 001000000000002AAA
+I 001000000000003AAA 001000000000004AAA
+S dependents
+'''
+
+class UnclosableStringIO(io.StringIO):
+    def close(self):
+        pass
+
+journal_file = UnclosableStringIO()
 
 def select_file(f, *args, **kwargs):
     data = { 
@@ -98,7 +109,8 @@ def select_file(f, *args, **kwargs):
         'credentials-good.json': credentials_good_json,
         'extraction-good.json': extraction_good_json,
         'state-good.yaml': state_good_yaml,
-        'extraction-good.state.yaml': state_file
+        'state-good.journal': state_journal,
+        'extraction-good.state.journal': journal_file
     }
     if type(data[f]) is str:
         m = unittest.mock.mock_open(read_data=data[f])(f, *args, **kwargs)
@@ -132,11 +144,14 @@ class test_CLI(unittest.TestCase):
 
         self.assertEqual(0, return_value)
     
+    @unittest.mock.patch('amaxa.__main__.os.remove')
     @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
     @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
-    def test_main_calls_execute_with_json_input_load_mode(self, extraction_mock, credential_mock):
+    def test_main_calls_execute_with_json_input_load_mode(self, extraction_mock, credential_mock, remove_mock):
         context = Mock()
         context.run.return_value = 0
+        context.stage = amaxa.LoadStage.INSERTS
+        context.global_id_map = {}
         credential_mock.return_value = (context, [])
         extraction_mock.return_value = (context, [])
         
@@ -239,38 +254,285 @@ class test_CLI(unittest.TestCase):
 
         self.assertEqual(-1, return_value)
 
+    @unittest.mock.patch('amaxa.__main__.os.remove')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_configures_streaming_load(self, load_mock, credential_mock, remove_mock):
+        context = Mock()
+        context.run.return_value = 0
+        context.stage = amaxa.LoadStage.INSERTS
+        context.global_id_map = {}
+        credential_mock.return_value = (context, [])
+        load_mock.return_value = (context, [])
+
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.json', '--load', 'extraction-good.json', '--stream']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertTrue(context.streaming)
+        self.assertEqual('JSON', context.content_type)
+
+    @unittest.mock.patch('amaxa.__main__.os.remove')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_configures_bulk_format(self, load_mock, credential_mock, remove_mock):
+        context = Mock()
+        context.run.return_value = 0
+        context.stage = amaxa.LoadStage.INSERTS
+        context.global_id_map = {}
+        credential_mock.return_value = (context, [])
+        load_mock.return_value = (context, [])
+
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.json', '--load', 'extraction-good.json', '--bulk-format', 'CSV']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertEqual('CSV', context.content_type)
+
     @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
     @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
-    def test_main_saves_state_on_error(self, extraction_mock, credential_mock):
+    def test_main_configures_parallelism(self, extraction_mock, credential_mock):
+        context = Mock()
+        context.run.return_value = 0
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (context, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--parallelism', '12']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertEqual(12, context.query_parallelism)
+        self.assertEqual(12, context.download_parallelism)
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_configures_bulk_id_threshold(self, extraction_mock, credential_mock):
+        context = Mock()
+        context.run.return_value = 0
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (context, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--bulk-id-threshold', '1000']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertEqual(1000, context.bulk_id_threshold)
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_configures_pipeline(self, extraction_mock, credential_mock):
+        context = Mock()
+        context.run.return_value = 0
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (context, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--pipeline']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertTrue(context.pipeline)
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_configures_parallel_steps(self, extraction_mock, credential_mock):
+        context = Mock()
+        context.run.return_value = 0
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (context, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--parallel-steps', '3']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertEqual(3, context.step_parallelism)
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_configures_describe_cache(self, extraction_mock, credential_mock):
+        context = Mock()
+        context.run.return_value = 0
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (context, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--describe-cache', 'cache', '--describe-cache-ttl', '2']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertIsInstance(context.describe_cache, describe_cache.DescribeCache)
+        self.assertEqual('cache', context.describe_cache.path)
+        self.assertEqual(2 * 60 * 60, context.describe_cache.ttl)
+
+    @unittest.mock.patch('amaxa.__main__.os.remove')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_saves_state_on_error(self, operation_mock, credential_mock, remove_mock):
         context = Mock()
         op = Mock()
         op.run = Mock(return_value=-1)
         op.stage = amaxa.LoadStage.INSERTS
         op.global_id_map = { amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000002') }
         credential_mock.return_value = (context, [])
-        extraction_mock.return_value = (op, [])
+        operation_mock.return_value = (op, [])
+        journal_file.seek(0)
+        journal_file.truncate()
         
         m = Mock(side_effect=select_file)
         with unittest.mock.patch('builtins.open', m):
             with unittest.mock.patch(
                 'sys.argv',
-                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml']
+                ['amaxa', '-c', 'credentials-good.yaml', '--load', 'extraction-good.yaml']
+            ):
+                return_value = main()
+
+        self.assertEqual(-1, return_value)
+        self.assertIsInstance(op.journal, state.StateJournal)
+        remove_mock.assert_not_called()
+        self.assertEqual(
+            'amaxa-state-journal 1\n'
+            'S inserts\n'
+            'I 001000000000001AAA 001000000000002AAA\n',
+            journal_file.getvalue()
+        )
+
+    @unittest.mock.patch('amaxa.__main__.os.remove')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_removes_state_on_success(self, operation_mock, credential_mock, remove_mock):
+        context = Mock()
+        op = Mock()
+        op.run = Mock(return_value=0)
+        op.stage = amaxa.LoadStage.INSERTS
+        op.global_id_map = {}
+        credential_mock.return_value = (context, [])
+        operation_mock.return_value = (op, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', '--load', 'extraction-good.yaml']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        remove_mock.assert_called_once_with('extraction-good.state.journal')
+
+    @unittest.mock.patch('amaxa.__main__.os.path.getsize')
+    @unittest.mock.patch('amaxa.__main__.os.path.exists')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_does_not_overwrite_existing_journal(self, operation_mock, credential_mock, exists_mock, getsize_mock):
+        exists_mock.return_value = True
+        getsize_mock.return_value = 100
+        journal_file.seek(0)
+        journal_file.truncate()
+        journal_file.write(state_journal)
+
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', '--load', 'extraction-good.yaml']
             ):
                 return_value = main()
 
         self.assertEqual(-1, return_value)
-        self.assertLess(0, state_file.tell())
+        exists_mock.assert_called_once_with('extraction-good.state.journal')
+        operation_mock.assert_not_called()
+        self.assertEqual(state_journal, journal_file.getvalue())
 
-        state_file.seek(0)
-        yaml_state = yaml.load(state_file)
+    @unittest.mock.patch('amaxa.__main__.os.remove')
+    @unittest.mock.patch('amaxa.__main__.os.path.getsize')
+    @unittest.mock.patch('amaxa.__main__.os.path.exists')
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_overwrites_existing_journal_when_requested(self, operation_mock, credential_mock, exists_mock, getsize_mock, remove_mock):
+        context = Mock()
+        op = Mock()
+        op.run = Mock(return_value=-1)
+        op.stage = amaxa.LoadStage.INSERTS
+        op.global_id_map = {}
+        credential_mock.return_value = (context, [])
+        operation_mock.return_value = (op, [])
+        exists_mock.return_value = True
+        getsize_mock.return_value = 100
+        journal_file.seek(0)
+        journal_file.truncate()
+        journal_file.write(state_journal)
 
-        self.assertIn('state', yaml_state)
-        self.assertIn('id-map', yaml_state['state'])
-        self.assertIn('stage', yaml_state['state'])
-        self.assertEqual(amaxa.LoadStage.INSERTS.value, yaml_state['state']['stage'])
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', '--load', 'extraction-good.yaml', '--overwrite-state']
+            ):
+                return_value = main()
+
+        self.assertEqual(-1, return_value)
+        op.run.assert_called_once_with()
+        m.assert_any_call('extraction-good.state.journal', 'w')
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_loads_state_from_journal(self, extraction_mock, credential_mock):
+        context = Mock()
+        op = Mock()
+        op.run = Mock(return_value=0)
+        op.stage = amaxa.LoadStage.INSERTS
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (op, [])
+        
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--use-state', 'state-good.journal']
+            ):
+                return_value = main()
+
+        self.assertEqual(0, return_value)
+        self.assertEqual(amaxa.LoadStage.DEPENDENTS, op.stage)
         self.assertEqual(
-            { str(k) : str(v) for k, v in op.global_id_map.items() },
-            yaml_state['state']['id-map']
+            {
+                amaxa.SalesforceId('001000000000001'): amaxa.SalesforceId('001000000000002'),
+                amaxa.SalesforceId('001000000000003'): amaxa.SalesforceId('001000000000004')
+            },
+            op.global_id_map
         )
 
     @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
@@ -299,3 +561,72 @@ class test_CLI(unittest.TestCase):
             },
             op.global_id_map
         )
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_extraction_operation')
+    def test_main_explains_without_executing(self, extraction_mock, credential_mock):
+        context = Mock()
+        op = Mock()
+        op.explain.return_value = [
+            {
+                'sobject': 'Account',
+                'scope': 'all',
+                'records': 250000,
+                'rest_calls': 0,
+                'bulk_batches': 4,
+                'methods': ['Bulk API query with PK chunking']
+            },
+            {
+                'sobject': 'Contact',
+                'scope': 'descendents',
+                'records': None,
+                'rest_calls': 12,
+                'bulk_batches': 0,
+                'methods': ['REST API query by AccountId']
+            }
+        ]
+        op.get_api_limits.return_value = {
+            'rest_calls': (15000, 14000),
+            'bulk_batches': (10000, 9990)
+        }
+        credential_mock.return_value = (context, [])
+        extraction_mock.return_value = (op, [])
+
+        m = Mock(side_effect=select_file)
+        output = io.StringIO()
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch('sys.stdout', output):
+                with unittest.mock.patch(
+                    'sys.argv',
+                    ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--explain']
+                ):
+                    return_value = main()
+
+        self.assertEqual(0, return_value)
+        extraction_mock.assert_called_once_with(yaml.safe_load(extraction_good_yaml), context, open_files=False)
+        op.explain.assert_called_once_with()
+        op.run.assert_not_called()
+        op.execute.assert_not_called()
+
+        lines = output.getvalue().splitlines()
+        self.assertIn('250,000', lines[1])
+        self.assertIn('Bulk API query with PK chunking', lines[1])
+        self.assertIn('?', lines[2])
+        self.assertTrue(lines[3].startswith('Total'))
+        self.assertIn('API requests: 14,000 of 15,000 remaining today; this operation will use at least 12.', lines)
+        self.assertIn('Bulk API batches: 9,990 of 10,000 remaining today; this operation will use at least 4.', lines)
+
+    @unittest.mock.patch('amaxa.__main__.loader.load_credentials')
+    @unittest.mock.patch('amaxa.__main__.loader.load_load_operation')
+    def test_main_rejects_explain_for_loads(self, load_mock, credential_mock):
+        m = Mock(side_effect=select_file)
+        with unittest.mock.patch('builtins.open', m):
+            with unittest.mock.patch(
+                'sys.argv',
+                ['amaxa', '-c', 'credentials-good.yaml', 'extraction-good.yaml', '--load', '--explain']
+            ):
+                return_value = main()
+
+        self.assertEqual(-1, return_value)
+        credential_mock.assert_not_called()
+        load_mock.assert_not_called()
@@ -1,19 +1,37 @@
 import unittest
+import io
+import csv
 import json
 from unittest.mock import Mock, MagicMock, PropertyMock, patch
-from functools import reduce
 from .. import amaxa
 
 class test_iterators(unittest.TestCase):
-    def test_JSONIterator(self):
-        records = ['Test', 'Test2']
+    def test_JSONArrayReader(self):
+        records = [
+            { 'Id': '001000000000000', 'Name': 'T\u00e9st "1"', 'Amount': 1.5, 'Parent': None },
+            { 'Id': '001000000000001', 'Name': 'Test 2', 'Amount': 12345678901234, 'Flags': [True, False] },
+            [],
+            -1e-05,
+            'string'
+        ]
+        data = json.dumps(records, ensure_ascii=False).encode('utf-8')
 
-        s = reduce(lambda x, y: x + y, amaxa.JSONIterator(records), b'')
+        for chunk_size in [1, 2, 7, 65536]:
+            self.assertEqual(records, list(amaxa.JSONArrayReader(io.BytesIO(data), chunk_size)))
 
-        self.assertEqual(
-            b'[' + b','.join([json.dumps(r).encode('utf-8') for r in records]) + b']',
-            s
-        )
+        self.assertEqual([], list(amaxa.JSONArrayReader(io.BytesIO(b' [ ] '))))
+
+    def test_JSONArrayReader_reads_incrementally(self):
+        data = io.BytesIO(json.dumps([{ 'Id': str(i) } for i in range(10000)]).encode('utf-8'))
+        reader = amaxa.JSONArrayReader(data, 1024)
+
+        self.assertEqual({ 'Id': '0' }, next(reader))
+        self.assertLessEqual(data.tell(), 2048)
+
+    def test_JSONArrayReader_raises_valueerror_for_bad_input(self):
+        for bad in [b'', b'{"Id": "001"}', b'[{"Id": "001"}', b'[1 2]']:
+            with self.assertRaises(ValueError):
+                list(amaxa.JSONArrayReader(io.BytesIO(bad)))
 
     def test_BatchIterator(self):
         l = iter(range(20001))
@@ -25,3 +43,45 @@ class test_iterators(unittest.TestCase):
 
         with self.assertRaises(StopIteration):
             next(b)
+
+    def test_read_rows_projects_csv_rows(self):
+        data = 'Id,Name,Extra,ParentId\n001000000000000,Caprica Steel,x,001000000000001\n\n001000000000001,Picon Fleet\n'
+        reader = csv.DictReader(io.StringIO(data))
+
+        (columns, rows) = amaxa.read_rows(reader, lambda column: column != 'Extra')
+
+        self.assertEqual(['Id', 'Name', 'ParentId'], columns)
+        self.assertEqual(
+            [
+                ('001000000000000', 'Caprica Steel', '001000000000001'),
+                ('001000000000001', 'Picon Fleet', None)
+            ],
+            list(rows)
+        )
+
+    def test_read_rows_matches_dict_reader(self):
+        data = 'Id,Name\n001000000000000,"Caprica Steel, Inc."\n\n001000000000001\n'
+        (columns, rows) = amaxa.read_rows(csv.DictReader(io.StringIO(data)), lambda column: True)
+
+        self.assertEqual(
+            list(csv.DictReader(io.StringIO(data))),
+            [dict(zip(columns, row)) for row in rows]
+        )
+
+    def test_read_rows_projects_records(self):
+        records = [
+            { 'Id': '001000000000000', 'Name': 'Caprica Steel', 'Extra': 'x' },
+            { 'Id': '001000000000001', 'Extra': 'y' }
+        ]
+
+        (columns, rows) = amaxa.read_rows(records, lambda column: column != 'Extra')
+
+        self.assertEqual(['Id', 'Name'], columns)
+        self.assertEqual([('001000000000000', 'Caprica Steel'), ('001000000000001', None)], list(rows))
+
+    def test_read_rows_handles_empty_input(self):
+        for reader in [[], csv.DictReader(io.StringIO(''))]:
+            (columns, rows) = amaxa.read_rows(reader, lambda column: True)
+
+            self.assertEqual([], columns)
+            self.assertEqual([], list(rows))
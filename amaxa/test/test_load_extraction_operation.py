@@ -236,6 +236,28 @@ class test_load_extraction_operation(unittest.TestCase):
         self.assertEqual('Task', result.steps[3].sobjectname)
         self.assertEqual(amaxa.ExtractionScope.QUERY, result.steps[3].scope)
 
+    def test_load_extraction_operation_does_not_open_files_if_requested(self):
+        context = amaxa.ExtractOperation(MockSimpleSalesforce())
+
+        ex = {
+            'version': 1,
+            'operation': [
+                { 
+                    'sobject': 'Account',
+                    'fields': [ 'Name' ],
+                    'extract': { 'all': True }
+                }
+            ]
+        }
+
+        m = unittest.mock.mock_open()
+        with unittest.mock.patch('builtins.open', m):
+            (result, errors) = loader.load_extraction_operation(ex, context, open_files=False)
+
+        self.assertEqual([], errors)
+        self.assertEqual(1, len(result.steps))
+        m.assert_not_called()
+
     @unittest.mock.patch('csv.DictWriter.writeheader')
     def test_load_extraction_operation_writes_correct_headers(self, dict_writer):
         context = amaxa.ExtractOperation(MockSimpleSalesforce())
@@ -401,6 +423,56 @@ class test_load_extraction_operation(unittest.TestCase):
 
         self.assertEqual({'Name', 'Industry', 'Id'}, result.steps[0].field_scope)
 
+    def test_load_extraction_operation_configures_pk_chunking(self):
+        context = amaxa.ExtractOperation(MockSimpleSalesforce())
+
+        ex = {
+            'version': 1,
+            'operation': [
+                { 
+                    'sobject': 'Account',
+                    'fields': [ 'Name' ],
+                    'extract': { 'all': True, 'pk-chunking': True }
+                },
+                { 
+                    'sobject': 'Contact',
+                    'fields': [ 'LastName' ],
+                    'extract': { 'query': 'LastName != null', 'pk-chunking': True, 'pk-chunk-size': 50000 }
+                },
+                { 
+                    'sobject': 'Opportunity',
+                    'fields': [ 'Name' ],
+                    'extract': { 'all': True }
+                }
+            ]
+        }
+
+        m = unittest.mock.mock_open()
+        with unittest.mock.patch('builtins.open', m):
+            (result, errors) = loader.load_extraction_operation(ex, context)
+
+        self.assertEqual([], errors)
+        self.assertEqual(amaxa.DEFAULT_PK_CHUNK_SIZE, result.steps[0].pk_chunk_size)
+        self.assertEqual(50000, result.steps[1].pk_chunk_size)
+        self.assertIsNone(result.steps[2].pk_chunk_size)
+
+    def test_validate_extraction_schema_rejects_pk_chunking_for_descendents(self):
+        (result, errors) = loader.validate_extraction_schema(
+            {
+                'version': 1,
+                'operation': [
+                    { 
+                        'sobject': 'Account',
+                        'fields': [ 'Name' ],
+                        'extract': { 'descendents': True, 'pk-chunking': True }
+                    }
+                ]
+            }
+        )
+
+        self.assertIsNone(result)
+        self.assertEqual(1, len(errors))
+
     def test_load_extraction_operation_creates_export_mapper(self):
         context = amaxa.ExtractOperation(MockSimpleSalesforce())
 
@@ -439,6 +511,11 @@ class test_load_extraction_operation(unittest.TestCase):
             mapper.transform_record({ 'Name': 'UNIversity of caprica  ', 'Industry': 'Education' })
         )
 
+        output = context.file_store.get_csv('Account', amaxa.FileType.OUTPUT)
+        self.assertIsInstance(output, amaxa.RecordWriter)
+        self.assertIs(mapper, output.mapper)
+        self.assertEqual(['Id', 'Account Name', 'Industry'], output.fieldnames)
+
     def test_load_extraction_operation_returns_error_base64_fields(self):
         context = amaxa.ExtractOperation(MockSimpleSalesforce())
 
@@ -51,6 +51,7 @@ class test_load_load_operation(unittest.TestCase):
         context = Mock()
         context.steps = []
         context.connection = MockSimpleSalesforce()
+        context.get_global_describe = context.connection.describe
 
         ex = { 
             'version': 1, 
@@ -0,0 +1,80 @@
+import unittest
+import re
+from urllib.parse import quote_plus
+from .. import amaxa
+
+class test_pack_id_queries(unittest.TestCase):
+    def get_ids(self, count, prefix='001'):
+        return [str(amaxa.SalesforceId(prefix + '{:012d}'.format(i))) for i in range(count)]
+
+    def get_field_ids(self, query):
+        return [
+            (field, re.findall(r'\'(\w+)\'', ids))
+            for (field, ids) in re.findall(r'(\w+) IN \(([^)]*)\)', query)
+        ]
+
+    def test_combines_fields_in_one_query(self):
+        queries = amaxa.pack_id_queries(
+            'SELECT Id FROM Contact',
+            [('AccountId', ['001000000000001AAA']), ('Household__c', ['001000000000002AAA', '001000000000003AAA'])]
+        )
+
+        self.assertEqual(
+            [
+                'SELECT Id FROM Contact WHERE AccountId IN (\'001000000000001AAA\') '
+                'OR Household__c IN (\'001000000000002AAA\', \'001000000000003AAA\')'
+            ],
+            queries
+        )
+
+    def test_packs_where_clause_to_limit(self):
+        ids = self.get_ids(1000)
+        queries = amaxa.pack_id_queries('SELECT Id FROM Contact', [('AccountId', ids), ('Household__c', ids[:10])])
+
+        packed = []
+        for (i, query) in enumerate(queries):
+            where = query[query.find('WHERE'):]
+            self.assertLessEqual(len(where), amaxa.MAX_WHERE_LENGTH)
+            if i < len(queries) - 1:
+                # Another Id wouldn't have fit.
+                self.assertGreater(len(where) + len(', \'{}\''.format(ids[0])), amaxa.MAX_WHERE_LENGTH)
+            packed.extend(self.get_field_ids(query))
+
+        self.assertEqual(ids, [id for (field, field_ids) in packed if field == 'AccountId' for id in field_ids])
+        self.assertEqual(ids[:10], [id for (field, field_ids) in packed if field == 'Household__c' for id in field_ids])
+
+    def test_packs_url_to_limit(self):
+        ids = self.get_ids(1000)
+        prefix = 'SELECT {} FROM Contact'.format(', '.join('Field{}__c'.format(i) for i in range(800)))
+        queries = amaxa.pack_id_queries(prefix, [('AccountId', ids)], max_url_length=16000)
+
+        for (i, query) in enumerate(queries):
+            self.assertLessEqual(len(quote_plus(query)), 16000)
+            if i < len(queries) - 1:
+                self.assertGreater(len(quote_plus(query + ', \'{}\''.format(ids[0]))), 16000)
+
+        self.assertEqual(ids, [id for query in queries for (field, field_ids) in self.get_field_ids(query) for id in field_ids])
+
+    def test_returns_no_queries_for_no_ids(self):
+        self.assertEqual([], amaxa.pack_id_queries('SELECT Id FROM Contact', [('AccountId', [])]))
+        self.assertEqual([], amaxa.pack_id_queries('SELECT Id FROM Contact', []))
+
+    def test_count_id_queries_matches_queries_built(self):
+        ids = self.get_ids(3000)
+        long_prefix = 'SELECT {} FROM Contact'.format(', '.join('Field{}__c'.format(i) for i in range(800)))
+        cases = [
+            ('SELECT Id FROM Contact', [('AccountId', 1)], None),
+            ('SELECT Id FROM Contact', [('AccountId', 3000), ('Household__c', 10)], None),
+            ('SELECT Id FROM Contact', [('AccountId', 181), ('Household__c', 181), ('Other__c', 1)], None),
+            ('SELECT Id FROM Contact', [('AccountId', 0), ('Household__c', 500)], None),
+            (long_prefix, [('AccountId', 3000), ('Household__c', 7)], 16000),
+            (long_prefix, [('AccountId', 1)], 100)
+        ]
+
+        for (prefix, field_counts, max_url_length) in cases:
+            self.assertEqual(
+                len(amaxa.pack_id_queries(prefix, [(field, ids[:count]) for (field, count) in field_counts], max_url_length=max_url_length)),
+                amaxa.count_id_queries(prefix, field_counts, max_url_length=max_url_length)
+            )
+
+        self.assertEqual(0, amaxa.count_id_queries('SELECT Id FROM Contact', []))
@@ -0,0 +1,89 @@
+import unittest
+import io
+import csv
+import threading
+from unittest.mock import Mock
+from .. import amaxa
+
+class test_PrefetchReader(unittest.TestCase):
+    def test_reads_all_chunks(self):
+        data = b''.join(str(i).encode('utf-8') for i in range(10000))
+        on_read = Mock()
+
+        reader = amaxa.PrefetchReader(io.BytesIO(data), on_read, chunk_size=1000, depth=2)
+        chunks = []
+        while True:
+            chunk = reader.read()
+            if not chunk:
+                break
+            chunks.append(chunk)
+        reader.close()
+
+        self.assertEqual(data, b''.join(chunks))
+        self.assertEqual(b'', reader.read())
+        self.assertEqual(len(data), sum(c[0][0] for c in on_read.call_args_list))
+
+    def test_raises_read_errors(self):
+        f = Mock()
+        f.read = Mock(side_effect=[b'[', IOError('connection reset')])
+
+        reader = amaxa.PrefetchReader(f)
+        self.assertEqual(b'[', reader.read())
+        with self.assertRaises(IOError):
+            reader.read()
+        reader.close()
+
+    def test_close_stops_reading(self):
+        f = Mock()
+        f.read = Mock(return_value=b'x' * 10)
+
+        reader = amaxa.PrefetchReader(f, depth=1)
+        reader.read()
+        reader.close()
+
+        self.assertFalse(reader.thread.is_alive())
+
+
+class test_PipelineWriter(unittest.TestCase):
+    def test_writes_rows_in_order(self):
+        output = io.StringIO()
+        dict_writer = csv.DictWriter(output, ['Id', 'Name'], lineterminator='\n')
+        on_write = Mock()
+
+        writer = amaxa.PipelineWriter(dict_writer, on_write=on_write, batch_size=7)
+        rows = [{ 'Id': str(i), 'Name': 'Account {}'.format(i) } for i in range(100)]
+        for row in rows:
+            writer.writerow(row)
+        writer.close()
+
+        self.assertEqual(rows, list(csv.DictReader(io.StringIO('Id,Name\n' + output.getvalue()))))
+        self.assertEqual(100, sum(c[0][0] for c in on_write.call_args_list))
+
+    def test_applies_transform_on_writer_thread(self):
+        output = io.StringIO()
+        dict_writer = csv.DictWriter(output, ['Name'], lineterminator='\n')
+        threads = []
+
+        def transform(row):
+            threads.append(threading.current_thread())
+            return { 'Name': row['Name'].upper() }
+
+        writer = amaxa.PipelineWriter(dict_writer, transform)
+        writer.writerow({ 'Name': 'Caprica Steel' })
+        writer.close()
+
+        self.assertEqual('CAPRICA STEEL\n', output.getvalue())
+        self.assertEqual([writer.thread], threads)
+
+    def test_raises_write_errors(self):
+        dict_writer = Mock()
+        dict_writer.writerows = Mock(side_effect=ValueError('dict contains fields not in fieldnames'))
+
+        writer = amaxa.PipelineWriter(dict_writer, batch_size=1)
+        writer.writerow({ 'Bad': 1 })
+        writer.thread.join(0.1)
+
+        with self.assertRaises(ValueError):
+            for i in range(100):
+                writer.writerow({ 'Bad': 1 })
+            writer.close()
@@ -0,0 +1,61 @@
+"""Benchmark amaxa.BulkResultConverter against the per-record, per-field loop it replaces.
+
+Converts the Date and DateTime columns of a chunk of Bulk API JSON query results
+for a wide object, and reports records converted per second.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bulk_conversion --count 200000 --datetime-fields 8
+"""
+import argparse
+import copy
+import gc
+import random
+import time
+from datetime import datetime, timedelta
+from amaxa import BulkResultConverter
+
+
+def legacy_convert(records, date_time_fields):
+    for rec in records:
+        for f in date_time_fields:
+            if rec[f] is not None:
+                rec[f] = (datetime.utcfromtimestamp(0) + timedelta(milliseconds=rec[f])).isoformat(timespec='milliseconds') + '+0000'
+
+    return records
+
+
+def measure(label, count, fn, records):
+    records = copy.deepcopy(records)
+    gc.collect()
+    start = time.perf_counter()
+    fn(records)
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12,.0f} records/sec'.format(label, count / elapsed))
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=200000)
+    a.add_argument('--datetime-fields', dest='datetime_fields', type=int, default=8)
+    args = a.parse_args()
+
+    rng = random.Random(0)
+    fields = ['DateTime{}__c'.format(i) for i in range(args.datetime_fields)]
+    field_map = { f: { 'name': f, 'type': 'datetime' } for f in fields }
+    field_map['Name'] = { 'name': 'Name', 'type': 'string' }
+
+    # Audit timestamps cluster within a few years.
+    start = 1420070400000
+    records = [
+        dict({ f: start + rng.randrange(5 * 365 * 86400000) for f in fields }, Name='Record {}'.format(i))
+        for i in range(args.count)
+    ]
+
+    measure('per-record loop', args.count, lambda r: legacy_convert(r, fields), records)
+    converter = BulkResultConverter(field_map, ['Name'] + fields)
+    measure('BulkResultConverter', args.count, converter.convert, records)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark the serialization of Bulk API batch payloads.
+
+Compares the JSONIterator generator that BatchSerializer replaced, consumed
+chunk by chunk as requests does, with BatchSerializer writing JSON through
+orjson (if it's installed) and the standard library, and writing CSV, over
+batches of 10,000 prepared records.
+Each BatchSerializer format is measured serializing whole batches and
+serializing records one at a time within a byte budget, as loads do.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bulk_payload --batches 20
+"""
+import argparse
+import json
+import time
+from unittest.mock import patch
+from amaxa import amaxa
+
+
+def get_records(count):
+    return [
+        {
+            'Name': 'Account {}'.format(i),
+            'AccountNumber': str(i),
+            'Description': 'Description of account {}, "quoted"'.format(i),
+            'Industry': 'Manufacturing',
+            'NumberOfEmployees': str(i % 5000),
+            'AnnualRevenue': '{}.50'.format(i),
+            'IsActive__c': 'true' if i % 2 else 'false',
+            'OwnerId': '005{:012d}AAA'.format(i // 100),
+            'ParentId': '001{:012d}AAA'.format(i - 1) if i > 0 else None
+        }
+        for i in range(count)
+    ]
+
+
+def JSONIterator(records):
+    def enc(r):
+        return json.dumps(r).encode('utf-8')
+
+    yield b'['
+
+    i = iter(records)
+    yield enc(next(i))
+    for rec in i:
+        yield b',' + enc(rec)
+
+    yield b']'
+
+
+def json_iterator(records):
+    size = 0
+    for chunk in JSONIterator(records):
+        size += len(chunk)
+    return size
+
+
+def serializer(content_type):
+    s = amaxa.BatchSerializer(content_type)
+    return lambda records: len(s.serialize(records))
+
+
+def budgeted(content_type):
+    s = amaxa.BatchSerializer(content_type)
+    return lambda records: sum(len(payload) for (keys, payload) in s.iter_batches(enumerate(records)))
+
+
+def measure(label, fn, records, batches):
+    start = time.perf_counter()
+    for i in range(batches):
+        size = fn(records)
+    elapsed = time.perf_counter() - start
+
+    print('{:<28} {:>8.2f} ms/batch {:>12,} bytes/batch {:>8.1f} MB/sec'.format(
+        label, elapsed / batches * 1000, size, size * batches / elapsed / 1e6
+    ))
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--batches', type=int, default=20)
+    a.add_argument('--batch-size', type=int, default=10000)
+    args = a.parse_args()
+
+    records = get_records(args.batch_size)
+
+    measure('JSONIterator', json_iterator, records, args.batches)
+    if amaxa.orjson is not None:
+        measure('BatchSerializer: orjson', serializer('JSON'), records, args.batches)
+        measure('  within byte budget', budgeted('JSON'), records, args.batches)
+    with patch.object(amaxa, 'orjson', None):
+        measure('BatchSerializer: json', serializer('JSON'), records, args.batches)
+        measure('  within byte budget', budgeted('JSON'), records, args.batches)
+    measure('BatchSerializer: CSV', serializer('CSV'), records, args.batches)
+    measure('  within byte budget', budgeted('CSV'), records, args.batches)
+
+
+if __name__ == '__main__':
+    main()
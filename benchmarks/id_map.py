@@ -0,0 +1,102 @@
+"""Benchmark amaxa.IdMap against the dict of SalesforceId -> SalesforceId it replaces.
+
+Reports retained memory per entry, bulk insert cost and lookup throughput, and
+the rate at which a LoadStep prepares records whose lookups are resolved
+through each map, as loads do.
+
+Run from the repository root:
+
+    $ python -m benchmarks.id_map --count 2000000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from amaxa import SalesforceId, IdMap
+from .load_transform import get_step, get_records
+
+
+def build_dict(pairs):
+    return { SalesforceId(k): SalesforceId(v) for (k, v) in pairs }
+
+
+def build_id_map(pairs):
+    id_map = IdMap()
+    id_map.update(pairs)
+    id_map.compact()
+    return id_map
+
+
+def measure(label, count, fn):
+    # Time the build on its own, since tracing allocations slows it, then build again to measure memory.
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{:<28} insert {:>8.2f} us/entry   retained {:>7.1f} bytes/entry   peak {:>7.1f} bytes/entry'.format(
+        label, elapsed / count * 1e6, current / count, peak / count
+    ))
+    return result
+
+
+def lookups(label, fn, keys):
+    gc.collect()
+    start = time.perf_counter()
+    fn(keys)
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12,.0f} lookups/sec'.format(label, len(keys) / elapsed))
+
+
+def prepare_records(label, step, id_map, records):
+    # Each record has two lookups to resolve through the map.
+    step.context.global_id_map = id_map
+    gc.collect()
+    start = time.perf_counter()
+    for record in records:
+        step.prepare_record(record)
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12,.0f} records/sec'.format(label, len(records) / elapsed))
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=2000000)
+    a.add_argument('--lookups', type=int, default=200000)
+    args = a.parse_args()
+
+    rng = random.Random(0)
+    old_ids = ['003{:012d}'.format(i) for i in range(args.count)]
+    rng.shuffle(old_ids)
+    pairs = [(old, 'a01' + old[3:]) for old in old_ids]
+
+    # Build the lookup keys before measuring memory so they aren't attributed to either map.
+    keys = SalesforceId.from_iterable(rng.sample(old_ids, min(args.lookups, args.count)))
+    del old_ids
+
+    # The loaded records look up Users and Accounts that are in the map.
+    step = get_step(0)
+    records = get_records(min(args.lookups, args.count))
+    pairs.extend(('005{:012d}'.format(i), '005{:011d}Z'.format(i)) for i in range(len(records) // 100 + 1))
+    pairs.extend((r['Id'], 'a01' + r['Id'][3:]) for r in records)
+
+    id_dict = measure('dict', len(pairs), lambda: build_dict(pairs))
+    lookups('dict: get', lambda k: [id_dict.get(i) for i in k], keys)
+    prepare_records('dict: prepare_record', step, id_dict, records)
+    del id_dict
+
+    id_map = measure('IdMap', len(pairs), lambda: build_id_map(pairs))
+    lookups('IdMap: get', lambda k: [id_map.get(i) for i in k], keys)
+    lookups('IdMap: get_many', id_map.get_many, keys)
+    prepare_records('IdMap: prepare_record', step, id_map, records)
+
+
+if __name__ == '__main__':
+    main()
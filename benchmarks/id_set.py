@@ -0,0 +1,102 @@
+"""Benchmark amaxa.IdSet against the set of SalesforceIds it replaces.
+
+Reports retained memory per Id, insert cost, membership throughput and the
+cost of the unions performed for each lookup pass. IdSets are measured both
+during a step, while added Ids are pending, and once compacted, as they are when
+the step finishes.
+
+Run from the repository root:
+
+    $ python -m benchmarks.id_set --count 2000000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from amaxa import SalesforceId, IdSet
+
+
+def build_set(ids):
+    return set(SalesforceId(i) for i in ids)
+
+
+def build_id_set(ids):
+    id_set = IdSet()
+    for i in ids:
+        id_set.add(i)
+    return id_set
+
+
+def build_compacted_id_set(ids):
+    id_set = build_id_set(ids)
+    id_set.compact()
+    return id_set
+
+
+def measure(label, count, fn):
+    # Time the build on its own, since tracing allocations slows it, then build again to measure memory.
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{:<28} insert {:>8.2f} us/Id   retained {:>7.1f} bytes/Id   peak {:>7.1f} bytes/Id'.format(
+        label, elapsed / count * 1e6, current / count, peak / count
+    ))
+    return result
+
+
+def lookups(label, id_set, keys):
+    gc.collect()
+    start = time.perf_counter()
+    for k in keys:
+        k in id_set
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12,.0f} lookups/sec'.format(label, len(keys) / elapsed))
+
+
+def union(label, count, fn):
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12.3f} sec ({:,.0f} Ids/sec)'.format(label, elapsed, count / elapsed))
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=2000000)
+    a.add_argument('--lookups', type=int, default=200000)
+    args = a.parse_args()
+
+    rng = random.Random(0)
+    ids = ['001{:012d}'.format(i) for i in range(args.count)]
+    rng.shuffle(ids)
+    # Build the lookup keys before measuring memory so they aren't attributed to either set.
+    keys = SalesforceId.from_iterable(rng.sample(ids, min(args.lookups, args.count)))
+    other_ids = ['003{:012d}'.format(i) for i in range(args.count)]
+
+    id_set = measure('set', args.count, lambda: build_set(ids))
+    lookups('set: in', id_set, keys)
+    other = build_set(other_ids)
+    union('set: union of two sObjects', args.count * 2, lambda: set() | id_set | other)
+    del id_set, other
+
+    id_set = measure('IdSet: during a step', args.count, lambda: build_id_set(ids))
+    lookups('IdSet: in, during a step', id_set, keys)
+    del id_set
+
+    id_set = measure('IdSet: compacted', args.count, lambda: build_compacted_id_set(ids))
+    lookups('IdSet: in, compacted', id_set, keys)
+    other = build_compacted_id_set(other_ids)
+    union('IdSet: union of two sObjects', args.count * 2, lambda: IdSet().union(id_set, other))
+
+if __name__ == '__main__':
+    main()
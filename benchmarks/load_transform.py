@@ -0,0 +1,133 @@
+"""Benchmark the preparation of input records for loading.
+
+Compares the per-record chain of transformations that LoadStep applied before
+it compiled a column plan (kept here as a local copy for comparison) with the
+compiled column plan applied by LoadStep.prepare_record(), over records with mapped and transformed columns,
+a Boolean, a lookup to resolve, and a self-lookup to defer.
+
+Run from the repository root:
+
+    $ python -m benchmarks.load_transform --count 200000
+"""
+import argparse
+import time
+from amaxa import amaxa, transforms
+
+
+FIELD_MAP = {
+    'Id': { 'soapType': 'tns:ID', 'type': 'id', 'referenceTo': [] },
+    'Name': { 'soapType': 'xsd:string', 'type': 'string', 'referenceTo': [] },
+    'AccountNumber': { 'soapType': 'xsd:string', 'type': 'string', 'referenceTo': [] },
+    'Description': { 'soapType': 'xsd:string', 'type': 'textarea', 'referenceTo': [] },
+    'Industry': { 'soapType': 'xsd:string', 'type': 'picklist', 'referenceTo': [] },
+    'NumberOfEmployees': { 'soapType': 'xsd:int', 'type': 'int', 'referenceTo': [] },
+    'AnnualRevenue': { 'soapType': 'xsd:double', 'type': 'currency', 'referenceTo': [] },
+    'IsActive__c': { 'soapType': 'xsd:boolean', 'type': 'boolean', 'referenceTo': [] },
+    'OwnerId': { 'soapType': 'tns:ID', 'type': 'reference', 'referenceTo': ['User'] },
+    'ParentId': { 'soapType': 'tns:ID', 'type': 'reference', 'referenceTo': ['Account'] }
+}
+
+
+def get_step(count):
+    op = amaxa.LoadOperation(None)
+    op.get_field_map = lambda sobjectname: FIELD_MAP
+    op.get_sobject_list = lambda: ['User', 'Account']
+    op.mappers['Account'] = amaxa.DataMapper(
+        { 'Account Name': 'Name', 'Active': 'IsActive__c' },
+        { 'Account Name': [transforms.strip], 'Industry': [transforms.uppercase] }
+    )
+    op.global_id_map.update(
+        ('005{:012d}'.format(i), '005{:011d}Z'.format(i)) for i in range(count // 100 + 1)
+    )
+
+    step = amaxa.LoadStep('Account', set(FIELD_MAP) - set(['Id']))
+    op.add_step(step)
+    step.initialize()
+
+    return step
+
+
+def get_records(count):
+    return [
+        {
+            'Id': '001{:012d}'.format(i),
+            'Account Name': ' Account {} '.format(i),
+            'AccountNumber': str(i),
+            'Description': 'Description of account {}'.format(i),
+            'Industry': 'Manufacturing',
+            'NumberOfEmployees': str(i % 5000),
+            'AnnualRevenue': '{}.50'.format(i),
+            'Active': 'yes' if i % 2 else 'no',
+            'OwnerId': '005{:012d}'.format(i // 100),
+            'ParentId': '001{:012d}'.format(i - 1) if i > 0 else ''
+        }
+        for i in range(count)
+    ]
+
+
+def transform_record(step, record):
+    if step.sobjectname in step.context.mappers:
+        record = step.context.mappers[step.sobjectname].transform_record(record)
+
+    return { k: record[k] for k in record if k in step.field_scope }
+
+
+def clean_dependent_lookups(step, record):
+    all_lookups = step.dependent_lookups | step.self_lookups
+
+    return { k: record[k] for k in record if k not in all_lookups }
+
+
+def populate_lookups(step, record, lookups, id):
+    return { k: record[k] if k not in lookups
+                          else step.get_value_for_lookup(k, record[k], id)
+             for k in record }
+
+
+def primitivize(step, record):
+    field_map = step.context.get_field_map(step.sobjectname)
+    return { k: step.get_value_converter(field_map[k]['soapType'])(record[k]) for k in record }
+
+
+def chained(step, records):
+    return [
+        primitivize(
+            step,
+            populate_lookups(
+                step,
+                clean_dependent_lookups(step, transform_record(step, record)),
+                step.descendent_lookups,
+                record['Id']
+            )
+        )
+        for record in records
+    ]
+
+
+def compiled(step, records):
+    return [step.prepare_record(record) for record in records]
+
+
+def measure(label, fn, step, records):
+    start = time.perf_counter()
+    result = fn(step, records)
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12,.0f} rows/sec'.format(label, len(records) / elapsed))
+    return result
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=200000)
+    args = a.parse_args()
+
+    step = get_step(args.count)
+    records = get_records(args.count)
+
+    expected = measure('chained transformations', chained, step, records)
+    result = measure('compiled column plan', compiled, step, records)
+    assert result == expected
+
+
+if __name__ == '__main__':
+    main()
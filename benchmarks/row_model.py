@@ -0,0 +1,138 @@
+"""Benchmark the row model used to read load input and write extracted records.
+
+On the load side, compares preparing records from a csv.DictReader with
+LoadStep.prepare_record() against reading projected rows with read_rows() and
+preparing them with LoadStep.prepare_row(), over an input file with columns
+outside the step's scope. On the extract side, compares writing mapped records
+with DataMapper.transform_record() and a csv.DictWriter against a RecordWriter
+that applies the mapper as it writes.
+
+Run from the repository root:
+
+    $ python -m benchmarks.row_model --count 200000
+"""
+import argparse
+import csv
+import gc
+import io
+import itertools
+import sys
+import time
+from amaxa import amaxa, transforms
+from .load_transform import FIELD_MAP, get_step, get_records
+
+
+def get_input(records):
+    # Add columns that aren't loaded, as exports from other systems often have.
+    f = io.StringIO()
+    columns = list(records[0]) + ['Legacy Key', 'Region', 'Notes', 'Created By']
+    writer = csv.DictWriter(f, columns, restval='x')
+    writer.writeheader()
+    writer.writerows(records)
+
+    return f.getvalue()
+
+
+def load_dicts(step, data):
+    return [step.prepare_record(record) for record in csv.DictReader(io.StringIO(data))]
+
+
+def load_rows(step, data):
+    plan = step.column_plan
+    (columns, rows) = amaxa.read_rows(csv.DictReader(io.StringIO(data)), lambda column: column == 'Id' or column in plan)
+    id_index = columns.index('Id')
+    row_plan = step.compile_row_plan(columns)
+
+    return [step.prepare_row(row, row_plan, row[id_index]) for row in rows]
+
+
+def get_mapper():
+    return amaxa.DataMapper(
+        { 'Name': 'Account Name', 'IsActive__c': 'Active' },
+        { 'Name': [transforms.strip], 'Industry': [transforms.lowercase] }
+    )
+
+
+def get_fieldnames(mapper):
+    return sorted((mapper.transform_key(f) for f in FIELD_MAP), key=lambda x: x if x != 'Id' else ' Id')
+
+
+def get_results(count):
+    return [
+        {
+            'attributes': { 'type': 'Account' },
+            'Id': '001{:012d}AAA'.format(i),
+            'Name': ' Account {} '.format(i),
+            'AccountNumber': str(i),
+            'Description': 'Description of account {}'.format(i),
+            'Industry': 'Manufacturing',
+            'NumberOfEmployees': i % 5000,
+            'AnnualRevenue': i + 0.5,
+            'IsActive__c': bool(i % 2),
+            'OwnerId': '005{:012d}AAA'.format(i // 100),
+            'ParentId': '001{:012d}AAA'.format(i - 1) if i > 0 else None
+        }
+        for i in range(count)
+    ]
+
+
+def write_dicts(mapper, results):
+    f = io.StringIO()
+    writer = csv.DictWriter(f, get_fieldnames(mapper), extrasaction='ignore')
+    for record in results:
+        writer.writerow(mapper.transform_record(record))
+
+    return f.getvalue()
+
+
+def write_rows(mapper, results):
+    f = io.StringIO()
+    writer = amaxa.RecordWriter(f, get_fieldnames(mapper), mapper=mapper)
+    for record in results:
+        writer.writerow(record)
+
+    return f.getvalue()
+
+
+def measure(label, fn, arg, data, count):
+    gc.collect()
+    start = time.perf_counter()
+    result = fn(arg, data)
+    elapsed = time.perf_counter() - start
+
+    print('{:<28} {:>12,.0f} rows/sec'.format(label, count / elapsed))
+    return result
+
+
+def row_sizes(step, data):
+    # The size of the intermediate object built for each input row, not counting the values it holds.
+    records = list(itertools.islice(csv.DictReader(io.StringIO(data)), 1000))
+    (columns, rows) = amaxa.read_rows(csv.DictReader(io.StringIO(data)), lambda column: column == 'Id' or column in step.column_plan)
+    rows = list(itertools.islice(rows, 1000))
+
+    print('{:<28} {:>12.1f} bytes/row'.format('load: DictReader dict', sum(sys.getsizeof(r) for r in records) / len(records)))
+    print('{:<28} {:>12.1f} bytes/row'.format('load: projected tuple', sum(sys.getsizeof(r) for r in rows) / len(rows)))
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=200000)
+    args = a.parse_args()
+
+    step = get_step(args.count)
+    data = get_input(get_records(args.count))
+    expected = measure('load: DictReader', load_dicts, step, data, args.count)
+    result = measure('load: projected rows', load_rows, step, data, args.count)
+    assert result == expected
+    del expected, result
+    row_sizes(step, data)
+
+    mapper = get_mapper()
+    results = get_results(args.count)
+    expected = measure('extract: DictWriter', write_dicts, mapper, results, args.count)
+    result = measure('extract: RecordWriter', write_rows, mapper, results, args.count)
+    assert result == expected
+
+
+if __name__ == '__main__':
+    main()
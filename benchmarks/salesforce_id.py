@@ -0,0 +1,99 @@
+"""Micro-benchmark for amaxa.SalesforceId.
+
+Reports per-Id construction and comparison cost and the memory retained per Id,
+compared against the previous dict-backed, loop-checksum implementation.
+
+Run from the repository root:
+
+    $ python -m benchmarks.salesforce_id --count 10000000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from amaxa import SalesforceId
+
+
+class LegacySalesforceId(object):
+    def __init__(self, idstr):
+        if isinstance(idstr, LegacySalesforceId):
+            self.id = idstr.id
+        else:
+            idstr = idstr.strip()
+            if len(idstr) == 15:
+                suffix = ''
+                for i in range(0, 3):
+                    baseTwo = 0
+                    for j in range (0, 5):
+                        character = idstr[i*5+j]
+                        if character >= 'A' and character <= 'Z':
+                            baseTwo += 1 << j
+                    suffix += 'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'[baseTwo]
+                self.id = idstr + suffix
+            elif len(idstr) == 18:
+                self.id = idstr
+            else:
+                raise ValueError('Salesforce Ids must be 15 or 18 characters.')
+
+    def __eq__(self, other):
+        if isinstance(other, LegacySalesforceId):
+            return self.id == other.id
+        elif isinstance(other, str):
+            return self.id == LegacySalesforceId(other).id
+
+        return False
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def make_ids(count):
+    # Mixed-case 15-character Ids, all distinct.
+    return ['001' + format(i, '012X').replace('A', 'a').replace('C', 'c') for i in range(count)]
+
+
+def timed(label, count, fn):
+    gc.collect()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print('{:<40} {:>10.1f} ns/Id'.format(label, elapsed / count * 1e9))
+    return result
+
+
+def retained_bytes(fn):
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    a = argparse.ArgumentParser()
+    a.add_argument('--count', type=int, default=10000000)
+    args = a.parse_args()
+
+    strings = make_ids(args.count)
+    sample = strings[:min(args.count, 1000000)]
+
+    legacy = timed('legacy: construct from 15 chars', len(sample), lambda: [LegacySalesforceId(s) for s in sample])
+    current = timed('current: construct from 15 chars', len(sample), lambda: [SalesforceId(s) for s in sample])
+    timed('current: from_iterable', len(sample), lambda: SalesforceId.from_iterable(sample))
+
+    timed('legacy: __eq__ with 15-char str', len(sample), lambda: [i == s for i, s in zip(legacy, sample)])
+    timed('current: __eq__ with 15-char str', len(sample), lambda: [i == s for i, s in zip(current, sample)])
+    del legacy, current
+
+    _, legacy_bytes = retained_bytes(lambda: [LegacySalesforceId(s) for s in strings])
+    gc.collect()
+    _, current_bytes = retained_bytes(lambda: SalesforceId.from_iterable(strings))
+    gc.collect()
+
+    print('{:<40} {:>10.1f} bytes/Id'.format('legacy: retained at {:,} Ids'.format(args.count), legacy_bytes / args.count))
+    print('{:<40} {:>10.1f} bytes/Id'.format('current: retained at {:,} Ids'.format(args.count), current_bytes / args.count))
+
+
+if __name__ == '__main__':
+    main()